@@ -1,11 +1,14 @@
 import time
+import queue
+import signal
+from datetime import timedelta
+from functools import partial
 import pandas as pd
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from sqlalchemy import create_engine, text
 import os
 
+from despachante_email import DespachanteEmail
+
 # ======================================================
 # CONFIGU
 # ======================================================
@@ -16,31 +19,37 @@ EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 EMAIL_FROM = os.getenv("EMAIL_FROM")
+EMAIL_STARTTLS = os.getenv("EMAIL_STARTTLS", "1") != "0"
+
+INTERVALO_SEGUNDOS = 60
+
+# Releitura abaixo do watermark. A garantia vem do horizonte (ver
+# `buscar_horizonte`); a margem só cobre diferença de relógio entre o
+# atualizado_em gravado e o xact_start do writer
+MARGEM_WATERMARK = timedelta(minutes=2)
 
 engine = create_engine(DATABASE_URL)
 
 # ======================================================
-# FUNÇÃO EMAIL
+# E-MAIL (digest por contato, enviado pelo DespachanteEmail)
 # ======================================================
-def enviar_email(destinatario, assunto, mensagem):
-
-    try:
-        msg = MIMEMultipart()
-        msg["From"] = EMAIL_FROM
-        msg["To"] = destinatario
-        msg["Subject"] = assunto
-        msg.attach(MIMEText(mensagem, "plain"))
-
-        servidor = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
-        servidor.starttls()
-        servidor.login(EMAIL_USER, EMAIL_PASSWORD)
-        servidor.send_message(msg)
-        servidor.quit()
-
-        print("Email enviado para", destinatario)
+def montar_digest(itens):
+    """(assunto, corpo) de uma mensagem com todos os alertas de um contato no ciclo."""
+    if len(itens) == 1:
+        device_name, nivel_tarp, status = itens[0]
+        assunto = f"🚨 ALERTA ORION - {device_name}"
+    else:
+        assunto = f"🚨 ALERTA ORION - {len(itens)} dispositivos"
 
-    except Exception as e:
-        print("Erro envio:", e)
+    blocos = [
+        f"""Dispositivo: {device_name}
+Status TARP: {nivel_tarp}
+Status Equipamento: {status}
+"""
+        for device_name, nivel_tarp, status in itens
+    ]
+    mensagem = "\n" + "\n".join(blocos) + "\nVerifique imediatamente no Orion.\n"
+    return assunto, mensagem
 
 # ======================================================
 # CLASSIFICADOR TARP
@@ -57,135 +66,330 @@ def classificar_tarp(valor):
         return "Verde"
 
 # ======================================================
-# LOOP PRINCIPAL
+# WATERMARK (alert_engine_estado)
 # ======================================================
-print("🚨 Alert Engine iniciado...")
-
-while True:
+def carregar_watermark():
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT valor FROM alert_engine_estado WHERE chave = 'watermark'")
+        ).scalar()
+
+def salvar_watermark(valor):
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO alert_engine_estado (chave, valor)
+                VALUES ('watermark', :valor)
+                ON CONFLICT (chave) DO UPDATE SET valor = :valor
+            """),
+            {"valor": valor}
+        )
 
-    try:
+def buscar_horizonte():
+    """
+    Teto do watermark: início da transação de escrita mais antiga ainda
+    aberta (ou agora). Uma linha só fica visível no commit, com um
+    atualizado_em de antes dele; sem o teto, um flush longo que commita
+    depois de um mais curto ficaria abaixo do watermark. Consultado antes
+    das leituras. Os writers usam o mesmo usuário do banco, então o
+    xact_start deles aparece em pg_stat_activity.
+    """
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT LEAST(
+                clock_timestamp(),
+                (SELECT min(xact_start) FROM pg_stat_activity
+                 WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid())
+            )
+        """)).scalar()
 
-        # 🔎 BUSCAR ÚLTIMAS LEITURAS
-        df = pd.read_sql("""
-            SELECT 
-                l.data_leitura,
-                l.valor_sensor,
+# ======================================================
+# LEITURAS NOVAS E DEVICES
+# ======================================================
+def buscar_leituras(desde=None):
+    """Última leitura de cada sensor A/B (leituras_ultimas) alterada depois de `desde`."""
+    filtro = "AND u.atualizado_em > :desde" if desde is not None else ""
+    return pd.read_sql(
+        text(f"""
+            SELECT
+                u.sensor_id,
+                u.data_leitura,
+                u.valor_sensor,
+                u.atualizado_em,
                 s.tipo_sensor,
-                s.device_id,
-                d.device_name,
-                d.status
-            FROM leituras l
-            JOIN sensores s ON l.sensor_id = s.sensor_id
-            JOIN devices d ON s.device_id = d.device_id
+                s.device_id
+            FROM leituras_ultimas u
+            JOIN sensores s ON u.sensor_id = s.sensor_id
             WHERE s.tipo_sensor IN ('A-Axis Delta Angle','B-Axis Delta Angle')
-        """, engine)
-
-        if df.empty:
-            print("Sem dados...")
-            time.sleep(60)
-            continue
-
-        # 🔥 PEGAR ÚLTIMO VALOR DE CADA EIXO
-        ultimo = (
-            df.sort_values("data_leitura")
-            .groupby(["device_id","tipo_sensor"])
-            .last()
-            .reset_index()
+            {filtro}
+        """),
+        engine,
+        params={"desde": desde}
+    )
+
+def buscar_devices():
+    return pd.read_sql("SELECT device_id, device_name, status FROM devices", engine)
+
+# ======================================================
+# ESTADO ENTRE CICLOS
+# ======================================================
+class EstadoAlertas:
+    """
+    Estado por device mantido entre ciclos: último valor de cada eixo,
+    nome e status. Cada ciclo aplica só o que mudou; os devices afetados
+    ficam em `pendentes` até serem avaliados (um ciclo que falha no meio
+    não os perde).
+
+    `em_envio` e `reavaliar` são tocados também pela thread do
+    despachante (ver `concluir_envio`).
+    """
+
+    def __init__(self):
+        self.eixos     = {}      # device_id → {tipo_sensor: (data_leitura, valor)}
+        self.vistos    = {}      # sensor_id → data_leitura já aplicada
+        self.devices   = {}      # device_id → (device_name, status)
+        self.pendentes = set()
+        self.em_envio  = {}      # device_id → (tarp, status) na fila, ainda sem entrega
+        self.reavaliar = queue.SimpleQueue()   # devices com digest não entregue
+
+    def aplicar_leituras(self, df):
+        for r in df.itertuples(index=False):
+            if self.vistos.get(r.sensor_id) == r.data_leitura:
+                continue   # releitura da margem do watermark
+            self.vistos[r.sensor_id] = r.data_leitura
+
+            eixos = self.eixos.setdefault(r.device_id, {})
+            atual = eixos.get(r.tipo_sensor)
+            if atual is None or r.data_leitura >= atual[0]:
+                eixos[r.tipo_sensor] = (r.data_leitura, r.valor_sensor)
+            self.pendentes.add(r.device_id)
+
+    def aplicar_devices(self, df):
+        """Atualiza nome/status; marca os devices cujo status mudou desde o ciclo anterior."""
+        for r in df.itertuples(index=False):
+            status = str(r.status).lower()
+            anterior = self.devices.get(r.device_id)
+            if anterior is not None and anterior[1] != status:
+                self.pendentes.add(r.device_id)
+            self.devices[r.device_id] = (r.device_name, status)
+
+    def maior_valor(self, device_id):
+        valores = [abs(v) for _, v in self.eixos[device_id].values() if pd.notna(v)]
+        return max(valores) if valores else 0
+
+# ======================================================
+# ESTADO DE ALERTA E CONTATOS (carga única por ciclo)
+# ======================================================
+def carregar_status_log():
+    """{device_id: (ultimo_tarp, ultimo_status)} de todo o alert_status_log."""
+    df = pd.read_sql("SELECT device_id, ultimo_tarp, ultimo_status FROM alert_status_log", engine)
+    return {r.device_id: (r.ultimo_tarp, r.ultimo_status) for r in df.itertuples(index=False)}
+
+def carregar_contatos():
+    """{device_id: [email, ...]} dos contatos com receber_email."""
+    df = pd.read_sql("SELECT device_id, email FROM alert_contacts WHERE receber_email = true", engine)
+    contatos = {}
+    for r in df.itertuples(index=False):
+        contatos.setdefault(r.device_id, []).append(r.email)
+    return contatos
+
+def salvar_status(estados):
+    """Grava todos os estados enviados do ciclo num único upsert multi-linha."""
+    if not estados:
+        return
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO alert_status_log
+                (device_id, ultimo_tarp, ultimo_status, ultima_atualizacao)
+                SELECT device_id, tarp, status, now()
+                FROM unnest(CAST(:device_ids AS BIGINT[]), CAST(:tarps AS TEXT[]), CAST(:status AS TEXT[]))
+                     AS e(device_id, tarp, status)
+                ON CONFLICT (device_id)
+                DO UPDATE SET
+                    ultimo_tarp = EXCLUDED.ultimo_tarp,
+                    ultimo_status = EXCLUDED.ultimo_status,
+                    ultima_atualizacao = now()
+            """),
+            {
+                "device_ids": [int(d) for d, _, _ in estados],
+                "tarps": [t for _, t, _ in estados],
+                "status": [st for _, _, st in estados]
+            }
         )
 
-        for device_id, grupo in ultimo.groupby("device_id"):
+# ======================================================
+# AVALIAÇÃO DE UM DEVICE
+# ======================================================
+def avaliar_device(device_id, device_name, status, nivel_tarp, status_log, contatos, por_contato):
+    """
+    Se preciso, junta o alerta ao digest de cada contato (`por_contato`)
+    e devolve o estado a gravar em alert_status_log; senão, None.
+    """
 
-            maior_valor = grupo["valor_sensor"].abs().max()
-            nivel_tarp = classificar_tarp(maior_valor)
+    print(device_name, nivel_tarp, status)
 
-            device_name = grupo.iloc[0]["device_name"]
-            status = str(grupo.iloc[0]["status"]).lower()
+    # ======================================================
+    # 🔥 ANTI-SPAM INTELIGENTE (NOVO)
+    # ======================================================
+    ultimo_tarp_enviado, ultimo_status_enviado = status_log.get(device_id, (None, None))
 
-            print(device_name, nivel_tarp, status)
+    precisa_enviar = False
 
-            # ======================================================
-            # 🔥 ANTI-SPAM INTELIGENTE (NOVO)
-            # ======================================================
+    # 🚨 mudou para vermelho?
+    if nivel_tarp == "Vermelho" and ultimo_tarp_enviado != "Vermelho":
+        precisa_enviar = True
 
-            estado_anterior = pd.read_sql(
-                text("""
-                    SELECT *
-                    FROM alert_status_log
-                    WHERE device_id = :device_id
-                """),
-                engine,
-                params={"device_id": int(device_id)}
-            )
+    # 🚨 mudou para offline?
+    if status == "offline" and ultimo_status_enviado != "offline":
+        precisa_enviar = True
 
-            ultimo_tarp_enviado = None
-            ultimo_status_enviado = None
+    if not precisa_enviar:
+        return None
 
-            if not estado_anterior.empty:
-                ultimo_tarp_enviado = estado_anterior.iloc[0]["ultimo_tarp"]
-                ultimo_status_enviado = estado_anterior.iloc[0]["ultimo_status"]
+    # ======================================================
+    # 🚨 ENVIO CONTROLADO (um digest por contato no fim do ciclo)
+    # ======================================================
+    for email in contatos.get(device_id, []):
+        por_contato.setdefault(email, []).append((device_name, nivel_tarp, status))
 
-            precisa_enviar = False
+    # 🔥 ESTADO ENVIADO (gravado em lote quando o despachante entregar)
+    status_log[device_id] = (nivel_tarp, status)
+    return (device_id, nivel_tarp, status)
 
-            # 🚨 mudou para vermelho?
-            if nivel_tarp == "Vermelho" and ultimo_tarp_enviado != "Vermelho":
-                precisa_enviar = True
+# ======================================================
+# CICLO
+# ======================================================
+def _maximo(watermark, df, horizonte):
+    if df.empty:
+        return watermark
+    novo = min(df["atualizado_em"].max().to_pydatetime(), horizonte)
+    return novo if watermark is None else max(watermark, novo)
+
+def iniciar_estado():
+    """
+    Carrega o estado completo (uma linha por sensor, não o histórico).
+    Todos os devices ficam pendentes: um digest que estava na fila quando
+    o engine parou não teve o estado gravado, e só reavaliando tudo (já
+    em memória, comparado com alert_status_log) ele é enviado de novo.
+    """
+    estado    = EstadoAlertas()
+    watermark = carregar_watermark()
+
+    horizonte = buscar_horizonte()
+    df = buscar_leituras()
+    estado.aplicar_leituras(df)
+    estado.aplicar_devices(buscar_devices())
+
+    return estado, _maximo(watermark, df, horizonte)
+
+def concluir_envio(estado, estados, destinos, falhas):
+    """
+    Retorno do despachante (thread de envio) para os digests de um
+    ciclo: grava em alert_status_log os estados cujos contatos receberam
+    tudo e devolve os outros para `reavaliar`. Um device com um contato
+    sem entrega é reenviado a todos os contatos dele.
+    """
+    entregues = [e for e in estados if not destinos[e[0]] & falhas]
+    try:
+        salvar_status(entregues)
+    except Exception as e:
+        print("Erro ao gravar alert_status_log:", e)
+
+    for device_id, nivel_tarp, status in estados:
+        if estado.em_envio.get(device_id) == (nivel_tarp, status):
+            del estado.em_envio[device_id]
+        if destinos[device_id] & falhas:
+            estado.reavaliar.put(device_id)
+
+def executar_ciclo(estado, watermark, despachante):
+    """
+    Aplica o que mudou desde `watermark`, avalia os devices pendentes,
+    entrega os digests ao `despachante` (sem esperar o SMTP) e devolve
+    o novo watermark. O estado enviado só é gravado quando o despachante
+    confirma a entrega (`concluir_envio`).
+    """
+    while not estado.reavaliar.empty():
+        estado.pendentes.add(estado.reavaliar.get())
+
+    desde = watermark - MARGEM_WATERMARK if watermark is not None else None
+    horizonte = buscar_horizonte()
+    df = buscar_leituras(desde)
+    estado.aplicar_leituras(df)
+    estado.aplicar_devices(buscar_devices())
+
+    # Só devices com eixo A/B lido são avaliados
+    avaliar = sorted(d for d in estado.pendentes if d in estado.eixos)
+    estados = []
+    por_contato = {}
+    if avaliar:
+        status_log = carregar_status_log()
+        # Alertas ainda na fila contam como enviados, senão o ciclo seguinte os repetiria
+        status_log.update(estado.em_envio.copy())
+        contatos = carregar_contatos()
+        for device_id in avaliar:
+            device_name, status = estado.devices.get(device_id, (str(device_id), "desconhecido"))
+            nivel_tarp = classificar_tarp(estado.maior_valor(device_id))
+            novo = avaliar_device(device_id, device_name, status, nivel_tarp, status_log, contatos, por_contato)
+            if novo:
+                estados.append(novo)
+                estado.em_envio[device_id] = novo[1:]
+        destinos = {d: set(contatos.get(d, [])) for d, _, _ in estados}
+        despachante.enviar_digests(
+            por_contato, montar_digest,
+            ao_concluir=partial(concluir_envio, estado, estados, destinos)
+        )
+    estado.pendentes.clear()
 
-            # 🚨 mudou para offline?
-            if status == "offline" and ultimo_status_enviado != "offline":
-                precisa_enviar = True
+    # O watermark só é gravado depois que o ciclo avaliou tudo, e nunca
+    # passa do início de uma escrita que ainda não tinha commitado
+    watermark = _maximo(watermark, df, horizonte)
+    if watermark is not None:
+        salvar_watermark(watermark)
 
-            # ======================================================
-            # 🚨 ENVIO CONTROLADO
-            # ======================================================
-            if precisa_enviar:
+    print(
+        f"🔁 {len(df)} leituras novas | {len(avaliar)} devices avaliados | {len(estados)} alertas | "
+        f"{len(por_contato)} e-mails na fila ({despachante.pendentes} aguardando)"
+    )
+    return watermark
 
-                contatos = pd.read_sql(
-                    text("""
-                        SELECT *
-                        FROM alert_contacts
-                        WHERE device_id = :device_id
-                        AND receber_email = true
-                    """),
-                    engine,
-                    params={"device_id": int(device_id)}
-                )
+# ======================================================
+# LOOP PRINCIPAL
+# ======================================================
+if __name__ == "__main__":
 
-                for _, contato in contatos.iterrows():
+    print("🚨 Alert Engine iniciado...")
 
-                    assunto = f"🚨 ALERTA ORION - {device_name}"
+    despachante = DespachanteEmail(
+        EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD, EMAIL_FROM,
+        starttls=EMAIL_STARTTLS
+    )
 
-                    mensagem = f"""
-Dispositivo: {device_name}
-Status TARP: {nivel_tarp}
-Status Equipamento: {status}
+    # SIGTERM (fim do container, job cancelado) sai pelo mesmo caminho do
+    # Ctrl+C: o despachante entrega a fila antes de o processo terminar
+    def encerrar(sinal, frame):
+        raise KeyboardInterrupt
 
-Verifique imediatamente no Orion.
-"""
+    signal.signal(signal.SIGTERM, encerrar)
 
-                    enviar_email(contato["email"], assunto, mensagem)
-
-                # 🔥 SALVAR ESTADO ENVIADO
-                with engine.begin() as conn:
-                    conn.execute(
-                        text("""
-                            INSERT INTO alert_status_log
-                            (device_id, ultimo_tarp, ultimo_status, ultima_atualizacao)
-                            VALUES (:device_id, :tarp, :status, now())
-                            ON CONFLICT (device_id)
-                            DO UPDATE SET
-                                ultimo_tarp = :tarp,
-                                ultimo_status = :status,
-                                ultima_atualizacao = now()
-                        """),
-                        {
-                            "device_id": int(device_id),
-                            "tarp": nivel_tarp,
-                            "status": status
-                        }
-                    )
+    estado = None
+    watermark = None
 
-    except Exception as e:
-        print("Erro loop:", e)
+    try:
+        while True:
+
+            try:
+                if estado is None:
+                    estado, watermark = iniciar_estado()
+
+                watermark = executar_ciclo(estado, watermark, despachante)
+
+            except Exception as e:
+                print("Erro loop:", e)
+
+            # ⏱ espera 60 segundos
+            time.sleep(INTERVALO_SEGUNDOS)
 
-    # ⏱ espera 60 segundos
-    time.sleep(60)
+    except KeyboardInterrupt:
+        print(f"👋 Encerrando ({despachante.pendentes} e-mails na fila)...")
+        despachante.fechar(timeout=60)
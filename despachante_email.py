@@ -0,0 +1,218 @@
+"""
+Envio assíncrono de e-mails de alerta.
+
+Quem chama só enfileira (`enfileirar` / `enviar_digests`) e segue; uma
+thread de fundo envia por UMA sessão SMTP autenticada, reaproveitada
+entre mensagens, e a fecha depois de um tempo ociosa. Falha temporária
+(conexão caída, 4xx) reconecta e tenta de novo com backoff exponencial;
+falha permanente (5xx) descarta a mensagem e segue a fila.
+
+`enviar_digests(..., ao_concluir=)` avisa, na thread de envio, quando
+todas as mensagens do lote foram tratadas, com os destinatários que
+ficaram sem entrega por falha temporária — quem chama só grava como
+"enviado" o que foi entregue e pode repetir o resto.
+
+Para testar sem servidor real: tools/smtp_local.py (usado por
+tests/test_despachante_email.py).
+"""
+import queue
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+TENTATIVAS      = 5
+BACKOFF_INICIAL = 2.0     # segundos; dobra a cada tentativa
+BACKOFF_MAXIMO  = 60.0
+OCIOSO_SEGUNDOS = 120     # sessão sem uso por mais que isso é fechada
+TIMEOUT_SMTP    = 30
+
+_FIM = object()
+
+class _Lote:
+    """Mensagens de um `enviar_digests`; só a thread de envio o altera."""
+
+    def __init__(self, ao_concluir, restantes: int):
+        self.ao_concluir = ao_concluir
+        self.restantes   = restantes
+        self.falhas      = set()
+
+# ======================================================
+# DESPACHANTE
+# ======================================================
+
+class DespachanteEmail:
+    """Fila de e-mails com um worker e uma sessão SMTP reaproveitada (ver docstring do módulo)."""
+
+    def __init__(self, host, porta, usuario=None, senha=None, remetente=None,
+                 starttls: bool = True, tentativas: int = TENTATIVAS,
+                 backoff_inicial: float = BACKOFF_INICIAL, ocioso: float = OCIOSO_SEGUNDOS):
+        self.host            = host
+        self.porta           = porta
+        self.usuario         = usuario
+        self.senha           = senha
+        self.remetente       = remetente
+        self.starttls        = starttls
+        self.tentativas      = tentativas
+        self.backoff_inicial = backoff_inicial
+        self.ocioso          = ocioso
+
+        self._fila   = queue.Queue()
+        self._sessao = None
+
+        self.enviadas    = 0
+        self.descartadas = 0
+        self.conexoes    = 0
+
+        self._thread = threading.Thread(target=self._worker, name="despachante-email", daemon=True)
+        self._thread.start()
+
+    # --------------------------------------------------
+    # API
+    # --------------------------------------------------
+
+    def enfileirar(self, destinatario, assunto, corpo, lote=None):
+        """Agenda uma mensagem. Nunca bloqueia em SMTP."""
+        self._fila.put((destinatario, assunto, corpo, lote))
+
+    def enviar_digests(self, por_contato: dict, montar, ao_concluir=None):
+        """
+        Uma mensagem por contato com tudo o que ele recebe no ciclo:
+        `por_contato` = {email: [item, ...]}, `montar(itens)` → (assunto, corpo).
+        `ao_concluir(falhas)` roda depois da última delas, com o conjunto
+        de e-mails que desistiram por falha temporária (na hora, se não
+        houver mensagem).
+        """
+        destinos = [(d, itens) for d, itens in por_contato.items() if itens]
+        lote = _Lote(ao_concluir, len(destinos)) if ao_concluir else None
+        for destinatario, itens in destinos:
+            assunto, corpo = montar(itens)
+            self.enfileirar(destinatario, assunto, corpo, lote)
+        if lote and not destinos:
+            self._concluir(lote)
+
+    @property
+    def pendentes(self) -> int:
+        return self._fila.qsize()
+
+    def fechar(self, timeout: float = None):
+        """Envia o que está na fila, encerra a sessão e espera a thread (até `timeout`)."""
+        self._fila.put(_FIM)
+        self._thread.join(timeout)
+
+    # --------------------------------------------------
+    # SESSÃO SMTP
+    # --------------------------------------------------
+
+    def _conectar(self):
+        sessao = smtplib.SMTP(self.host, self.porta, timeout=TIMEOUT_SMTP)
+        try:
+            sessao.ehlo()
+            if self.starttls:
+                sessao.starttls()
+                sessao.ehlo()
+            if self.usuario:
+                sessao.login(self.usuario, self.senha)
+        except BaseException:
+            sessao.close()   # sem isso o socket vaza a cada tentativa
+            raise
+        self.conexoes += 1
+        return sessao
+
+    def _encerrar(self):
+        if self._sessao is None:
+            return
+        try:
+            self._sessao.quit()
+        except (smtplib.SMTPException, OSError):
+            self._sessao.close()
+        self._sessao = None
+
+    # --------------------------------------------------
+    # WORKER
+    # --------------------------------------------------
+
+    def _worker(self):
+        while True:
+            try:
+                item = self._fila.get(timeout=self.ocioso)
+            except queue.Empty:
+                self._encerrar()   # servidores derrubam sessões ociosas; melhor sair antes
+                continue
+
+            if item is _FIM:
+                self._encerrar()
+                return
+
+            destinatario, assunto, corpo, lote = item
+            concluida = self._enviar(destinatario, assunto, corpo)
+            if lote is not None:
+                if not concluida:
+                    lote.falhas.add(destinatario)
+                lote.restantes -= 1
+                if not lote.restantes:
+                    self._concluir(lote)
+
+    def _concluir(self, lote):
+        try:
+            lote.ao_concluir(lote.falhas)
+        except Exception as e:
+            print(f"Erro no retorno do lote de e-mails: {e}")
+
+    def _enviar(self, destinatario, assunto, corpo) -> bool:
+        """False só se desistiu por falha temporária (repetir depois pode dar certo)."""
+        msg = MIMEMultipart()
+        msg["From"] = self.remetente
+        msg["To"] = destinatario
+        msg["Subject"] = assunto
+        msg.attach(MIMEText(corpo, "plain"))
+
+        espera = self.backoff_inicial
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                if self._sessao is None:
+                    self._sessao = self._conectar()
+                self._sessao.send_message(msg)
+                self.enviadas += 1
+                print("Email enviado para", destinatario)
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                self.descartadas += 1
+                print(f"Erro envio (destinatário recusado) para {destinatario}: {e.recipients}")
+                self._reiniciar_transacao()
+                return True
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500:
+                    # Permanente (destinatário/conteúdo recusado): repetir não adianta
+                    self.descartadas += 1
+                    print(f"Erro envio (permanente {e.smtp_code}) para {destinatario}: {e.smtp_error!r}")
+                    self._reiniciar_transacao()
+                    return True
+                erro = e
+            except (smtplib.SMTPException, OSError) as e:
+                erro = e
+
+            # Temporária: sessão nova na próxima tentativa
+            self._encerrar()
+            if tentativa < self.tentativas:
+                print(f"Erro envio para {destinatario} (tentativa {tentativa}/{self.tentativas}): {erro}; nova tentativa em {espera:.0f}s")
+                time.sleep(espera)
+                espera = min(espera * 2, BACKOFF_MAXIMO)
+
+        self.descartadas += 1
+        print(f"Erro envio: desistindo de {destinatario} após {self.tentativas} tentativas: {erro}")
+        return False
+
+    def _reiniciar_transacao(self):
+        # Depois de uma recusa a sessão continua válida, mas a transação precisa de RSET
+        if self._sessao is None:
+            return
+        try:
+            self._sessao.rset()
+        except (smtplib.SMTPException, OSError):
+            self._encerrar()
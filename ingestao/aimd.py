@@ -0,0 +1,142 @@
+import asyncio
+import threading
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+JANELA_DECISAO = 20      # respostas observadas entre duas decisões
+LIMITE_ERROS   = 0.02    # fração de 429/5xx/falhas acima da qual recua
+LATENCIA_ALVO  = 10.0    # p90 (s) acima do qual recua
+FATOR_RECUO    = 0.5     # corte multiplicativo
+PASSO_CONC     = 1       # aumento aditivo de concorrência
+PASSO_PAGE     = 100     # aumento aditivo de page size
+
+STATUS_PUSHBACK = {0, 429, 500, 502, 503, 504}   # 0 = timeout / erro de conexão
+
+# ======================================================
+# CONTROLADOR AIMD
+# ======================================================
+
+class ControladorAIMD:
+    """
+    Ajusta concorrência e page size das chamadas à API pelo feedback
+    das próprias respostas (additive increase / multiplicative decrease).
+
+    Cada resposta é registrada com `registrar(latencia, status)`. A cada
+    JANELA_DECISAO respostas:
+    - se a fração de 429/5xx/falhas passar de LIMITE_ERROS, ou o p90 da
+      latência passar de LATENCIA_ALVO → concorrência e page size caem
+      pela metade (respeitando os mínimos)
+    - senão → sobem PASSO_CONC e PASSO_PAGE (respeitando os máximos)
+
+    Os workers limitam as requests em voo com `adquirir`/`liberar`
+    (threads) ou `adquirir_async`/`liberar_async` (asyncio) e leem
+    `page_size` a cada página.
+    """
+
+    def __init__(self, concorrencia, page_size, conc_min=1, conc_max=16,
+                 page_min=100, page_max=5000, nome="api"):
+        self.concorrencia = concorrencia
+        self.page_size    = page_size
+        self.conc_min     = conc_min
+        self.conc_max     = conc_max
+        self.page_min     = page_min
+        self.page_max     = page_max
+        self.nome         = nome
+
+        self._lock       = threading.Condition()
+        self._cond_async = None   # asyncio.Condition do event loop atual
+        self._loop_async = None
+        self._em_voo     = 0
+        self._latencias  = []
+        self._erros      = 0
+        self._vistas     = 0
+
+    def fixar(self):
+        """Desliga o ajuste: concorrência e page size ficam nos valores atuais."""
+        with self._lock:
+            self.conc_min = self.conc_max = self.concorrencia
+            self.page_min = self.page_max = self.page_size
+
+    # --------------------------------------------------
+    # FEEDBACK
+    # --------------------------------------------------
+
+    def registrar(self, latencia: float, status: int, retries=()):
+        """Registra uma resposta final e os status das tentativas refeitas (urllib3 Retry)."""
+        with self._lock:
+            for st in retries:
+                self._vistas += 1
+                if st in STATUS_PUSHBACK:
+                    self._erros += 1
+
+            self._vistas += 1
+            if status in STATUS_PUSHBACK:
+                self._erros += 1
+            else:
+                self._latencias.append(latencia)
+
+            if self._vistas >= JANELA_DECISAO:
+                self._decidir()
+
+    def _decidir(self):
+        taxa_erros = self._erros / self._vistas
+        lat = sorted(self._latencias)
+        p90 = lat[int(len(lat) * 0.9)] if lat else 0.0
+
+        conc, page = self.concorrencia, self.page_size
+        if taxa_erros > LIMITE_ERROS or p90 > LATENCIA_ALVO:
+            self.concorrencia = max(self.conc_min, int(conc * FATOR_RECUO))
+            self.page_size    = max(self.page_min, int(page * FATOR_RECUO))
+            seta = "🔻"
+        else:
+            self.concorrencia = min(self.conc_max, conc + PASSO_CONC)
+            self.page_size    = min(self.page_max, page + PASSO_PAGE)
+            seta = "🔺"
+
+        if (conc, page) != (self.concorrencia, self.page_size):
+            print(
+                f"  {seta} AIMD {self.nome}: concorrência {conc}→{self.concorrencia} | "
+                f"page {page}→{self.page_size} (erros {taxa_erros:.0%}, p90 {p90:.1f}s)"
+            )
+
+        self._latencias = []
+        self._erros     = 0
+        self._vistas    = 0
+        self._lock.notify_all()
+
+    # --------------------------------------------------
+    # LIMITE DE REQUESTS EM VOO
+    # --------------------------------------------------
+
+    def adquirir(self):
+        with self._lock:
+            self._lock.wait_for(lambda: self._em_voo < self.concorrencia)
+            self._em_voo += 1
+
+    def liberar(self):
+        with self._lock:
+            self._em_voo -= 1
+            self._lock.notify_all()
+
+    def _condicao_async(self) -> asyncio.Condition:
+        # Uma Condition fica presa ao loop em que foi usada, e o daemon roda
+        # um asyncio.run por ciclo: cada loop novo ganha a sua
+        loop = asyncio.get_running_loop()
+        if self._loop_async is not loop:
+            self._cond_async = asyncio.Condition()
+            self._loop_async = loop
+        return self._cond_async
+
+    async def adquirir_async(self):
+        cond = self._condicao_async()
+        async with cond:
+            await cond.wait_for(lambda: self._em_voo < self.concorrencia)
+            self._em_voo += 1
+
+    async def liberar_async(self):
+        cond = self._condicao_async()
+        async with cond:
+            self._em_voo -= 1
+            cond.notify_all()
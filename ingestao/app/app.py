@@ -3,9 +3,12 @@ import pandas as pd
 import plotly.graph_objects as go
 from sqlalchemy import create_engine, text
 import os
+from datetime import date, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 
+from resolucao import escolher_resolucao
+
 # ======================================================
 # ENV & DATABASE
 # ======================================================
@@ -48,28 +51,47 @@ CORES_SENSOR = {
 }
 PALETA_DEVICES = ["#636EFA", "#00CC96", "#AB63FA", "#FFA15A", "#19D3F3", "#FF6692", "#B6E880"]
 
+# Período padrão ao abrir o painel (dias até hoje)
+DIAS_PADRAO = 30
+
 # ======================================================
 # CARREGAMENTO DE DADOS
 # ======================================================
 @st.cache_data(ttl=300)
-def carregar_dados_db():
-    with engine.connect() as conn:
-        conn.execute(text("ALTER TABLE devices ADD COLUMN IF NOT EXISTS reference TEXT;"))
-        conn.execute(text("ALTER TABLE devices ADD COLUMN IF NOT EXISTS battery_percentage FLOAT;"))
-        conn.commit()
-    
+def carregar_dados_db(desde, ate):
+    # Schema (colunas, índices) vem das migrações em sql/ (ingestao/migracoes.py)
     # Query atualizada para trazer battery_percentage da tabela devices (d)
-    query = """
-        SELECT l.data_leitura, l.valor_sensor, s.sensor_id, s.tipo_sensor, 
+    # Filtro por data_leitura no banco: só as partições do período são lidas
+    tabela, col_tempo, col_valor, _ = escolher_resolucao(desde, ate)
+    query = text(f"""
+        SELECT l.{col_tempo} AS data_leitura, l.{col_valor} AS valor_sensor,
+               s.sensor_id, s.tipo_sensor, 
                d.device_name, d.reference, d.latitude, d.longitude, d.status,
                d.battery_percentage
-        FROM leituras l
+        FROM {tabela} l
         JOIN sensores s ON l.sensor_id = s.sensor_id
         JOIN devices d ON s.device_id = d.device_id
-        ORDER BY l.data_leitura
+        WHERE l.{col_tempo} >= :desde AND l.{col_tempo} < :ate
+        ORDER BY l.{col_tempo}
+    """)
+    df = pd.read_sql(query, engine, params={"desde": desde, "ate": ate + timedelta(days=1)})
+    return normalizar_reference(df)
+
+@st.cache_data(ttl=300)
+def carregar_ultimas_db():
+    # Uma linha por device a partir de leituras_ultimas (mantida pela ingestão):
+    # o mapa mostra o estado atual sem depender do período carregado
+    query = """
+        SELECT d.device_name, d.reference, d.latitude, d.longitude, d.status,
+               d.battery_percentage, MAX(u.data_leitura) AS ultima_leitura
+        FROM devices d
+        JOIN sensores s ON s.device_id = d.device_id
+        JOIN leituras_ultimas u ON u.sensor_id = s.sensor_id
+        GROUP BY d.device_id
     """
-    df = pd.read_sql(query, engine)
-    
+    return normalizar_reference(pd.read_sql(query, engine))
+
+def normalizar_reference(df):
     if not df.empty and "reference" in df.columns:
         df["reference"] = (
             df["reference"]
@@ -80,19 +102,29 @@ def carregar_dados_db():
         )
     return df
 
-df_raw = carregar_dados_db()
+# ======================================================
+# SIDEBAR - FILTROS
+# ======================================================
+st.sidebar.button("🔄 Atualizar Dados", on_click=st.cache_data.clear)
+
+# O período vem antes da carga: define o que é lido do banco
+with st.sidebar.expander("📅 Período", expanded=True):
+    d_ini = st.date_input("Início", date.today() - timedelta(days=DIAS_PADRAO))
+    d_fim = st.date_input("Fim", date.today())
+
+if d_ini > d_fim:
+    st.error("A data de início é posterior à data de fim.")
+    st.stop()
+
+df_raw = carregar_dados_db(d_ini, d_fim)
+st.sidebar.caption(f"Resolução: {escolher_resolucao(d_ini, d_fim)[3]}")
 
 if df_raw.empty:
-    st.warning("Sem dados disponíveis no banco de dados.")
+    st.warning("Sem dados no banco para o período selecionado.")
     st.stop()
 
 df_raw["data_leitura"] = pd.to_datetime(df_raw["data_leitura"]).dt.tz_localize(None)
 
-# ======================================================
-# SIDEBAR - FILTROS
-# ======================================================
-st.sidebar.button("🔄 Atualizar Dados", on_click=st.cache_data.clear)
-
 RAMAIS_PERMITIDOS = [
     "Humberto - S11D", 
     "LPR - Brito", 
@@ -150,17 +182,7 @@ if df_final.empty:
     st.warning("Selecione ao menos uma variável e um dispositivo.")
     st.stop()
 
-data_min, data_max = df_final["data_leitura"].min().date(), df_final["data_leitura"].max().date()
-with st.sidebar.expander("📅 Período"):
-    d_ini = st.date_input("Início", data_min)
-    d_fim = st.date_input("Fim", data_max)
-
 modo_escala = st.sidebar.radio("Escala", ["Absoluta", "Relativa (T0)"])
-df_final = df_final[(df_final["data_leitura"].dt.date >= d_ini) & (df_final["data_leitura"].dt.date <= d_fim)]
-
-if df_final.empty:
-    st.error("Não há dados para o intervalo de datas selecionado.")
-    st.stop()
 
 if modo_escala == "Relativa (T0)":
     refs = df_final.sort_values("data_leitura").groupby("sensor_id")["valor_sensor"].transform("first")
@@ -210,7 +232,9 @@ st.plotly_chart(fig, use_container_width=True, config={
 # MAPA (TEXTO EM UMA LINHA E POSICIONADO AO LADO/CIMA)
 # ======================================================
 st.subheader("🛰️ Localização dos Dispositivos")
-df_mapa = df_status[["device_name", "latitude", "longitude", "status", "battery_percentage"]].drop_duplicates().dropna(subset=["latitude", "longitude"])
+df_ultimas = carregar_ultimas_db()
+df_mapa = df_ultimas[(df_ultimas["reference"] == ramal_selecionado) & (df_ultimas["status"].isin(status_selecionados))]
+df_mapa = df_mapa.dropna(subset=["latitude", "longitude"]).copy()
 
 if not df_mapa.empty:
     # Função para criar o nome com a bateria em uma única linha
@@ -0,0 +1,20 @@
+"""
+Resolução que os dashboards (app/app.py e orion_ingest.py) leem do banco
+conforme o tamanho do período. Os rollups são mantidos pela ingestão
+(ingestao/rollups.py); períodos longos leem médias em vez de leituras
+brutas.
+"""
+
+# (até N dias, tabela, coluna de tempo, coluna de valor, rótulo)
+RESOLUCOES = [
+    (7,    "leituras",      "data_leitura", "valor_sensor", "leituras brutas"),
+    (90,   "leituras_hora", "bucket",       "media",        "médias horárias"),
+    (None, "leituras_dia",  "bucket",       "media",        "médias diárias"),
+]
+
+def escolher_resolucao(desde, ate):
+    """(tabela, coluna de tempo, coluna de valor, rótulo) para o período [desde, ate]."""
+    dias = (ate - desde).days + 1
+    for limite, *resolucao in RESOLUCOES:
+        if limite is None or dias <= limite:
+            return resolucao
@@ -1,13 +1,22 @@
 from datetime import datetime, timedelta, timezone
-from psycopg2.extras import execute_batch
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import argparse
+import hashlib
 import time
 
-from common import get_session, obter_token, get_db_conn, BASE_URL
+from common import get_session, get_db_conn, ProvedorToken, TokenBucket, BASE_URL, REQUEST_TIMEOUT, positivo
+from json_stream import ParserLeituras, iterar_blocos, CHUNK_BYTES
+from pipeline import PipelineEscrita, N_WRITERS
+from metricas import MetricasRun
+from migracoes import aplicar_migracoes
 
 DATA_INICIAL = "2026-01-01T00:00:00"
 BLOCO_DIAS = 7
 SENSOR_BATCH_SIZE = 50
-SLEEP = 0.3
+SLEEP = 0.3          # intervalo médio entre requests (vira a taxa do token bucket)
+PARALELISMO = 1      # pares bloco×lote simultâneos
+INTERVALO_PROGRESSO = 10
 
 def gerar_blocos(inicio_str, fim_dt):
     inicio = datetime.fromisoformat(inicio_str).replace(tzinfo=timezone.utc)
@@ -16,59 +25,259 @@ def gerar_blocos(inicio_str, fim_dt):
         yield inicio, fim
         inicio = fim
 
-def run_backfill():
+# ======================================================
+# CHECKPOINT
+# ======================================================
+# Uma linha por (bloco, lote de sensores): o próximo offset a pedir e se
+# o par já terminou. O writer do pipeline a grava na mesma transação das
+# leituras da página (ou numa posterior), então o checkpoint nunca fica à
+# frente do que foi commitado.
+# O último bloco, que termina em "agora", não é gravado: ele ainda recebe
+# leituras, e um run retomado depois precisa baixá-lo de novo.
+
+def chave_lote(lote):
+    return hashlib.md5(",".join(map(str, sorted(lote))).encode()).hexdigest()
+
+def carregar_progresso(cur):
+    cur.execute("SELECT bloco_inicio, lote_chave, proximo_offset, concluido FROM backfill_progresso")
+    return {(b, k): (off, ok) for b, k, off, ok in cur.fetchall()}
+
+def salvar_progresso(cur, bloco_inicio, lote_chave, proximo_offset, concluido):
+    cur.execute("""
+        INSERT INTO backfill_progresso (bloco_inicio, lote_chave, proximo_offset, concluido)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (bloco_inicio, lote_chave) DO UPDATE SET
+            proximo_offset = EXCLUDED.proximo_offset,
+            concluido      = EXCLUDED.concluido,
+            atualizado_em  = now()
+    """, (bloco_inicio, lote_chave, proximo_offset, concluido))
+
+# ======================================================
+# PAR (BLOCO × LOTE)
+# ======================================================
+
+def baixar_par(pipeline, provedor, rate_limiter, tarefa, ini, fim, lote, offset, checkpoint=True):
+    """
+    Baixa todas as páginas de um par bloco×lote a partir de `offset` e
+    entrega ao pipeline as leituras e, logo atrás (mesma chave), o
+    checkpoint da página — o writer os commita juntos ou nessa ordem.
+    Com `checkpoint=False` (bloco aberto) nada é gravado em
+    backfill_progresso. Retorna o total de leituras baixadas.
+    """
+    chave = chave_lote(lote)
+    total = 0
+
+    while not pipeline.falhou:
+        rate_limiter.aguardar()
+        parser = ParserLeituras()
+        with provedor.get(
+            f"{BASE_URL}/SensorData",
+            params={
+                "version": "1.3",
+                "startDate": ini.isoformat(),
+                "endDate": fim.isoformat(),
+                "offset": offset,
+                "sensorIds": ",".join(map(str, lote))
+            },
+            # Sem timeout, uma conexão parada trava o par e o fechar() do pipeline para sempre
+            timeout=REQUEST_TIMEOUT,
+            stream=True
+        ) as r:
+            r.raise_for_status()
+            # Página sem limite: lida em streaming, em blocos para o writer
+            for registros in iterar_blocos(r.iter_content(CHUNK_BYTES), parser):
+                pipeline.enviar(tarefa, registros)
+
+        if checkpoint:
+            pipeline.enviar(tarefa, apos_gravar=[partial(
+                salvar_progresso,
+                bloco_inicio=ini,
+                lote_chave=chave,
+                proximo_offset=offset + 1,
+                concluido=not parser.qtd,
+            )])
+
+        if not parser.qtd:
+            break
+
+        total += parser.qtd
+        offset += 1
+
+    return total
+
+# ======================================================
+# PROGRESSO / ETA
+# ======================================================
+
+def formatar_duracao(segundos):
+    segundos = int(segundos)
+    return f"{segundos // 3600}h{segundos % 3600 // 60:02d}m{segundos % 60:02d}s"
+
+def imprimir_progresso(feitos, total_pares, leituras, inicio):
+    decorrido = time.monotonic() - inicio
+    taxa = leituras / decorrido if decorrido else 0
+    eta = decorrido / feitos * (total_pares - feitos) if feitos else 0
+    print(
+        f"📦 {feitos}/{total_pares} pares ({feitos / total_pares:.0%}) | "
+        f"{leituras} leituras | {taxa:.0f} leit/s | "
+        f"decorrido {formatar_duracao(decorrido)} | ETA {formatar_duracao(eta)}"
+    )
+
+# ======================================================
+# BACKFILL
+# ======================================================
+
+def run_backfill(resume=False, reset=False, paralelismo=PARALELISMO, writers=N_WRITERS, taxa=1 / SLEEP):
     session = get_session()
-    token = obter_token(session)
-    headers = {"Authorization": f"Bearer {token}"}
+    provedor = ProvedorToken(session, obter_conn=get_db_conn)
+    rate_limiter = TokenBucket(taxa, capacidade=paralelismo)
+    metricas = MetricasRun("backfill", rate_limiter)
+    session.hooks["response"].append(metricas.registrar_resposta)
 
+    try:
+        executar_backfill(provedor, rate_limiter, metricas, resume, reset, paralelismo, writers, taxa)
+    except BaseException as e:
+        gravar_metricas(metricas, e)
+        raise
+    gravar_metricas(metricas)
+
+def gravar_metricas(metricas, erro=None):
     conn = get_db_conn()
     cur = conn.cursor()
+    try:
+        metricas.finalizar(cur, erro)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️  Não foi possível gravar ingest_runs: {e}")
+    finally:
+        cur.close()
+        conn.close()
 
-    cur.execute("SELECT sensor_id FROM sensores")
-    sensor_ids = [r[0] for r in cur.fetchall()]
+def executar_backfill(provedor, rate_limiter, metricas, resume, reset, paralelismo, writers, taxa):
+    # Migrações antes do token: o cache dele (api_token_cache) é uma delas
+    with metricas.fase("cursors"):
+        conn = get_db_conn()
+        aplicar_migracoes(conn)
+        cur = conn.cursor()
 
-    agora = datetime.now(timezone.utc)
+        # Ordem fixa: os lotes precisam ser os mesmos entre runs para o --resume
+        cur.execute("SELECT sensor_id FROM sensores ORDER BY sensor_id")
+        sensor_ids = [r[0] for r in cur.fetchall()]
+
+        progresso = carregar_progresso(cur)
+        if reset:
+            cur.execute("TRUNCATE backfill_progresso")
+            print(f"🧹 --reset: {len(progresso)} checkpoints apagados")
+            progresso = {}
+        elif resume:
+            print(f"⏯️  Retomando: {sum(ok for _, ok in progresso.values())} pares bloco×lote já concluídos")
+        elif progresso:
+            conn.rollback()
+            cur.close()
+            conn.close()
+            raise SystemExit(
+                f"⚠️  backfill_progresso tem {len(progresso)} checkpoints de um backfill anterior: "
+                "use --resume para continuar ou --reset para recomeçar do zero"
+            )
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    with metricas.fase("token"):
+        provedor.token()
 
+    # Grade bloco × lote, já sem os pares concluídos
+    agora = datetime.now(timezone.utc)
+    pares = []
     for ini, fim in gerar_blocos(DATA_INICIAL, agora):
         for i in range(0, len(sensor_ids), SENSOR_BATCH_SIZE):
             lote = sensor_ids[i:i+SENSOR_BATCH_SIZE]
-            offset = 0
-
-            while True:
-                r = session.get(
-                    f"{BASE_URL}/SensorData",
-                    headers=headers,
-                    params={
-                        "version": "1.3",
-                        "startDate": ini.isoformat(),
-                        "endDate": fim.isoformat(),
-                        "offset": offset,
-                        "sensorIds": ",".join(map(str, lote))
-                    }
-                )
-                r.raise_for_status()
-                dados = r.json()
-                if not dados:
-                    break
-
-                registros = [
-                    (d["sensorId"], d["readingDate"], d["sensorValue"])
-                    for d in dados
-                ]
-
-                execute_batch(cur, """
-                    INSERT INTO leituras (sensor_id, data_leitura, valor_sensor)
-                    VALUES (%s,%s,%s)
-                    ON CONFLICT DO NOTHING
-                """, registros, page_size=500)
-
-                conn.commit()
-                offset += 1
-                time.sleep(SLEEP)
-
-    cur.close()
-    conn.close()
-    print("🏁 Backfill finalizado")
+            offset, concluido = progresso.get((ini, chave_lote(lote)), (0, False))
+            if not concluido:
+                pares.append((ini, fim, lote, offset, fim < agora))
+
+    print(f"🚀 Backfill: {len(pares)} pares bloco×lote | {paralelismo} workers | {writers} writers | {taxa:g} req/s")
+
+    pipeline = PipelineEscrita(get_db_conn, lambda c: c.close(), n_writers=writers)
+    por_bloco = {}
+    falhas = []
+    leituras = 0
+    inicio = time.monotonic()
+    ultimo_print = 0.0
+
+    with metricas.fase("fetch"), ThreadPoolExecutor(max_workers=paralelismo) as executor:
+        futures = {
+            executor.submit(
+                baixar_par, pipeline, provedor, rate_limiter, n, ini, fim, lote, offset, checkpoint
+            ): (ini, lote)
+            for n, (ini, fim, lote, offset, checkpoint) in enumerate(pares)
+        }
+        for feitos, f in enumerate(as_completed(futures), start=1):
+            ini, lote = futures[f]
+            try:
+                qtd = f.result()
+                leituras += qtd
+                por_bloco[ini] = por_bloco.get(ini, 0) + qtd
+            except Exception as e:
+                falhas.append((ini, lote, e))
+                print(f"💥 Falha em bloco {ini:%Y-%m-%d} lote {lote[0]}…: {e}")
+
+            if time.monotonic() - ultimo_print >= INTERVALO_PROGRESSO or feitos == len(pares):
+                imprimir_progresso(feitos, len(pares), leituras, inicio)
+                ultimo_print = time.monotonic()
+
+    inseridas = pipeline.fechar()
+    metricas.somar_fase("write", pipeline.segundos)
+    metricas.registrar_escrita(pipeline.enviadas, inseridas)
+
+    print("\n📊 Leituras baixadas por bloco:")
+    for ini in sorted(por_bloco):
+        print(f"  {ini:%Y-%m-%d}  {por_bloco[ini]:>10}")
+
+    print(f"🏁 Backfill finalizado: {inseridas} novas de {leituras} leituras em {formatar_duracao(time.monotonic() - inicio)}")
+
+    if falhas or pipeline.falhou:
+        raise SystemExit(f"⚠️  {len(falhas)} pares falharam; rode de novo com --resume")
 
 if __name__ == "__main__":
-    run_backfill()
+    parser = argparse.ArgumentParser(description="Backfill histórico Orion → Supabase")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continua da última página commitada (tabela backfill_progresso).",
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Apaga os checkpoints de backfill_progresso e recomeça do zero.",
+    )
+    parser.add_argument(
+        "--paralelo",
+        type=int,
+        default=PARALELISMO,
+        help=f"Pares bloco×lote baixados em paralelo. Padrão: {PARALELISMO} (sequencial).",
+    )
+    parser.add_argument(
+        "--writers",
+        type=int,
+        default=N_WRITERS,
+        help=f"Threads gravando no banco, uma conexão cada. Padrão: {N_WRITERS}.",
+    )
+    parser.add_argument(
+        "--rate",
+        type=positivo(float),
+        default=1 / SLEEP,
+        help=f"Requests por segundo somando todos os workers. Padrão: {1 / SLEEP:g}.",
+    )
+    args = parser.parse_args()
+    if args.resume and args.reset:
+        parser.error("--resume e --reset são excludentes")
+
+    run_backfill(
+        resume=args.resume,
+        reset=args.reset,
+        paralelismo=args.paralelo,
+        writers=args.writers,
+        taxa=args.rate,
+    )
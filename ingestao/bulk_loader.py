@@ -0,0 +1,134 @@
+import io
+
+from rollups import HORAS_STAGE, garantir_stage as garantir_stage_horas, atualizar_rollups
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+# Tabela temporária (por conexão, sem WAL) usada como área de staging
+STAGE_TABLE = "leituras_stage"
+
+# Linhas acumuladas antes de o chamador precisar dar flush
+FLUSH_LINHAS = 50_000
+
+# ======================================================
+# CARGA EM MASSA DE LEITURAS (COPY + MERGE)
+# ======================================================
+
+def _campo_copy(valor) -> str:
+    if valor is None:
+        return r"\N"
+    return str(valor)
+
+class LeiturasLoader:
+    """
+    Carga em massa de `leituras` via COPY.
+
+    As linhas acumulam num buffer de texto; `flush()` as envia com
+    COPY FROM STDIN para uma tabela temporária e faz UM único
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING em `leituras`. O mesmo
+    comando avança `leituras_ultimas` (última leitura por sensor) e, com
+    `rollups`, anota as horas que receberam linhas novas; o flush então
+    recalcula leituras_hora/leituras_dia para elas.
+
+    Nenhum método faz commit: a transação é do chamador, que decide
+    quando dar flush (ver `cheio`) e quando commitar.
+    """
+
+    def __init__(self, cur, flush_linhas: int = FLUSH_LINHAS, rollups: bool = True):
+        self.cur          = cur
+        self.flush_linhas = flush_linhas
+        self.rollups      = rollups
+        self.pendentes    = 0
+        self.enviadas     = 0
+        self.inseridas    = 0
+        self._buffer      = io.StringIO()
+
+    @property
+    def cheio(self) -> bool:
+        return self.pendentes >= self.flush_linhas
+
+    def adicionar(self, registros):
+        """Acumula tuplas (sensor_id, data_leitura, valor_sensor)."""
+        escrever = self._buffer.write
+        for sensor_id, data_leitura, valor in registros:
+            escrever(f"{sensor_id}\t{data_leitura}\t{_campo_copy(valor)}\n")
+            self.pendentes += 1
+
+    def marcar(self):
+        """Estado antes de um flush; `restaurar(marca)` o devolve se a transação sofrer rollback."""
+        return self._buffer, self.pendentes, self.enviadas, self.inseridas
+
+    def restaurar(self, marca):
+        self._buffer, self.pendentes, self.enviadas, self.inseridas = marca
+
+    def _garantir_stage(self):
+        # Recriada sob demanda: se a transação que a criou sofrer rollback,
+        # a tabela temporária some junto.
+        self.cur.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} AS
+            SELECT sensor_id, data_leitura, valor_sensor
+            FROM leituras
+            WITH NO DATA
+        """)
+
+    def flush(self) -> int:
+        """Envia o buffer via COPY e faz o merge. Retorna as linhas novas."""
+        if not self.pendentes:
+            return 0
+
+        self._garantir_stage()
+
+        self._buffer.seek(0)
+        self.cur.copy_expert(
+            f"COPY {STAGE_TABLE} (sensor_id, data_leitura, valor_sensor) FROM STDIN",
+            self._buffer,
+        )
+
+        # Um só comando: insere em leituras, anota as horas tocadas (rollups)
+        # e avança leituras_ultimas, tudo a partir das linhas realmente novas.
+        # ORDER BY na chave: writers concorrentes (pipeline, ultimos_dados)
+        # travam linhas sobrepostas na mesma ordem e não entram em deadlock.
+        horas = ""
+        if self.rollups:
+            garantir_stage_horas(self.cur)
+            horas = f"""
+                , horas AS (
+                    INSERT INTO {HORAS_STAGE} (sensor_id, bucket)
+                    SELECT DISTINCT sensor_id, date_trunc('hour', data_leitura) FROM novas
+                    ON CONFLICT DO NOTHING
+                )
+            """
+        self.cur.execute(f"""
+            WITH novas AS (
+                INSERT INTO leituras (sensor_id, data_leitura, valor_sensor)
+                SELECT sensor_id, data_leitura, valor_sensor
+                FROM {STAGE_TABLE}
+                ORDER BY sensor_id, data_leitura
+                ON CONFLICT (sensor_id, data_leitura) DO NOTHING
+                RETURNING sensor_id, data_leitura, valor_sensor
+            ), ultimas AS (
+                INSERT INTO leituras_ultimas (sensor_id, data_leitura, valor_sensor, atualizado_em)
+                SELECT DISTINCT ON (sensor_id) sensor_id, data_leitura, valor_sensor, clock_timestamp()
+                FROM novas
+                ORDER BY sensor_id, data_leitura DESC
+                ON CONFLICT (sensor_id) DO UPDATE SET
+                    data_leitura  = EXCLUDED.data_leitura,
+                    valor_sensor  = EXCLUDED.valor_sensor,
+                    atualizado_em = EXCLUDED.atualizado_em
+                WHERE EXCLUDED.data_leitura > leituras_ultimas.data_leitura
+            ){horas}
+            SELECT COUNT(*) FROM novas
+        """)
+        inseridas = self.cur.fetchone()[0]
+        self.cur.execute(f"TRUNCATE {STAGE_TABLE}")
+
+        if self.rollups and inseridas:
+            atualizar_rollups(self.cur)
+
+        self.enviadas  += self.pendentes
+        self.inseridas += inseridas
+        self.pendentes  = 0
+        self._buffer    = io.StringIO()
+        return inseridas
@@ -1,10 +1,19 @@
 import os
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import tempfile
+import threading
+import time
 import requests
 import psycopg2
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-BASE_URL = "https://api.oriondata.io/api"
+# ORION_BASE_URL aponta os scripts para outra API (ex.: tools/simulador_api.py)
+BASE_URL = os.getenv("ORION_BASE_URL", "https://api.oriondata.io/api")
 REQUEST_TIMEOUT = 30
 
 def get_api_key():
@@ -21,14 +30,238 @@ def get_session():
         status_forcelist=[429, 500, 502, 503, 504],
         allowed_methods=["GET"]
     )
-    session.mount("https://", HTTPAdapter(max_retries=retries))
+    adapter = HTTPAdapter(max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
     return session
 
 def obter_token(session):
-    r = session.get(
-        f"{BASE_URL}/token",
-        params={"apiKey": get_api_key()},
-        timeout=REQUEST_TIMEOUT
-    )
-    r.raise_for_status()
-    return r.json()["token"]
+    return ProvedorToken(session).token()
+
+# ======================================================
+# TOKEN COM CACHE E VALIDADE
+# ======================================================
+
+# Cache do token: tabela `api_token_cache` quando o provedor recebe uma
+# conexão (persiste entre runs do GitHub Actions), senão arquivo local.
+TOKEN_CACHE_ARQUIVO = os.getenv(
+    "ORION_TOKEN_CACHE",
+    os.path.join(tempfile.gettempdir(), "orion_token.json"),
+)
+# Validade assumida quando o token não é um JWT com `exp`
+TOKEN_TTL    = int(os.getenv("ORION_TOKEN_TTL", 50 * 60))
+# Renova quando faltar menos que isso para expirar
+TOKEN_MARGEM = 5 * 60
+
+def _expiracao_jwt(token):
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+class ProvedorToken:
+    """
+    Token da API compartilhado por todos os scripts de ingestão.
+
+    - Reaproveita o token em cache enquanto faltar mais de TOKEN_MARGEM
+      para expirar (validade do `exp` do JWT, ou TOKEN_TTL)
+    - Renova sozinho antes de expirar, inclusive no meio de jobs longos
+    - `get()` refaz a request UMA vez com token novo se a API devolver 401
+
+    O cache é por API key (hash), então chaves diferentes não se misturam.
+    """
+
+    def __init__(self, session, api_key=None, obter_conn=None, devolver_conn=None,
+                 rate_limiter=None):
+        self.session       = session
+        self.api_key       = api_key or get_api_key()
+        self._obter_conn   = obter_conn
+        self._devolver     = devolver_conn or (lambda conn: conn.close())
+        self._rate_limiter = rate_limiter
+        self._chave        = hashlib.sha256((self.api_key or "").encode()).hexdigest()[:16]
+        self._lock         = threading.Lock()
+        self._token        = None
+        self._expira_em    = 0.0
+
+    # --------------------------------------------------
+    # CACHE
+    # --------------------------------------------------
+
+    def _no_banco(self, fn):
+        conn = self._obter_conn()
+        try:
+            cur = conn.cursor()
+            resultado = fn(cur)
+            cur.close()
+            conn.commit()
+            return resultado
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._devolver(conn)
+
+    def _ler_cache(self):
+        try:
+            if self._obter_conn:
+                def ler(cur):
+                    cur.execute(
+                        "SELECT token, EXTRACT(EPOCH FROM expira_em) FROM api_token_cache WHERE chave = %s",
+                        (self._chave,),
+                    )
+                    return cur.fetchone()
+                row = self._no_banco(ler)
+                return (row[0], float(row[1])) if row else None
+
+            with open(TOKEN_CACHE_ARQUIVO) as f:
+                dados = json.load(f)
+            if dados.get("chave") == self._chave:
+                return dados["token"], float(dados["expira_em"])
+        except Exception:
+            pass   # cache ausente, de outra chave ou tabela inexistente
+        return None
+
+    def _gravar_cache(self, token, expira_em):
+        try:
+            if self._obter_conn:
+                def gravar(cur):
+                    cur.execute("""
+                        INSERT INTO api_token_cache (chave, token, expira_em)
+                        VALUES (%s, %s, to_timestamp(%s))
+                        ON CONFLICT (chave) DO UPDATE SET
+                            token     = EXCLUDED.token,
+                            expira_em = EXCLUDED.expira_em
+                    """, (self._chave, token, expira_em))
+                self._no_banco(gravar)
+                return
+
+            tmp = f"{TOKEN_CACHE_ARQUIVO}.{os.getpid()}"
+            with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                json.dump({"chave": self._chave, "token": token, "expira_em": expira_em}, f)
+            os.replace(tmp, TOKEN_CACHE_ARQUIVO)
+        except Exception as e:
+            print(f"⚠️  Não foi possível gravar o cache do token: {e}")
+
+    # --------------------------------------------------
+    # TOKEN
+    # --------------------------------------------------
+
+    def _valido(self, expira_em):
+        return expira_em - time.time() > TOKEN_MARGEM
+
+    def token(self) -> str:
+        with self._lock:
+            if self._token and self._valido(self._expira_em):
+                return self._token
+
+            cache = self._ler_cache()
+            if cache and self._valido(cache[1]):
+                self._token, self._expira_em = cache
+                return self._token
+
+            return self._buscar()
+
+    def renovar(self, anterior=None) -> str:
+        """Força um token novo — exceto se outra thread já trocou `anterior`."""
+        with self._lock:
+            if anterior is not None and self._token and self._token != anterior:
+                return self._token
+            return self._buscar()
+
+    def _buscar(self) -> str:
+        if self._rate_limiter:
+            self._rate_limiter.aguardar()
+        r = self.session.get(
+            f"{BASE_URL}/token",
+            params={"apiKey": self.api_key},
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        token = r.json()["token"]
+
+        self._token     = token
+        self._expira_em = _expiracao_jwt(token) or time.time() + TOKEN_TTL
+        self._gravar_cache(self._token, self._expira_em)
+        return token
+
+    def get(self, url, **kwargs):
+        """session.get autenticado; em 401 renova o token e tenta mais uma vez."""
+        token = self.token()
+        r = self.session.get(url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if r.status_code != 401:
+            return r
+
+        r.close()
+        print("🔑 401 da API: renovando token")
+        token = self.renovar(token)
+        return self.session.get(url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+
+# ======================================================
+# RATE LIMIT (TOKEN BUCKET)
+# ======================================================
+
+class TokenBucket:
+    """
+    Limitador token bucket compartilhado entre threads e corrotinas.
+
+    `taxa` tokens são repostos por segundo, até `capacidade` acumulados
+    (rajada). Cada chamada reserva um token sob o lock e dorme FORA dele,
+    então quem espera não bloqueia os demais — o saldo negativo funciona
+    como fila de reservas e mantém a taxa média exata.
+
+    `espera_total` acumula os segundos de espera impostos desde a criação.
+    """
+
+    def __init__(self, taxa, capacidade=1):
+        self._lock = threading.Lock()
+        self.espera_total = 0.0
+        self.configurar(taxa, capacidade)
+
+    def configurar(self, taxa, capacidade=1):
+        # Taxa 0 dividiria por zero em _reservar, no meio do run
+        if taxa <= 0 or capacidade <= 0:
+            raise ValueError(f"taxa e capacidade precisam ser > 0 (taxa={taxa}, capacidade={capacidade})")
+        with self._lock:
+            self.taxa       = float(taxa)
+            self.capacidade = float(max(capacidade, 1))
+            self._tokens    = self.capacidade
+            self._instante  = time.monotonic()
+
+    def _reservar(self) -> float:
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(
+                self.capacidade,
+                self._tokens + (agora - self._instante) * self.taxa,
+            )
+            self._instante = agora
+            self._tokens  -= 1
+            if self._tokens >= 0:
+                return 0.0
+            espera = -self._tokens / self.taxa
+            self.espera_total += espera
+            return espera
+
+    def aguardar(self) -> float:
+        espera = self._reservar()
+        if espera > 0:
+            time.sleep(espera)
+        return espera
+
+    async def aguardar_async(self) -> float:
+        espera = self._reservar()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        return espera
+
+def positivo(tipo):
+    """`type=` do argparse que só aceita valores > 0 (--rate, --burst)."""
+    def converter(texto):
+        valor = tipo(texto)
+        if valor <= 0:
+            raise argparse.ArgumentTypeError(f"precisa ser maior que zero: {texto}")
+        return valor
+    converter.__name__ = tipo.__name__   # mensagem de erro do argparse ("invalid float value")
+    return converter
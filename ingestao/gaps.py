@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+# Um intervalo entre leituras consecutivas maior que GAP_FATOR × o
+# intervalo típico do sensor (mediana) é considerado buraco.
+GAP_FATOR = 3.0
+
+# ======================================================
+# DETECÇÃO DE BURACOS
+# ======================================================
+
+SQL_GAPS = """
+    WITH base AS (
+        SELECT
+            sensor_id,
+            data_leitura,
+            LAG(data_leitura) OVER w AS anterior
+        FROM leituras
+        WHERE sensor_id = ANY(%(sensores)s)
+          AND data_leitura >= %(desde)s
+          AND data_leitura <  %(ate)s
+        WINDOW w AS (PARTITION BY sensor_id ORDER BY data_leitura)
+    ),
+    deltas AS (
+        SELECT sensor_id, anterior, data_leitura,
+               EXTRACT(EPOCH FROM data_leitura - anterior) AS delta_s
+        FROM base
+        WHERE anterior IS NOT NULL
+    ),
+    perfil AS (
+        SELECT
+            sensor_id,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY delta_s) AS intervalo_s,
+            COUNT(*) + 1      AS leituras,
+            MIN(anterior)     AS primeira,
+            MAX(data_leitura) AS ultima
+        FROM deltas
+        GROUP BY sensor_id
+    )
+    SELECT
+        p.sensor_id, p.intervalo_s, p.leituras, p.primeira, p.ultima,
+        -- Leitura anterior a `desde`: sem ela o sensor começou depois (instalado
+        -- mais tarde) e o trecho até a primeira leitura não é buraco
+        EXISTS (
+            SELECT 1 FROM leituras l
+            WHERE l.sensor_id = p.sensor_id AND l.data_leitura < %(desde)s
+        ) AS ativo_antes,
+        d.anterior, d.data_leitura
+    FROM perfil p
+    LEFT JOIN deltas d
+           ON d.sensor_id = p.sensor_id
+          AND d.delta_s > %(fator)s * p.intervalo_s
+    WHERE p.intervalo_s > 0
+    ORDER BY p.sensor_id, d.anterior
+"""
+
+def detectar_gaps(cur, sensor_ids, desde, ate, fator: float = GAP_FATOR):
+    """
+    Infere o intervalo de amostragem de cada sensor (mediana dos deltas
+    entre leituras consecutivas, via LAG) e lista as janelas faltantes
+    em [desde, ate).
+
+    Retorna (gaps, cobertura):
+      gaps      → [(sensor_id, inicio, fim), ...] — inclui o trecho entre
+                  `desde` e a primeira leitura só se o sensor já tinha
+                  leituras antes de `desde`; o trecho após a última
+                  leitura é do incremental normal e fica de fora
+      cobertura → {sensor_id: {...}} com leituras, intervalo, esperadas,
+                  percentual de cobertura, nº de buracos e horas faltando
+
+    Sensores com menos de duas leituras na janela não têm intervalo
+    inferível e ficam fora (o cursor do incremental já cobre esse caso).
+    """
+    cur.execute(SQL_GAPS, {
+        "sensores": list(sensor_ids),
+        "desde":    desde,
+        "ate":      ate,
+        "fator":    fator,
+    })
+
+    gaps      = []
+    cobertura = {}
+    for sid, intervalo_s, leituras, primeira, ultima, ativo_antes, g_ini, g_fim in cur.fetchall():
+        if sid not in cobertura:
+            # Sensor instalado depois de `desde`: cobertura medida da primeira leitura
+            inicio    = desde if ativo_antes else primeira
+            intervalo = timedelta(seconds=float(intervalo_s))
+            esperadas = int((ultima - inicio) / intervalo) + 1
+            cobertura[sid] = {
+                "leituras":  leituras,
+                "intervalo": intervalo,
+                "esperadas": esperadas,
+                "cobertura": min(1.0, leituras / esperadas),
+                "gaps":      0,
+                "faltando":  timedelta(0),
+            }
+            if primeira - inicio > fator * intervalo:
+                gaps.append((sid, inicio, primeira))
+                cobertura[sid]["gaps"]     += 1
+                cobertura[sid]["faltando"] += primeira - inicio
+
+        if g_ini is not None:
+            gaps.append((sid, g_ini, g_fim))
+            cobertura[sid]["gaps"]     += 1
+            cobertura[sid]["faltando"] += g_fim - g_ini
+
+    return gaps, cobertura
+
+def imprimir_relatorio(cobertura: dict, gaps: list, n_requests: int):
+    """Relatório de cobertura por sensor (modo somente-leitura)."""
+    print(f"\n{'sensor':>10} {'leituras':>9} {'intervalo':>10} {'cobertura':>9} {'buracos':>8} {'h faltando':>11}")
+    for sid, c in sorted(cobertura.items(), key=lambda kv: kv[1]["cobertura"]):
+        print(
+            f"{sid:>10} {c['leituras']:>9} {str(c['intervalo']):>10} "
+            f"{c['cobertura']:>8.1%} {c['gaps']:>8} "
+            f"{c['faltando'].total_seconds() / 3600:>11.1f}"
+        )
+
+    com_buraco = sum(1 for c in cobertura.values() if c["gaps"])
+    horas      = sum(c["faltando"].total_seconds() for c in cobertura.values()) / 3600
+    print(
+        f"\n📊 {len(cobertura)} sensores analisados | {com_buraco} com buracos | "
+        f"{len(gaps)} janelas | {horas:.1f} h faltando | ~{n_requests} requests para reparar"
+    )
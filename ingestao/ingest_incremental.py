@@ -7,26 +7,53 @@ from datetime import datetime, timedelta, timezone
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 import threading
-import time
+import asyncio
+import signal
 import argparse
+import time
+
+from common import TokenBucket, ProvedorToken, BASE_URL, positivo
+from pipeline import PipelineEscrita, N_WRITERS
+from gaps import detectar_gaps, imprimir_relatorio
+from json_stream import ParserLeituras, iterar_blocos, iterar_blocos_async, CHUNK_BYTES
+from aimd import ControladorAIMD
+from metricas import MetricasRun, medir_lag, servir_prometheus, status_refeitos, PORTA_PROMETHEUS
+from watermark import carregar_por_sync_state
+from metadados import sincronizar_metadados, imprimir_contagens, linha_sensor
+from particionamento import garantir_particoes
+from migracoes import aplicar_migracoes
 
 # ======================================================
 # CONFIG
 # ======================================================
 
 API_KEY      = os.getenv("API_KEY")
-BASE_URL     = "https://api.oriondata.io/api"
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 # Modo normal: incremental a partir da última leitura real
-# Modo gap-fill: varre desde DATA_GAP_FILL para detectar buracos
+# Modo gap-fill: detecta buracos desde DATA_GAP_FILL e baixa só essas janelas
 DATA_INICIAL_HISTORICO = "2026-01-01T00:00:00"
 DATA_GAP_FILL          = "2026-01-01T00:00:00"
 
 REQUEST_TIMEOUT = 45
+
+# Valores INICIAIS: o ControladorAIMD ajusta concorrência e page size
+# durante o run, entre os mínimos (aimd) e estes máximos.
 MAX_WORKERS     = 4
 PAGE_SIZE       = 500
+CONC_MAX        = 16
+PAGE_SIZE_MAX   = 5000
+
+# Requests multi-sensor: até SENSOR_BATCH_SIZE sensores por chamada, desde
+# que seus cursores estejam a no máximo BATCH_JANELA_HORAS um do outro.
+SENSOR_BATCH_SIZE  = 50
+BATCH_JANELA_HORAS = 6
+
+# Devices cujo lastUpload não mudou são pulados, mas nunca por mais de
+# VARREDURA_COMPLETA_CADA - 1 runs seguidos (rede de segurança).
+VARREDURA_COMPLETA_CADA = 8
 
 # Captura todos os tipos de sensor retornados pela API, exceto os listados aqui.
 # "Unallocated" = canal nao configurado no datalogger, sem dado util.
@@ -34,32 +61,57 @@ TIPOS_EXCLUIDOS = (
     "Unallocated",
 )
 
+# Rate limit da API: token bucket com taxa (req/s) e rajada configuráveis.
+# O padrão equivale ao antigo intervalo mínimo de 0.5 s entre requests.
 API_MIN_INTERVAL = 0.5
-api_lock         = threading.Lock()
-ultimo_request   = 0
+API_RATE         = 1 / API_MIN_INTERVAL
+API_BURST        = 1
+
+# Modo --daemon: intervalos (s) entre polls de leituras e entre gravações
+# de metadata. O filtro por lastUpload conta ciclos, então no daemon
+# --full-sweep-every N força a varredura a cada N × INTERVALO_LEITURAS.
+INTERVALO_LEITURAS = 60
+INTERVALO_METADATA = 900
+
+# Motor async: máximo de sensores com request em andamento ao mesmo tempo
+MAX_EM_VOO = 32
+
+# Retry do motor async (equivalente ao urllib3 Retry da session HTTP)
+RETRY_TOTAL   = 5
+RETRY_BACKOFF = 2
+RETRY_STATUS  = (429, 500, 502, 503, 504)
+
+rate_limiter = TokenBucket(API_RATE, API_BURST)
+controlador  = ControladorAIMD(
+    MAX_WORKERS, PAGE_SIZE,
+    conc_max=CONC_MAX, page_max=PAGE_SIZE_MAX,
+    nome="SensorData",
+)
 
 def aguardar_rate_limit():
-    global ultimo_request
-    with api_lock:
-        agora = time.time()
-        delta = agora - ultimo_request
-        if delta < API_MIN_INTERVAL:
-            time.sleep(API_MIN_INTERVAL - delta)
-        ultimo_request = time.time()
+    rate_limiter.aguardar()
+
+# Métricas do run (tabela ingest_runs; /metrics no modo daemon)
+metricas = MetricasRun("ingest_incremental", rate_limiter)
 
 # ======================================================
 # SESSION HTTP
 # ======================================================
 
 session = requests.Session()
-retries = Retry(total=5, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
-session.mount("https://", HTTPAdapter(max_retries=retries))
+retries = Retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF, status_forcelist=list(RETRY_STATUS))
+adapter = HTTPAdapter(max_retries=retries)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+session.hooks["response"].append(metricas.registrar_resposta)
 
 # ======================================================
 # CONNECTION POOL
 # ======================================================
 
-db_pool   = SimpleConnectionPool(minconn=1, maxconn=MAX_WORKERS + 4, dsn=DATABASE_URL)
+# Os workers HTTP não usam o banco: só os writers do pipeline e as
+# consultas do orquestrador (schema, cursores, metadados).
+db_pool   = SimpleConnectionPool(minconn=1, maxconn=N_WRITERS + 1, dsn=DATABASE_URL)
 pool_lock = threading.Lock()
 
 def get_conn():
@@ -70,59 +122,88 @@ def release_conn(conn):
     with pool_lock:
         db_pool.putconn(conn)
 
+# ======================================================
+# TOKEN (cache em api_token_cache, renovação automática)
+# ======================================================
+
+provedor = ProvedorToken(
+    session,
+    api_key=API_KEY,
+    obter_conn=get_conn,
+    devolver_conn=release_conn,
+    rate_limiter=rate_limiter,
+)
+
 # ======================================================
 # SCHEMA
 # ======================================================
 
 def garantir_schema():
+    # Tabelas e colunas vêm só das migrações (sql/); aqui, além delas,
+    # apenas as partições do mês corrente e seguintes
     conn = get_conn()
+    aplicar_migracoes(conn)
     cur  = conn.cursor()
-    cur.execute("ALTER TABLE devices ADD COLUMN IF NOT EXISTS reference TEXT;")
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS sync_state (
-            sensor_id      BIGINT PRIMARY KEY,
-            last_timestamp TIMESTAMP
-        );
-    """)
+    garantir_particoes(cur)
+    conn.commit()
+    cur.close()
+    release_conn(conn)
+
+def renovar_particoes():
+    """Só as partições futuras de leituras: o daemon vive além da virada do mês."""
+    conn = get_conn()
+    cur  = conn.cursor()
+    garantir_particoes(cur)
     conn.commit()
     cur.close()
     release_conn(conn)
 
 # ======================================================
-# CURSOR POR SENSOR — fonte real: tabela leituras
+# CURSOR POR SENSOR — fonte real: tabela sync_state
 # ======================================================
 
-def carregar_cursores(sensor_ids: list, gap_fill: bool = False) -> dict:
+def carregar_cursores(sensor_ids: list) -> dict:
     """
     Retorna {sensor_id: "YYYY-MM-DDTHH:MM:SS"} com o ponto de partida
     para cada sensor.
 
-    Modo normal  (gap_fill=False):
-      → usa MAX(data_leitura) de cada sensor em `leituras`, menos 1h de margem.
-        Se não há leitura, usa DATA_INICIAL_HISTORICO.
+    Usa sync_state.last_timestamp (watermark mantido pelos writers), menos
+    1h de margem. Leitura pela PK: O(sensores), não O(leituras).
+    Sensor sem watermark (novo, ou sync_state ainda não reconstruído) é
+    buscado pontualmente em `leituras` via índice e semeado no sync_state;
+    se não há leitura, usa DATA_INICIAL_HISTORICO.
 
-    Modo gap-fill (gap_fill=True):
-      → força todos os sensores a iniciarem em DATA_GAP_FILL,
-        independentemente do que já existe no banco.
-        O ON CONFLICT DO NOTHING na inserção garante que dados duplicados
-        sejam ignorados — apenas os buracos serão preenchidos.
+    Buracos no meio do histórico não são papel do cursor: ver `lotes_de_gaps`.
     """
-    if gap_fill:
-        print(f"🔍 Modo GAP-FILL: todos os sensores serão varridos desde {DATA_GAP_FILL}")
-        return {sid: DATA_GAP_FILL for sid in sensor_ids}
-
     if not sensor_ids:
         return {}
 
     conn = get_conn()
     cur  = conn.cursor()
-    placeholders = ",".join(["%s"] * len(sensor_ids))
     cur.execute(
-        f"SELECT sensor_id, MAX(data_leitura) FROM leituras "
-        f"WHERE sensor_id IN ({placeholders}) GROUP BY sensor_id",
-        sensor_ids,
+        "SELECT sensor_id, last_timestamp FROM sync_state WHERE sensor_id = ANY(%s)",
+        (list(sensor_ids),),
     )
-    rows = {sid: ts for sid, ts in cur.fetchall()}
+    rows = {sid: ts for sid, ts in cur.fetchall() if ts}
+
+    sem_watermark = [sid for sid in sensor_ids if sid not in rows]
+    if sem_watermark:
+        cur.execute("""
+            SELECT s.sensor_id, m.max_ts
+            FROM unnest(%s::bigint[]) AS s(sensor_id)
+            CROSS JOIN LATERAL (
+                SELECT MAX(l.data_leitura) AS max_ts
+                FROM leituras l
+                WHERE l.sensor_id = s.sensor_id
+            ) m
+            WHERE m.max_ts IS NOT NULL
+        """, (sem_watermark,))
+        semente = cur.fetchall()
+        salvar_cursores(cur, dict(semente))
+        conn.commit()
+        rows.update(semente)
+        print(f"🌱 sync_state semeado para {len(semente)} de {len(sem_watermark)} sensores sem watermark")
+
     cur.close()
     release_conn(conn)
 
@@ -135,202 +216,787 @@ def carregar_cursores(sensor_ids: list, gap_fill: bool = False) -> dict:
             cursores[sid] = DATA_INICIAL_HISTORICO
     return cursores
 
+def carregar_filtro(sensor_ids: list):
+    """
+    Filtro de watermark (watermark.py) dos sensores: descarta antes do
+    COPY o que a margem de 1h do cursor traria de volta já gravado.
+    """
+    conn = get_conn()
+    cur  = conn.cursor()
+    try:
+        return carregar_por_sync_state(cur, sensor_ids)
+    finally:
+        conn.rollback()
+        cur.close()
+        release_conn(conn)
+
+# ======================================================
+# MANUTENÇÃO DO SYNC_STATE
+# ======================================================
+
+def reconstruir_sync_state():
+    """
+    Recalcula sync_state a partir de MAX(data_leitura) em `leituras`.
+
+    Operação única (ou após restaurar backup / apagar leituras): é o único
+    ponto que varre `leituras` inteira, e sobrescreve o watermark mesmo
+    que ele volte no tempo.
+    """
+    conn = get_conn()
+    cur  = conn.cursor()
+    cur.execute("""
+        INSERT INTO sync_state (sensor_id, last_timestamp)
+        SELECT sensor_id, MAX(data_leitura)
+        FROM leituras
+        GROUP BY sensor_id
+        ON CONFLICT (sensor_id) DO UPDATE
+            SET last_timestamp = EXCLUDED.last_timestamp
+    """)
+    total = cur.rowcount
+    conn.commit()
+    cur.close()
+    release_conn(conn)
+    print(f"🔧 sync_state reconstruído: {total} sensores")
+
+def verificar_sync_state() -> bool:
+    """
+    Compara sync_state com MAX(data_leitura) de `leituras` e imprime as
+    divergências. Retorna False só se houver sensor adiantado.
+
+    - adiantado: watermark além da última leitura gravada — a margem de 1h
+      pode não cobrir e leituras podem ser puladas (grave)
+    - atrasado:  watermark antes da última leitura — só custa re-download;
+      normal para sensores que o ultimos_dados grava sem mexer no sync_state
+    - ausente:   sensor com leituras e sem watermark — semeado no próximo
+      run, ou nunca (tipos excluídos que o ultimos_dados grava)
+    """
+    conn = get_conn()
+    cur  = conn.cursor()
+    cur.execute("""
+        SELECT COALESCE(s.sensor_id, l.sensor_id), s.last_timestamp, l.max_ts
+        FROM sync_state s
+        FULL JOIN (
+            SELECT sensor_id, MAX(data_leitura) AS max_ts
+            FROM leituras
+            GROUP BY sensor_id
+        ) l ON l.sensor_id = s.sensor_id
+        WHERE s.last_timestamp IS DISTINCT FROM l.max_ts
+    """)
+    divergentes = cur.fetchall()
+    cur.close()
+    release_conn(conn)
+
+    adiantados = [(sid, ss, lt) for sid, ss, lt in divergentes if ss and (lt is None or ss > lt)]
+    atrasados  = [(sid, ss, lt) for sid, ss, lt in divergentes if ss and lt and ss < lt]
+    ausentes   = [(sid, ss, lt) for sid, ss, lt in divergentes if ss is None]
+
+    print(
+        f"🔎 sync_state: {len(adiantados)} adiantados | "
+        f"{len(atrasados)} atrasados | {len(ausentes)} sem watermark"
+    )
+    for sid, ss, lt in adiantados[:20]:
+        print(f"  ⚠️  sensor {sid}: sync_state={ss} > leituras={lt}")
+
+    return not adiantados
+
+# ======================================================
+# LOTES DE SENSORES COM CURSORES PRÓXIMOS
+# ======================================================
+
+def agrupar_sensores(cursores: dict, fim: str) -> list:
+    """
+    Agrupa sensores em lotes para requests multi-sensor (`sensorIds=a,b,c`).
+
+    Os sensores são ordenados pelo cursor e um lote só aceita sensores cujo
+    cursor esteja a no máximo BATCH_JANELA_HORAS do primeiro. O lote é pedido
+    a partir do menor cursor; o excesso que volta para os demais sensores é
+    pequeno e descartado pelo filtro de watermark antes de chegar ao banco.
+
+    Retorna [(inicio, fim, [sensor_id, ...]), ...].
+    """
+    janela = timedelta(hours=BATCH_JANELA_HORAS)
+    lotes  = []
+    atual  = []
+    base   = None
+
+    for sid, cursor in sorted(cursores.items(), key=lambda kv: kv[1]):
+        ts = datetime.fromisoformat(cursor)
+        if atual and (len(atual) >= SENSOR_BATCH_SIZE or ts - base > janela):
+            lotes.append((base.strftime("%Y-%m-%dT%H:%M:%S"), fim, atual))
+            atual = []
+        if not atual:
+            base = ts
+        atual.append(sid)
+
+    if atual:
+        lotes.append((base.strftime("%Y-%m-%dT%H:%M:%S"), fim, atual))
+    return lotes
+
+def lotes_de_gaps(sensor_ids: list, fim: str) -> list:
+    """
+    Detecta os buracos desde DATA_GAP_FILL (ver gaps.detectar_gaps) e monta
+    um lote por janela faltante; sensores com exatamente a mesma janela
+    (ex.: device inteiro offline) dividem a mesma request.
+    """
+    conn = get_conn()
+    cur  = conn.cursor()
+    gaps, _ = detectar_gaps(
+        cur, sensor_ids,
+        datetime.fromisoformat(DATA_GAP_FILL),
+        datetime.fromisoformat(fim),
+    )
+    cur.close()
+    release_conn(conn)
+
+    por_janela = {}
+    for sid, g_ini, g_fim in gaps:
+        por_janela.setdefault((g_ini, g_fim), []).append(sid)
+
+    lotes = []
+    for (g_ini, g_fim), sids in sorted(por_janela.items()):
+        for i in range(0, len(sids), SENSOR_BATCH_SIZE):
+            lotes.append((
+                g_ini.strftime("%Y-%m-%dT%H:%M:%S"),
+                g_fim.strftime("%Y-%m-%dT%H:%M:%S"),
+                sids[i:i + SENSOR_BATCH_SIZE],
+            ))
+
+    print(f"🕳️  {len(gaps)} buracos em {len({sid for sid, _, _ in gaps})} sensores → {len(lotes)} lotes de reparo")
+    return lotes
+
+def relatorio_gaps(sensor_ids: list):
+    """Modo somente-leitura: imprime a cobertura por sensor e o custo do reparo."""
+    fim = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    conn = get_conn()
+    cur  = conn.cursor()
+    gaps, cobertura = detectar_gaps(cur, sensor_ids, datetime.fromisoformat(DATA_GAP_FILL), fim)
+    cur.close()
+    release_conn(conn)
+
+    janelas = {}
+    for sid, g_ini, g_fim in gaps:
+        janelas[(g_ini, g_fim)] = janelas.get((g_ini, g_fim), 0) + 1
+    n_requests = sum(-(-n // SENSOR_BATCH_SIZE) for n in janelas.values())
+
+    imprimir_relatorio(cobertura, gaps, n_requests)
+
 # ======================================================
-# WORKER POR SENSOR
+# CURSORES
 # ======================================================
 
-def worker_sensor(token, device_id, sensor_id, inicio, agora):
+def salvar_cursores(cur, maximos: dict):
+    """Avança sync_state para cada sensor do lote. Não faz commit."""
+    if not maximos:
+        return
+    execute_batch(cur, """
+        INSERT INTO sync_state (sensor_id, last_timestamp)
+        VALUES (%s, %s)
+        ON CONFLICT (sensor_id) DO UPDATE
+            SET last_timestamp = EXCLUDED.last_timestamp
+        WHERE sync_state.last_timestamp IS NULL
+           OR sync_state.last_timestamp < EXCLUDED.last_timestamp
+    """, list(maximos.items()))
+
+# ======================================================
+# PAGINAÇÃO
+# ======================================================
+
+def pagina_final(qtd: int, limite: int) -> bool:
+    """
+    Página curta só encerra o lote se for menor que PAGE_SIZE, que a API
+    sempre respeitou. Com o AIMD pedindo mais que isso, a API pode cortar
+    a página num teto próprio: uma página entre PAGE_SIZE e `limite` não
+    prova fim, e a paginação segue até vir vazia.
     """
-    Baixa e salva leituras de UM único sensor com paginação completa.
+    return qtd < min(limite, PAGE_SIZE)
 
-    Ao usar um sensor por worker:
-    - O cursor é exato para aquele sensor
-    - O offset não é contaminado por dados de outros sensores
-    - Gaps individuais são detectados e preenchidos corretamente
+# ======================================================
+# WORKER POR LOTE DE SENSORES (PRODUTOR)
+# ======================================================
+
+def worker_lote(pipeline, chave, sensor_ids, inicio, fim, filtro=None):
     """
-    conn    = get_conn()
-    cur     = conn.cursor()
-    headers = {"Authorization": f"Bearer {token}"}
+    Baixa as leituras de um lote de sensores com paginação completa e
+    entrega cada página ao pipeline de escrita — o worker não usa o banco.
+    O corpo de cada página é lido em streaming (json_stream): as tuplas
+    seguem em blocos para o writer e os máximos por sensor são apurados
+    no mesmo passe, sem montar a página inteira em memória.
 
+    Uma request cobre todos os sensores do lote; a resposta é separada por
+    `sensorId` para manter um cursor exato por sensor:
+    - O avanço do sync_state é enfileirado (mesma `chave`) só depois de
+      TODAS as páginas do lote, e o writer o commita junto ou depois delas
+    - Se uma página falhar, nenhum cursor do lote avança e a próxima
+      execução repete a janela (o ON CONFLICT absorve o que já entrou)
+
+    Retorna (leituras baixadas, lote completo?).
+    """
     current_offset = 0
-    total_sensor   = 0
+    total_lote     = 0
+    maximos        = {}
+    completo       = True
 
-    while True:
-        aguardar_rate_limit()
+    while not pipeline.falhou:
+        limite   = controlador.page_size
+        parser   = ParserLeituras(maximos)
+        status   = 0
+        refeitos = []
+        latencia = None
 
+        # Vaga do AIMD antes do token do rate limit: quem espera vaga não
+        # acumula tokens, e as vagas liberadas não disparam acima do --burst
+        controlador.adquirir()
+        inicio_t = time.monotonic()
         try:
-            r = session.get(
+            aguardar_rate_limit()
+            inicio_t = time.monotonic()
+            with provedor.get(
                 f"{BASE_URL}/SensorData",
-                headers=headers,
                 params={
                     "version":   "1.3",
                     "startDate": inicio,
-                    "endDate":   agora,
+                    "endDate":   fim,
                     "offset":    current_offset,
-                    "limit":     PAGE_SIZE,
-                    "sensorIds": str(sensor_id),   # ← UM sensor por request
+                    "limit":     limite,
+                    "sensorIds": ",".join(map(str, sensor_ids)),
                 },
                 timeout=REQUEST_TIMEOUT,
-            )
-            r.raise_for_status()
-            dados = r.json()
+                stream=True,
+            ) as r:
+                status   = r.status_code
+                latencia = r.elapsed.total_seconds()
+                refeitos = status_refeitos(r)
+                r.raise_for_status()
+                for registros in iterar_blocos(r.iter_content(CHUNK_BYTES), parser):
+                    pipeline.enviar(chave, filtro.filtrar(registros) if filtro else registros)
         except Exception as e:
-            print(f"  ⚠️  sensor {sensor_id} (dev {device_id}) offset={current_offset}: {e}")
+            print(f"  ⚠️  lote de {len(sensor_ids)} sensores ({sensor_ids[0]}…) offset={current_offset}: {e}")
+            if not status:
+                metricas.registrar_status(0)
+            completo = False
             break
+        finally:
+            controlador.liberar()
+            if latencia is None:
+                latencia = time.monotonic() - inicio_t
+            controlador.registrar(latencia, status, refeitos)
 
-        qtd = len(dados)
+        qtd = parser.qtd
         if qtd == 0:
             break
 
-        registros = [
-            (d["sensorId"], d["readingDate"], d["sensorValue"])
-            for d in dados
-        ]
+        total_lote     += qtd
+        current_offset += qtd
 
-        execute_batch(cur, """
-            INSERT INTO leituras (sensor_id, data_leitura, valor_sensor)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (sensor_id, data_leitura) DO NOTHING
-        """, registros)
+        if pagina_final(qtd, limite):
+            break
 
-        # Atualiza sync_state (diagnóstico)
-        max_ts = max(d["readingDate"] for d in dados)
-        cur.execute("""
-            INSERT INTO sync_state (sensor_id, last_timestamp)
-            VALUES (%s, %s)
-            ON CONFLICT (sensor_id) DO UPDATE
-                SET last_timestamp = EXCLUDED.last_timestamp
-            WHERE sync_state.last_timestamp IS NULL
-               OR sync_state.last_timestamp < EXCLUDED.last_timestamp
-        """, (sensor_id, max_ts))
+    if completo and maximos:
+        pipeline.enviar(chave, apos_gravar=[partial(salvar_cursores, maximos=maximos)])
 
-        conn.commit()
-        total_sensor   += qtd
-        current_offset += qtd
+    if total_lote > 0:
+        print(f"  ✅ lote de {len(sensor_ids)} sensores: {total_lote} leituras desde {inicio}")
 
-        if qtd < PAGE_SIZE:
-            break
+    return total_lote, completo
 
-    if total_sensor > 0:
-        print(f"  ✅ sensor {sensor_id} (dev {device_id}): {total_sensor} leituras desde {inicio}")
+# ======================================================
+# WORKER POR LOTE — MOTOR ASYNC
+# ======================================================
 
-    cur.close()
-    release_conn(conn)
-    return total_sensor
+async def baixar_pagina_async(http, params, parser, entregar):
+    """
+    GET em /SensorData com rate limit e retry/backoff nos mesmos casos do
+    urllib3 Retry: status de RETRY_STATUS e erro de conexão/timeout antes
+    da resposta. O corpo é lido em streaming e cada bloco de tuplas vai
+    para `entregar` (corrotina); falha no meio do corpo não é refeita,
+    porque parte já foi entregue. Cada tentativa passa pelo limite de
+    requests em voo do AIMD e é registrada como feedback. Um 401 renova
+    o token e é refeito uma única vez.
+    """
+    import aiohttp
+
+    token    = await asyncio.to_thread(provedor.token)
+    renovado = False
+
+    for tentativa in range(RETRY_TOTAL + 1):
+        # Vaga antes do token, como no worker_lote
+        await controlador.adquirir_async()
+
+        status       = 0
+        inicio_t     = time.monotonic()
+        latencia     = None
+        reautenticar = False
+        try:
+            await rate_limiter.aguardar_async()
+            inicio_t = time.monotonic()
+            async with http.get(
+                f"{BASE_URL}/SensorData",
+                headers={"Authorization": f"Bearer {token}"},
+                params=params,
+            ) as r:
+                status   = r.status
+                latencia = time.monotonic() - inicio_t
+                reautenticar = r.status == 401 and not renovado
+                refazer      = r.status in RETRY_STATUS and tentativa < RETRY_TOTAL
+                if not (refazer or reautenticar):
+                    r.raise_for_status()
+                    async for registros in iterar_blocos_async(r.content.iter_chunked(CHUNK_BYTES), parser):
+                        await entregar(registros)
+                    return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if status or tentativa >= RETRY_TOTAL:
+                raise
+            print(f"  🔌 /SensorData sem resposta ({e!r}): tentativa {tentativa + 1}/{RETRY_TOTAL}")
+        finally:
+            if latencia is None:
+                latencia = time.monotonic() - inicio_t
+            controlador.registrar(latencia, status)
+            metricas.registrar_status(status)
+            await controlador.liberar_async()
+
+        if reautenticar:
+            print("🔑 401 da API: renovando token")
+            token    = await asyncio.to_thread(provedor.renovar, token)
+            renovado = True
+            continue
+
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** tentativa))
+
+    raise RuntimeError(f"/SensorData: tentativas esgotadas (último status {status})")
+
+async def worker_lote_async(http, em_voo, pipeline, chave, sensor_ids, inicio, fim, filtro=None):
+    """
+    Mesmo contrato de `worker_lote`, mas sem prender uma thread por lote:
+    as requests ficam em voo no event loop; só a entrega ao pipeline (que
+    pode bloquear por backpressure) vai para thread.
+    """
+    current_offset = 0
+    total_lote     = 0
+    maximos        = {}
+    completo       = True
+
+    async def entregar(registros):
+        if filtro:
+            registros = filtro.filtrar(registros)
+        await asyncio.to_thread(pipeline.enviar, chave, registros)
+
+    async with em_voo:
+        while not pipeline.falhou:
+            limite = controlador.page_size
+            parser = ParserLeituras(maximos)
+            try:
+                await baixar_pagina_async(
+                    http,
+                    {
+                        "version":   "1.3",
+                        "startDate": inicio,
+                        "endDate":   fim,
+                        "offset":    str(current_offset),
+                        "limit":     str(limite),
+                        "sensorIds": ",".join(map(str, sensor_ids)),
+                    },
+                    parser,
+                    entregar,
+                )
+            except Exception as e:
+                print(f"  ⚠️  lote de {len(sensor_ids)} sensores ({sensor_ids[0]}…) offset={current_offset}: {e}")
+                completo = False
+                break
+
+            qtd = parser.qtd
+            if qtd == 0:
+                break
+
+            total_lote     += qtd
+            current_offset += qtd
+
+            if pagina_final(qtd, limite):
+                break
+
+    if completo and maximos:
+        await asyncio.to_thread(
+            pipeline.enviar, chave, (), [partial(salvar_cursores, maximos=maximos)]
+        )
+
+    if total_lote > 0:
+        print(f"  ✅ lote de {len(sensor_ids)} sensores: {total_lote} leituras desde {inicio}")
+
+    return total_lote, completo
+
+def dimensionar_async(max_em_voo: int):
+    """
+    Limites do AIMD para o motor async: parte da metade de `max_em_voo` e
+    pode subir até ele. Chamado uma vez, antes de um eventual `fixar()`.
+    """
+    controlador.conc_max     = max(controlador.conc_min, max_em_voo)
+    controlador.concorrencia = max(controlador.conc_min, max_em_voo // 2)
+
+async def executar_async(pipeline, lotes, max_em_voo, filtros):
+    """
+    Roda os lotes no event loop (`filtros[i]` é o filtro de watermark do
+    lote i, ou None). Retorna (total baixado, sensores com falha).
+    """
+    import aiohttp
+
+    # Lotes ativos ao mesmo tempo; as requests em voo dentro deles são
+    # limitadas pelo AIMD (limites em dimensionar_async).
+    em_voo = asyncio.Semaphore(max_em_voo)
+    total  = 0
+    falhos = set()
+
+    timeout   = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=max_em_voo)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+        resultados = await asyncio.gather(
+            *(
+                worker_lote_async(http, em_voo, pipeline, i, sids, inicio, fim, filtros[i])
+                for i, (inicio, fim, sids) in enumerate(lotes)
+            ),
+            return_exceptions=True,
+        )
+
+    for (inicio, _, sids), res in zip(lotes, resultados):
+        if isinstance(res, Exception):
+            print(f"  💥 Falha lote {sids[0]}… ({len(sids)} sensores) desde {inicio}: {res}")
+            falhos.update(sids)
+            continue
+        qtd, completo = res
+        total += qtd
+        if not completo:
+            falhos.update(sids)
+    return total, falhos
 
 # ======================================================
 # TOKEN
 # ======================================================
 
 def obter_token() -> str:
-    aguardar_rate_limit()
-    r = session.get(
-        f"{BASE_URL}/token",
-        params={"apiKey": API_KEY},
-        timeout=REQUEST_TIMEOUT,
-    )
-    r.raise_for_status()
-    return r.json()["token"]
+    """Token do cache compartilhado; só vai à API se faltar ou estiver vencendo."""
+    return provedor.token()
 
 # ======================================================
 # DEVICES E SENSORES
 # ======================================================
 
-def cadastrar_devices_e_sensores(token) -> dict:
-    """Retorna {device_id: [sensor_id, ...]} com todos os sensores, exceto os tipos excluídos."""
-    conn = get_conn()
-    cur  = conn.cursor()
-    aguardar_rate_limit()
+def sensor_monitorado(linha: tuple) -> bool:
+    """Linha de `metadados.linha_sensor`: tem tipo e o tipo não é excluído."""
+    tipo = linha[3]
+    return bool(tipo) and tipo not in TIPOS_EXCLUIDOS
 
-    r = session.get(
-        f"{BASE_URL}/UserDevices",
-        headers={"Authorization": f"Bearer {token}"},
-        timeout=REQUEST_TIMEOUT,
-    )
-    r.raise_for_status()
+def buscar_devices() -> list:
+    """Payload de /UserDevices (uma request)."""
+    with metricas.fase("metadata"):
+        aguardar_rate_limit()
+        r = provedor.get(
+            f"{BASE_URL}/UserDevices",
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        return r.json()
 
+def mapear_devices(devices: list) -> tuple:
+    """
+    Retorna ({device_id: [sensor_id, ...]}, {device_id: lastUpload}) com todos
+    os sensores, exceto os tipos excluídos, e o lastUpload atual de cada device.
+    """
     mapa_devices = {}
-    for device in r.json():
-        cur.execute("""
-            INSERT INTO devices (
-                device_id, device_name, serial_number, status,
-                latitude, longitude, last_upload,
-                battery_percentage, last_status, reference
-            )
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            ON CONFLICT (device_id) DO UPDATE SET
-                device_name        = EXCLUDED.device_name,
-                status             = EXCLUDED.status,
-                latitude           = EXCLUDED.latitude,
-                longitude          = EXCLUDED.longitude,
-                last_upload        = EXCLUDED.last_upload,
-                battery_percentage = EXCLUDED.battery_percentage,
-                last_status        = EXCLUDED.last_status,
-                reference          = EXCLUDED.reference;
-        """, (
-            device["deviceId"], device["deviceName"],
-            device.get("serialNumber"), device.get("status"),
-            device.get("latitude"), device.get("longitude"),
-            device.get("lastUpload"), device.get("batteryPercentage"),
-            device.get("lastStatus"), device.get("reference"),
+    uploads      = {}
+    for device in devices:
+        uploads[device["deviceId"]] = device.get("lastUpload")
+        sensores_validos = [
+            linha[0] for linha in (linha_sensor(device["deviceId"], s) for s in device.get("sensors", []))
+            if sensor_monitorado(linha)
+        ]
+        if sensores_validos:
+            mapa_devices[device["deviceId"]] = sensores_validos
+    return mapa_devices, uploads
+
+def cadastrar_devices_e_sensores(devices: list = None) -> tuple:
+    """
+    Grava devices (só o que mudou) e os sensores ainda não cadastrados, e
+    devolve `mapear_devices`. Sem `devices`, busca o payload na API.
+    """
+    if devices is None:
+        devices = buscar_devices()
+
+    with metricas.fase("metadata"):
+        conn = get_conn()
+        cur  = conn.cursor()
+        imprimir_contagens(sincronizar_metadados(
+            cur, devices, filtro_sensor=sensor_monitorado, sensores_so_novos=True,
         ))
+        conn.commit()
+        cur.close()
+        release_conn(conn)
+    return mapear_devices(devices)
 
-        sensores_validos = []
-        for sensor in device.get("sensors", []):
-            tipo = (sensor.get("sensorType") or "").strip()
-            if tipo and tipo not in TIPOS_EXCLUIDOS:
-                sid = sensor["sensorId"]
-                sensores_validos.append(sid)
-                cur.execute("""
-                    INSERT INTO sensores (sensor_id, device_id, nome_customizado, tipo_sensor, unidade_medida)
-                    VALUES (%s,%s,%s,%s,%s)
-                    ON CONFLICT (sensor_id) DO NOTHING;
-                """, (sid, device["deviceId"], sensor.get("customName"), tipo, sensor.get("uom")))
+# ======================================================
+# DEVICES SEM UPLOAD NOVO
+# ======================================================
 
-        if sensores_validos:
-            mapa_devices[device["deviceId"]] = sensores_validos
+def selecionar_devices(mapa_devices: dict, uploads: dict, varredura_cada: int) -> dict:
+    """
+    Mantém só os devices cujo lastUpload mudou desde o último run
+    processado com sucesso (device_sync_state).
+
+    Rede de segurança: um device pulado acumula `runs_sem_varredura` e é
+    agendado de qualquer forma ao chegar em `varredura_cada` runs.
+    Device sem lastUpload, ou nunca processado, é sempre agendado.
+    """
+    if varredura_cada <= 1 or not mapa_devices:
+        return mapa_devices
+
+    conn = get_conn()
+    cur  = conn.cursor()
+    cur.execute(
+        "SELECT device_id, last_upload, runs_sem_varredura FROM device_sync_state "
+        "WHERE device_id = ANY(%s)",
+        (list(mapa_devices),),
+    )
+    estado = {did: (upload, runs) for did, upload, runs in cur.fetchall()}
 
+    agendados = {}
+    pulados   = []
+    for did, sids in mapa_devices.items():
+        upload = uploads.get(did)
+        anterior, runs = estado.get(did, (None, 0))
+        if upload is None or anterior is None or upload != anterior or runs + 1 >= varredura_cada:
+            agendados[did] = sids
+        else:
+            pulados.append(did)
+
+    if pulados:
+        cur.execute("""
+            UPDATE device_sync_state
+            SET runs_sem_varredura = runs_sem_varredura + 1
+            WHERE device_id = ANY(%s)
+        """, (pulados,))
+    conn.commit()
+    cur.close()
+    release_conn(conn)
+
+    print(
+        f"⏭️  {len(pulados)} devices sem upload novo pulados | "
+        f"{len(agendados)} agendados (varredura forçada a cada {varredura_cada} runs)"
+    )
+    return agendados
+
+def marcar_devices_processados(uploads: dict):
+    """Grava o lastUpload processado e zera o contador de runs pulados."""
+    if not uploads:
+        return
+    conn = get_conn()
+    cur  = conn.cursor()
+    execute_batch(cur, """
+        INSERT INTO device_sync_state (device_id, last_upload, runs_sem_varredura)
+        VALUES (%s, %s, 0)
+        ON CONFLICT (device_id) DO UPDATE SET
+            last_upload        = EXCLUDED.last_upload,
+            runs_sem_varredura = 0
+    """, list(uploads.items()))
     conn.commit()
     cur.close()
     release_conn(conn)
-    return mapa_devices
 
 # ======================================================
 # ORQUESTRADOR
 # ======================================================
 
-def baixar_e_salvar_leituras(token, mapa_devices, gap_fill: bool = False):
-    # Achata todos os (device_id, sensor_id) em uma lista plana
-    tarefas = [
-        (did, sid)
-        for did, sids in mapa_devices.items()
-        for sid in sids
-    ]
-    todos_sensor_ids = [sid for _, sid in tarefas]
-
-    cursores = carregar_cursores(todos_sensor_ids, gap_fill=gap_fill)
-    agora    = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
-    total    = 0
-
-    print(f"\n📡 {len(tarefas)} sensores para processar | endDate={agora}")
-    if gap_fill:
-        print(f"🔁 GAP-FILL ativo: varrendo desde {DATA_GAP_FILL} em todos os sensores\n")
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {
-            executor.submit(
-                worker_sensor, token, did, sid, cursores[sid], agora
-            ): (did, sid)
-            for did, sid in tarefas
-        }
-        for f in as_completed(futures):
-            did, sid = futures[f]
-            try:
-                total += f.result()
-            except Exception as e:
-                print(f"  💥 Falha sensor {sid} (dev {did}): {e}")
+def baixar_e_salvar_leituras(mapa_devices, gap_fill: bool = False,
+                             engine: str = "threads", max_em_voo: int = MAX_EM_VOO,
+                             uploads: dict = None,
+                             varredura_cada: int = VARREDURA_COMPLETA_CADA):
+    with metricas.fase("cursors"):
+        # Só devices com upload novo (exceto no gap-fill, que varre tudo)
+        if uploads is not None and not gap_fill:
+            mapa_devices = selecionar_devices(mapa_devices, uploads, varredura_cada)
 
-    print(f"\n✅ TOTAL DE LEITURAS PROCESSADAS: {total}")
+        # Achata todos os (device_id, sensor_id) em uma lista plana
+        tarefas = [
+            (did, sid)
+            for did, sids in mapa_devices.items()
+            for sid in sids
+        ]
+        todos_sensor_ids = [sid for _, sid in tarefas]
+
+        agora    = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        cursores = carregar_cursores(todos_sensor_ids)
+        filtro   = carregar_filtro(todos_sensor_ids)
+        lotes    = agrupar_sensores(cursores, agora)
+        total    = 0
+
+        # Lotes de gap-fill ficam abaixo do watermark de propósito: sem filtro
+        filtros = [filtro] * len(lotes)
+        if gap_fill:
+            print(f"🔁 GAP-FILL ativo: reparando buracos desde {DATA_GAP_FILL}")
+            gaps     = lotes_de_gaps(todos_sensor_ids, agora)
+            lotes   += gaps
+            filtros += [None] * len(gaps)
+
+    print(
+        f"\n📡 {len(tarefas)} sensores em {len(lotes)} lotes | "
+        f"endDate={agora} | engine={engine}"
+    )
+
+    pipeline = PipelineEscrita(get_conn, release_conn, n_writers=N_WRITERS)
+
+    falhos = set()
+
+    with metricas.fase("fetch"):
+        if engine == "async":
+            total, falhos = asyncio.run(executar_async(pipeline, lotes, max_em_voo, filtros))
+        else:
+            # Threads até o teto do AIMD; quantas fazem request ao mesmo
+            # tempo é decidido por controlador.adquirir()
+            with ThreadPoolExecutor(max_workers=controlador.conc_max) as executor:
+                futures = {
+                    executor.submit(
+                        worker_lote, pipeline, i, sids, inicio, fim, filtros[i]
+                    ): (inicio, sids)
+                    for i, (inicio, fim, sids) in enumerate(lotes)
+                }
+                for f in as_completed(futures):
+                    inicio, sids = futures[f]
+                    try:
+                        qtd, completo = f.result()
+                        total += qtd
+                        if not completo:
+                            falhos.update(sids)
+                    except Exception as e:
+                        print(f"  💥 Falha lote {sids[0]}… ({len(sids)} sensores) desde {inicio}: {e}")
+                        falhos.update(sids)
+
+    inseridas = pipeline.fechar()
+
+    # "write" soma o tempo de flush dos writers, que corre em paralelo ao fetch
+    metricas.somar_fase("write", pipeline.segundos)
+    metricas.registrar_escrita(pipeline.enviadas, inseridas, filtro.descartadas)
+    registrar_lag(todos_sensor_ids)
+
+    print(
+        f"\n✅ TOTAL DE LEITURAS PROCESSADAS: {total} "
+        f"({inseridas} novas, {filtro.descartadas} já gravadas descartadas antes do banco, "
+        f"{pipeline.commits} commits)"
+    )
+    if pipeline.falhou:
+        raise RuntimeError(f"Gravação falhou: {pipeline.erros[0]}")
+
+    # Device só conta como processado se todos os seus lotes fecharam
+    if uploads is not None:
+        marcar_devices_processados({
+            did: uploads.get(did)
+            for did, sids in mapa_devices.items()
+            if not falhos.intersection(sids)
+        })
+
+# ======================================================
+# MÉTRICAS
+# ======================================================
+
+def registrar_lag(sensor_ids: list):
+    conn = get_conn()
+    cur  = conn.cursor()
+    try:
+        metricas.registrar_lag(medir_lag(cur, sensor_ids))
+    finally:
+        conn.rollback()
+        cur.close()
+        release_conn(conn)
+
+def gravar_metricas(erro=None):
+    """Fecha o run em `metricas` e grava em ingest_runs. Falha aqui não derruba a ingestão."""
+    conn = get_conn()
+    cur  = conn.cursor()
+    try:
+        metricas.finalizar(cur, erro)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️  Não foi possível gravar ingest_runs: {e}")
+    finally:
+        cur.close()
+        release_conn(conn)
+
+# ======================================================
+# DAEMON
+# ======================================================
+
+parar = threading.Event()
+
+def _sinal_parada(signum, frame):
+    print(f"\n🛑 Sinal {signal.Signals(signum).name}: encerrando após o ciclo atual")
+    parar.set()
+
+def executar_daemon(engine: str = "threads", max_em_voo: int = MAX_EM_VOO,
+                    varredura_cada: int = VARREDURA_COMPLETA_CADA,
+                    intervalo_leituras: float = INTERVALO_LEITURAS,
+                    intervalo_metadata: float = INTERVALO_METADATA,
+                    porta_metricas: int = PORTA_PROMETHEUS):
+    """
+    Processo contínuo: session HTTP, token, pool de conexões, token bucket
+    e AIMD ficam aquecidos entre ciclos.
+
+    - A cada `intervalo_leituras`: busca /UserDevices (uma request, só
+      para ler lastUpload) e baixa as leituras dos devices com upload novo
+    - A cada `intervalo_metadata`, ou quando aparece sensor desconhecido:
+      grava devices/sensores (diff) e garante as partições futuras de
+      leituras antes de baixar
+
+    SIGTERM/SIGINT terminam o ciclo em andamento (o pipeline commita o
+    que já baixou) e saem. Um ciclo com erro é logado e o próximo segue.
+    Cada ciclo é um run em ingest_runs; com `porta_metricas`, os mesmos
+    contadores ficam em /metrics (formato Prometheus).
+    """
+    signal.signal(signal.SIGTERM, _sinal_parada)
+    signal.signal(signal.SIGINT, _sinal_parada)
+
+    if porta_metricas:
+        servir_prometheus(metricas, porta_metricas)
+
+    print(
+        f"🛰️  Daemon: leituras a cada {intervalo_leituras:g}s | "
+        f"metadata a cada {intervalo_metadata:g}s"
+    )
+
+    conhecidos    = set()
+    prox_metadata = 0.0
+    ciclo         = 0
+
+    while not parar.is_set():
+        inicio = time.monotonic()
+        ciclo += 1
+        erro   = None
+        metricas.iniciar()
+        try:
+            devices = buscar_devices()
+            m_devs, uploads = mapear_devices(devices)
+            sensores = {sid for sids in m_devs.values() for sid in sids}
+
+            if inicio >= prox_metadata or not sensores <= conhecidos:
+                renovar_particoes()
+                cadastrar_devices_e_sensores(devices)
+                conhecidos    = sensores
+                prox_metadata = inicio + intervalo_metadata
+
+            baixar_e_salvar_leituras(
+                m_devs,
+                engine=engine,
+                max_em_voo=max_em_voo,
+                uploads=uploads,
+                varredura_cada=varredura_cada,
+            )
+        except Exception as e:
+            erro = e
+            print(f"💥 Ciclo {ciclo} falhou: {e}")
+
+        gravar_metricas(erro)
+        duracao = time.monotonic() - inicio
+        print(f"⏱️  Ciclo {ciclo} em {duracao:.1f}s")
+        parar.wait(max(0.0, intervalo_leituras - duracao))
+
+    db_pool.closeall()
+    print("👋 Daemon encerrado")
 
 # ======================================================
 # MAIN
@@ -342,17 +1008,149 @@ if __name__ == "__main__":
         "--gap-fill",
         action="store_true",
         help=(
-            f"Varre todos os sensores desde {DATA_GAP_FILL} para detectar e "
-            "preencher buracos. Dados já existentes são ignorados (ON CONFLICT DO NOTHING)."
+            f"Além do incremental, detecta buracos desde {DATA_GAP_FILL} (intervalo de "
+            "amostragem inferido por sensor) e baixa só as janelas faltantes."
+        ),
+    )
+    parser.add_argument(
+        "--gap-report",
+        action="store_true",
+        help="Só imprime a cobertura por sensor e o custo estimado do reparo, sem baixar nada.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("threads", "async"),
+        default="threads",
+        help="threads: ThreadPoolExecutor com MAX_WORKERS | async: asyncio/aiohttp com várias requests em voo.",
+    )
+    parser.add_argument(
+        "--rate",
+        type=positivo(float),
+        default=API_RATE,
+        help=f"Requests por segundo permitidas na API (token bucket). Padrão: {API_RATE:g}.",
+    )
+    parser.add_argument(
+        "--burst",
+        type=positivo(int),
+        default=API_BURST,
+        help=f"Rajada máxima de requests do token bucket. Padrão: {API_BURST}.",
+    )
+    parser.add_argument(
+        "--max-em-voo",
+        type=int,
+        default=MAX_EM_VOO,
+        help=f"Sensores com request simultânea no engine async. Padrão: {MAX_EM_VOO}.",
+    )
+    parser.add_argument(
+        "--sem-aimd",
+        action="store_true",
+        help=(
+            f"Desliga o ajuste automático: concorrência e page size ficam fixos "
+            f"nos valores iniciais ({MAX_WORKERS} / {PAGE_SIZE}; async: metade de --max-em-voo)."
+        ),
+    )
+    parser.add_argument(
+        "--full-sweep-every",
+        type=int,
+        default=VARREDURA_COMPLETA_CADA,
+        help=(
+            "Força a varredura de devices sem upload novo a cada N runs. "
+            f"1 desliga o filtro por lastUpload. Padrão: {VARREDURA_COMPLETA_CADA}."
         ),
     )
+    parser.add_argument(
+        "--rebuild-sync-state",
+        action="store_true",
+        help="Recalcula sync_state a partir de MAX(data_leitura) em leituras e sai.",
+    )
+    parser.add_argument(
+        "--check-sync-state",
+        action="store_true",
+        help="Compara sync_state com leituras, lista divergências e sai (código 1 se houver sensor adiantado).",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Roda continuamente (session, token e pool aquecidos) até SIGTERM.",
+    )
+    parser.add_argument(
+        "--intervalo-leituras",
+        type=float,
+        default=INTERVALO_LEITURAS,
+        help=f"Daemon: segundos entre polls de leituras. Padrão: {INTERVALO_LEITURAS}.",
+    )
+    parser.add_argument(
+        "--intervalo-metadata",
+        type=float,
+        default=INTERVALO_METADATA,
+        help=f"Daemon: segundos entre gravações de devices/sensores. Padrão: {INTERVALO_METADATA}.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=PORTA_PROMETHEUS,
+        help=f"Daemon: porta do /metrics em formato Prometheus (0 desliga). Padrão: {PORTA_PROMETHEUS}.",
+    )
     args = parser.parse_args()
 
+    if args.daemon and (args.gap_fill or args.gap_report):
+        parser.error("--daemon não combina com --gap-fill/--gap-report; rode-os avulsos")
+
+    rate_limiter.configurar(args.rate, args.burst)
+    if args.engine == "async":
+        dimensionar_async(args.max_em_voo)
+    if args.sem_aimd:
+        controlador.fixar()
+
+    if args.gap_report:
+        garantir_schema()
+        conn = get_conn()
+        cur  = conn.cursor()
+        cur.execute(
+            "SELECT sensor_id FROM sensores WHERE COALESCE(tipo_sensor, '') <> '' AND tipo_sensor <> ALL(%s)",
+            (list(TIPOS_EXCLUIDOS),),
+        )
+        ids = [r[0] for r in cur.fetchall()]
+        cur.close()
+        release_conn(conn)
+        relatorio_gaps(ids)
+        raise SystemExit(0)
+
+    if args.rebuild_sync_state or args.check_sync_state:
+        garantir_schema()
+        if args.rebuild_sync_state:
+            reconstruir_sync_state()
+        if args.check_sync_state and not verificar_sync_state():
+            raise SystemExit(1)
+        raise SystemExit(0)
+
+    if args.daemon:
+        garantir_schema()
+        executar_daemon(
+            engine=args.engine,
+            max_em_voo=args.max_em_voo,
+            varredura_cada=args.full_sweep_every,
+            intervalo_leituras=args.intervalo_leituras,
+            intervalo_metadata=args.intervalo_metadata,
+            porta_metricas=args.metrics_port,
+        )
+        raise SystemExit(0)
+
     try:
         garantir_schema()
-        tk     = obter_token()
-        m_devs = cadastrar_devices_e_sensores(tk)
-        baixar_e_salvar_leituras(tk, m_devs, gap_fill=args.gap_fill)
+        with metricas.fase("token"):
+            obter_token()
+        m_devs, uploads = cadastrar_devices_e_sensores()
+        baixar_e_salvar_leituras(
+            m_devs,
+            gap_fill=args.gap_fill,
+            engine=args.engine,
+            max_em_voo=args.max_em_voo,
+            uploads=uploads,
+            varredura_cada=args.full_sweep_every,
+        )
     except Exception as e:
         print(f"💥 ERRO FATAL: {e}")
+        gravar_metricas(e)
         raise
+    gravar_metricas()
@@ -1,22 +1,32 @@
 import os
 import requests
-import psycopg2
-from psycopg2.extras import execute_batch
+from psycopg2.pool import SimpleConnectionPool
 from datetime import datetime, timedelta, timezone
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import threading
+
+from common import ProvedorToken, TokenBucket, get_db_conn, BASE_URL, positivo
+from bulk_loader import LeiturasLoader
+from json_stream import ParserLeituras, iterar_blocos, CHUNK_BYTES
+from watermark import carregar_por_janela
+from metricas import MetricasRun, lag_de_maximos
+from migracoes import aplicar_migracoes
 
 # ======================================================
 # CONFIG
 # ======================================================
-API_KEY = "QLClykq5tBlhO9ebP5PLDzKvYkyo2p3LlTVhqPxirRY="
-BASE_URL = "https://api.oriondata.io/api"
+API_KEY = os.getenv("API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 REQUEST_TIMEOUT = 30
 SENSOR_BATCH_SIZE = 50
-SLEEP_BETWEEN_CALLS = 0.3
+SLEEP_BETWEEN_CALLS = 0.3   # intervalo médio entre requests, somando todos os workers
+
+# devices processados em paralelo (cada um com sua conexão do pool)
+MAX_WORKERS = 4
 
 # fallback caso device não tenha last_upload
 FALLBACK_HORAS = 6
@@ -33,53 +43,58 @@ retries = Retry(
 )
 adapter = HTTPAdapter(max_retries=retries)
 session.mount("https://",adapter)
+session.mount("http://",adapter)
 
 # ======================================================
-# TOKEN
+# RATE LIMIT + MÉTRICAS (tabela ingest_runs)
 # ======================================================
-def obter_token():
-    r=session.get(
-        f"{BASE_URL}/token",
-        params={"apiKey":API_KEY},
-        timeout=REQUEST_TIMEOUT
-    )
-    r.raise_for_status()
-    return r.json()["token"]
+rate_limiter=TokenBucket(1/SLEEP_BETWEEN_CALLS)
+metricas=MetricasRun("ingest_incremental_ultimos_dados",rate_limiter)
+session.hooks["response"].append(metricas.registrar_resposta)
 
 # ======================================================
-# 🔥 BUSCAR DEVICES NO BANCO
+# TOKEN (cache compartilhado com os outros scripts)
 # ======================================================
-def obter_devices_db(conn):
+provedor=ProvedorToken(session,api_key=API_KEY,obter_conn=get_db_conn,rate_limiter=rate_limiter)
 
-    cur=conn.cursor()
+# ======================================================
+# CONNECTION POOL (criado no main, com --workers + 1 conexões)
+# ======================================================
+db_pool=None
+pool_lock=threading.Lock()
 
-    cur.execute("""
-        SELECT device_id,last_upload
-        FROM devices
-    """)
+def get_conn():
+    with pool_lock:
+        return db_pool.getconn()
 
-    rows=cur.fetchall()
-    cur.close()
-
-    return rows
+def release_conn(conn):
+    with pool_lock:
+        db_pool.putconn(conn)
 
 # ======================================================
-# 🔥 BUSCAR SENSORES DO DEVICE
+# 🔥 BUSCAR DEVICES E SENSORES NO BANCO (uma query)
 # ======================================================
-def obter_sensores_device(conn,device_id):
+def obter_devices_db(conn):
+    """[(device_id, last_upload, [sensor_id, ...]), ...] — lista vazia se o device não tem sensores."""
 
     cur=conn.cursor()
 
     cur.execute("""
-        SELECT sensor_id
-        FROM sensores
-        WHERE device_id=%s
-    """,(device_id,))
+        SELECT d.device_id,
+               d.last_upload,
+               COALESCE(
+                   array_agg(s.sensor_id ORDER BY s.sensor_id) FILTER (WHERE s.sensor_id IS NOT NULL),
+                   '{}'
+               )
+        FROM devices d
+        LEFT JOIN sensores s ON s.device_id=d.device_id
+        GROUP BY d.device_id,d.last_upload
+    """)
 
-    sensores=[r[0] for r in cur.fetchall()]
+    rows=cur.fetchall()
     cur.close()
 
-    return sensores
+    return rows
 
 # ======================================================
 # 🔥 CALCULAR JANELA POR DEVICE
@@ -101,9 +116,7 @@ def calcular_janela(last_upload):
 # ======================================================
 # 🔥 BAIXAR LEITURAS POR DEVICE
 # ======================================================
-def baixar_device(token,device_id,last_upload,conn):
-
-    sensores=obter_sensores_device(conn,device_id)
+def baixar_device(device_id,last_upload,sensores,conn):
 
     if not sensores:
         print(f"⚠️ Device {device_id} sem sensores")
@@ -111,11 +124,13 @@ def baixar_device(token,device_id,last_upload,conn):
 
     data_inicio,data_fim=calcular_janela(last_upload)
 
-    print(f"\n📡 Device {device_id}")
-    print(f"🕒 {data_inicio} → {data_fim}")
-
-    headers={"Authorization":f"Bearer {token}"}
     cur=conn.cursor()
+    loader=LeiturasLoader(cur)
+    maximos={}
+
+    # a janela recomeça em last_upload: o que já está gravado nela é
+    # descartado aqui, sem passar pelo ON CONFLICT
+    filtro=carregar_por_janela(cur,sensores,data_inicio)
 
     for i in range(0,len(sensores),SENSOR_BATCH_SIZE):
 
@@ -126,9 +141,11 @@ def baixar_device(token,device_id,last_upload,conn):
 
         while True:
 
-            r=session.get(
+            rate_limiter.aguardar()
+            parser=ParserLeituras(maximos)
+
+            with provedor.get(
                 f"{BASE_URL}/SensorData",
-                headers=headers,
                 params={
                     "version":"1.3",
                     "startDate":data_inicio,
@@ -136,55 +153,122 @@ def baixar_device(token,device_id,last_upload,conn):
                     "offset":offset,
                     "sensorIds":sensor_param
                 },
-                timeout=REQUEST_TIMEOUT
-            )
+                timeout=REQUEST_TIMEOUT,
+                stream=True
+            ) as r:
 
-            r.raise_for_status()
-            dados=r.json()
+                r.raise_for_status()
 
-            if not dados:
-                break
+                # página sem limite → streaming + flush por volume
+                for registros in iterar_blocos(r.iter_content(CHUNK_BYTES),parser):
 
-            registros=[
-                (d["sensorId"],d["readingDate"],d["sensorValue"])
-                for d in dados
-            ]
-
-            execute_batch(cur,"""
-                INSERT INTO leituras (
-                    sensor_id,
-                    data_leitura,
-                    valor_sensor
-                )
-                VALUES (%s,%s,%s)
-                ON CONFLICT (sensor_id,data_leitura) DO NOTHING
-            """,registros,page_size=500)
+                    loader.adicionar(filtro.filtrar(registros))
 
-            conn.commit()
+                    if loader.cheio:
+                        with metricas.fase("write"):
+                            loader.flush()
+                            conn.commit()
+
+            if not parser.qtd:
+                break
 
             offset+=1
-            time.sleep(SLEEP_BETWEEN_CALLS)
+
+    with metricas.fase("write"):
+        loader.flush()
+        conn.commit()
+
+    metricas.registrar_escrita(loader.enviadas,loader.inseridas,filtro.descartadas)
+    metricas.registrar_lag(lag_de_maximos(maximos))
+
+    # uma linha por device: com workers em paralelo as saídas se misturam
+    print(f"📡 Device {device_id} | 🕒 {data_inicio} → {data_fim} | 💾 {loader.inseridas} novas de {filtro.recebidas} leituras ({filtro.descartadas} já gravadas)")
 
     cur.close()
 
+def processar_device(device_id,last_upload,sensores):
+    conn=get_conn()
+    try:
+        baixar_device(device_id,last_upload,sensores,conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_conn(conn)
+
 # ======================================================
 # MAIN
 # ======================================================
 if __name__=="__main__":
 
-    print("🚀 Ingestão incremental por device")
-
-    conn=psycopg2.connect(DATABASE_URL)
-
-    token=obter_token()
-
-    devices=obter_devices_db(conn)
+    parser=argparse.ArgumentParser(description="Ingestão das últimas leituras por device")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help=f"Devices processados em paralelo. Padrão: {MAX_WORKERS}.",
+    )
+    parser.add_argument(
+        "--rate",
+        type=positivo(float),
+        default=1/SLEEP_BETWEEN_CALLS,
+        help=f"Requests por segundo somando todos os workers. Padrão: {1/SLEEP_BETWEEN_CALLS:g}.",
+    )
+    args=parser.parse_args()
 
-    print(f"📦 Total devices: {len(devices)}")
+    print("🚀 Ingestão incremental por device")
 
-    for device_id,last_upload in devices:
-        baixar_device(token,device_id,last_upload,conn)
+    rate_limiter.configurar(args.rate)
+    db_pool=SimpleConnectionPool(minconn=1,maxconn=args.workers+1,dsn=DATABASE_URL)
+    conn=get_conn()
+    erro=None
+
+    try:
+        with metricas.fase("metadata"):
+            # Sem as migrações sem-transacao (índices CONCURRENTLY): o workflow
+            # roda com cancel-in-progress e um build longo seria cancelado a
+            # cada run. Ficam para o ingest_incremental / migracoes.py. Se
+            # outro processo estiver migrando, segue sem esperar o lock
+            aplicar_migracoes(conn,sem_transacao=False)
+            devices=obter_devices_db(conn)
+            conn.commit()
 
-    conn.close()
+        with metricas.fase("token"):
+            provedor.token()
+
+        print(f"📦 Total devices: {len(devices)} | {args.workers} workers | {args.rate:g} req/s")
+
+        falhas=[]
+
+        # "fetch" inclui as esperas de rate limit e os flushes ("write", somado entre workers)
+        with metricas.fase("fetch"),ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures={
+                executor.submit(processar_device,device_id,last_upload,sensores):device_id
+                for device_id,last_upload,sensores in devices
+            }
+            for f in as_completed(futures):
+                try:
+                    f.result()
+                except Exception as e:
+                    falhas.append(futures[f])
+                    print(f"💥 Device {futures[f]}: {e}")
+
+        if falhas:
+            raise RuntimeError(f"{len(falhas)} devices falharam: {sorted(falhas)}")
+    except BaseException as e:
+        erro=e
+        conn.rollback()
+        raise
+    finally:
+        cur=conn.cursor()
+        try:
+            metricas.finalizar(cur,erro)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ Não foi possível gravar ingest_runs: {e}")
+        cur.close()
+        release_conn(conn)
+        db_pool.closeall()
 
     print("\n🏁 Finalizado")
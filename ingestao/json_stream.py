@@ -0,0 +1,108 @@
+import codecs
+import json
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+CHUNK_BYTES  = 64 * 1024   # leitura do socket
+BLOCO_LINHAS = 5_000       # tuplas entregues por vez ao writer
+
+# ======================================================
+# PARSER INCREMENTAL DE /SensorData
+# ======================================================
+
+class ParserLeituras:
+    """
+    Parser incremental do array JSON devolvido por /SensorData.
+
+    Recebe a resposta em pedaços de bytes (`alimentar`) e devolve as
+    tuplas (sensor_id, reading_date, valor) de cada objeto completo,
+    sem nunca montar a lista inteira em memória. No mesmo passe conta as
+    leituras (`qtd`) e acumula em `maximos` o maior readingDate por sensor.
+
+    Serve tanto para `requests` (iter_content) quanto para aiohttp
+    (iter_chunked), já que não faz I/O.
+    """
+
+    def __init__(self, maximos: dict = None):
+        self.qtd      = 0
+        self.maximos  = {} if maximos is None else maximos
+        self._utf8    = codecs.getincrementaldecoder("utf-8")()
+        self._json    = json.JSONDecoder()
+        self._buf     = ""
+        self._estado  = "inicio"   # inicio → item ⇄ separador → fim
+
+    def alimentar(self, chunk: bytes) -> list:
+        self._buf += self._utf8.decode(chunk)
+        buf       = self._buf
+        pos       = 0
+        registros = []
+        maximos   = self.maximos
+
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos >= len(buf) or self._estado == "fim":
+                break
+
+            c = buf[pos]
+            if self._estado == "inicio":
+                if c != "[":
+                    raise ValueError(f"resposta não é um array JSON: {buf[pos:pos + 40]!r}")
+                self._estado = "item"
+                pos += 1
+            elif self._estado == "separador":
+                if c == ",":
+                    self._estado = "item"
+                elif c == "]":
+                    self._estado = "fim"
+                else:
+                    raise ValueError(f"JSON inesperado após leitura: {buf[pos:pos + 40]!r}")
+                pos += 1
+            else:
+                if c == "]":
+                    self._estado = "fim"
+                    pos += 1
+                    continue
+                try:
+                    d, pos = self._json.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break   # objeto incompleto: espera o próximo chunk
+                sid, ts = d["sensorId"], d["readingDate"]
+                registros.append((sid, ts, d["sensorValue"]))
+                if sid not in maximos or ts > maximos[sid]:
+                    maximos[sid] = ts
+                self._estado = "separador"
+
+        self._buf = buf[pos:]
+        self.qtd += len(registros)
+        return registros
+
+    def finalizar(self):
+        if self._estado != "fim" or self._buf.strip():
+            raise ValueError("resposta JSON truncada ou malformada")
+
+def iterar_blocos(chunks, parser: ParserLeituras, bloco: int = BLOCO_LINHAS):
+    """Consome um iterável de bytes e entrega listas de até ~`bloco` tuplas."""
+    pendentes = []
+    for chunk in chunks:
+        pendentes.extend(parser.alimentar(chunk))
+        if len(pendentes) >= bloco:
+            yield pendentes
+            pendentes = []
+    parser.finalizar()
+    if pendentes:
+        yield pendentes
+
+async def iterar_blocos_async(chunks, parser: ParserLeituras, bloco: int = BLOCO_LINHAS):
+    """Versão de `iterar_blocos` para iteráveis assíncronos (aiohttp)."""
+    pendentes = []
+    async for chunk in chunks:
+        pendentes.extend(parser.alimentar(chunk))
+        if len(pendentes) >= bloco:
+            yield pendentes
+            pendentes = []
+    parser.finalizar()
+    if pendentes:
+        yield pendentes
@@ -0,0 +1,142 @@
+import hashlib
+import json
+
+from psycopg2.extras import execute_values
+
+# ======================================================
+# LINHAS DE devices / sensores A PARTIR DE /UserDevices
+# ======================================================
+# Única definição das colunas gravadas: ingest_incremental e sync_metadata
+# precisam gerar exatamente a mesma linha, senão o hash de um sempre
+# "muda" o que o outro gravou. A exceção é o nome de sensor do
+# ingest_incremental, que só insere sensores novos (ver
+# `sincronizar_metadados`) e por isso nunca sobrescreve o do sync_metadata.
+
+COLUNAS_DEVICES = (
+    "device_id", "device_name", "serial_number", "status",
+    "latitude", "longitude", "last_upload",
+    "battery_percentage", "last_status", "reference",
+)
+
+COLUNAS_SENSORES = (
+    "sensor_id", "device_id", "nome_customizado", "tipo_sensor", "unidade_medida",
+)
+
+def linha_device(device: dict) -> tuple:
+    return (
+        device["deviceId"], device["deviceName"],
+        device.get("serialNumber"), device.get("status"),
+        device.get("latitude"), device.get("longitude"),
+        device.get("lastUpload"), device.get("batteryPercentage"),
+        device.get("lastStatus"), device.get("reference"),
+    )
+
+def linha_sensor(device_id, sensor: dict, nome_padrao: bool = True) -> tuple:
+    nome = sensor.get("customName")
+    if nome_padrao:
+        nome = nome or f"Sensor {sensor['sensorId']}"
+    return (
+        sensor["sensorId"], device_id,
+        nome,
+        (sensor.get("sensorType") or "").strip() or None,
+        sensor.get("uom"),
+    )
+
+def hash_linha(linha: tuple) -> str:
+    return hashlib.md5(json.dumps(linha, default=str).encode()).hexdigest()
+
+# ======================================================
+# UPSERT SÓ DO QUE MUDOU
+# ======================================================
+
+def _upsert_diff(cur, tabela, colunas, linhas: list, so_insere: bool = False) -> dict:
+    """
+    Compara o hash de cada linha com o `payload_hash` gravado e faz um
+    único INSERT ... ON CONFLICT multi-linha só com as novas/alteradas.
+    Linhas iguais não são tocadas (sem tupla morta nem escrita de índice).
+    Com `so_insere`, linhas que já existem nunca são atualizadas.
+
+    Retorna {"inseridos", "atualizados", "inalterados"}.
+    """
+    pk = colunas[0]
+    cur.execute(f"SELECT {pk}, payload_hash FROM {tabela} WHERE {pk} = ANY(%s)",
+                ([l[0] for l in linhas],))
+    gravados = dict(cur.fetchall())
+
+    alteradas = []
+    for linha in linhas:
+        if so_insere and linha[0] in gravados:
+            continue
+        h = hash_linha(linha)
+        if gravados.get(linha[0]) != h:
+            alteradas.append(linha + (h,))
+
+    resultado = {"inseridos": 0, "atualizados": 0, "inalterados": len(linhas) - len(alteradas)}
+    if not alteradas:
+        return resultado
+
+    todas = colunas + ("payload_hash",)
+    if so_insere:
+        novos = execute_values(cur, f"""
+            INSERT INTO {tabela} ({", ".join(todas)})
+            VALUES %s
+            ON CONFLICT ({pk}) DO NOTHING
+            RETURNING {pk}
+        """, alteradas, page_size=len(alteradas), fetch=True)
+        resultado["inseridos"]   = len(novos)
+        resultado["inalterados"] = len(linhas) - len(novos)
+        return resultado
+
+    sets  = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in todas[1:])
+    # O WHERE protege contra outro processo ter gravado o mesmo payload
+    # entre o SELECT e aqui; (xmax = 0) distingue INSERT de UPDATE.
+    flags = execute_values(cur, f"""
+        INSERT INTO {tabela} ({", ".join(todas)})
+        VALUES %s
+        ON CONFLICT ({pk}) DO UPDATE SET
+            {sets}
+        WHERE {tabela}.payload_hash IS DISTINCT FROM EXCLUDED.payload_hash
+        RETURNING (xmax = 0)
+    """, alteradas, page_size=len(alteradas), fetch=True)
+
+    resultado["inseridos"]   = sum(1 for (novo,) in flags if novo)
+    resultado["atualizados"] = len(flags) - resultado["inseridos"]
+    resultado["inalterados"] = len(linhas) - len(flags)
+    return resultado
+
+def sincronizar_metadados(cur, devices: list, filtro_sensor=None, sensores_so_novos: bool = False) -> dict:
+    """
+    Grava devices e sensores do payload de /UserDevices, só o que mudou.
+
+    `filtro_sensor(linha)` decide quais sensores entram em `sensores`
+    (ex.: excluir tipos sem leitura útil). Com `sensores_so_novos` (o
+    ingest_incremental), sensores já cadastrados não são alterados e o
+    nome é o customName cru, como antes; nome e tipo são do
+    sync_metadata. Não faz commit.
+
+    Retorna {"devices": {...}, "sensores": {...}} com as contagens de
+    inseridos / atualizados / inalterados.
+    """
+    linhas_dev = {}
+    linhas_sen = {}
+    for device in devices:
+        linha = linha_device(device)
+        linhas_dev[linha[0]] = linha
+        for sensor in device.get("sensors", []):
+            ls = linha_sensor(device["deviceId"], sensor, nome_padrao=not sensores_so_novos)
+            if filtro_sensor is None or filtro_sensor(ls):
+                linhas_sen[ls[0]] = ls
+
+    # Dict por PK: ON CONFLICT não aceita a mesma chave duas vezes no mesmo comando
+    return {
+        "devices":  _upsert_diff(cur, "devices",  COLUNAS_DEVICES,  list(linhas_dev.values())),
+        "sensores": _upsert_diff(cur, "sensores", COLUNAS_SENSORES, list(linhas_sen.values()),
+                                 so_insere=sensores_so_novos),
+    }
+
+def imprimir_contagens(contagens: dict):
+    for tabela, c in contagens.items():
+        print(
+            f"🗂️  {tabela}: {c['inseridos']} inseridos | "
+            f"{c['atualizados']} atualizados | {c['inalterados']} inalterados"
+        )
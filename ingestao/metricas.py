@@ -0,0 +1,270 @@
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+PORTA_PROMETHEUS = 9108
+
+# ======================================================
+# LAG
+# ======================================================
+# A tabela ingest_runs vem de sql/007_tabelas_ingestao.sql
+
+def medir_lag(cur, sensor_ids) -> dict:
+    """{sensor_id: segundos entre agora (UTC) e o watermark em sync_state}."""
+    cur.execute("""
+        SELECT sensor_id, EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC') - last_timestamp)
+        FROM sync_state
+        WHERE sensor_id = ANY(%s) AND last_timestamp IS NOT NULL
+    """, (list(sensor_ids),))
+    return {sid: float(lag) for sid, lag in cur.fetchall()}
+
+def lag_de_maximos(maximos: dict) -> dict:
+    """{sensor_id: segundos} a partir do maior readingDate visto por sensor (ParserLeituras.maximos)."""
+    agora = datetime.now(timezone.utc).replace(tzinfo=None)
+    return {
+        sid: (agora - datetime.fromisoformat(ts[:19])).total_seconds()
+        for sid, ts in maximos.items()
+    }
+
+def status_refeitos(r) -> list:
+    """Status das tentativas que o urllib3 Retry refez antes desta resposta."""
+    retries = getattr(r.raw, "retries", None)
+    if not retries:
+        return []
+    return [h.status or 0 for h in retries.history]
+
+# ======================================================
+# MÉTRICAS DE UM RUN
+# ======================================================
+
+class MetricasRun:
+    """
+    Coletor de métricas de um script de ingestão, seguro entre threads.
+
+    Um objeto vive o processo inteiro; `iniciar()` abre um run e
+    `finalizar()` o fecha e grava uma linha em `ingest_runs`. No modo
+    daemon cada ciclo é um run. Contadores cumulativos (desde o início
+    do processo) alimentam o formato Prometheus (`prometheus()`).
+
+    - `fase(nome)`: context manager que soma a duração da fase
+    - `registrar_resposta`: hook de response do requests (status final e
+      os das tentativas refeitas pelo urllib3 Retry)
+    - `registrar_status`: para quem não passa pelo requests (aiohttp,
+      falha sem resposta = status 0)
+    - a espera em rate limit vem do `espera_total` do TokenBucket
+    """
+
+    def __init__(self, script, rate_limiter=None):
+        self.script        = script
+        self._rate_limiter = rate_limiter
+        self._lock         = threading.Lock()
+
+        self.total_runs      = Counter()   # "ok" / "erro"
+        self.total_status    = Counter()
+        self.total_inseridas = 0
+        self.total_conflitos = 0
+        self.total_descartes = 0
+        self.total_espera    = 0.0
+        self.ultimo          = None
+
+        self.iniciar()
+
+    def iniciar(self):
+        with self._lock:
+            self.iniciado_em  = time.time()
+            self._t0          = time.monotonic()
+            self.fases        = Counter()
+            self.status       = Counter()
+            self.enviadas     = 0
+            self.inseridas    = 0
+            self.descartadas  = 0
+            self.lag          = {}
+            self._espera_base = self._espera_acumulada()
+
+    def _espera_acumulada(self) -> float:
+        return self._rate_limiter.espera_total if self._rate_limiter else 0.0
+
+    # --------------------------------------------------
+    # COLETA
+    # --------------------------------------------------
+
+    @contextmanager
+    def fase(self, nome):
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            self.somar_fase(nome, time.monotonic() - inicio)
+
+    def somar_fase(self, nome, segundos):
+        with self._lock:
+            self.fases[nome] += segundos
+
+    def registrar_status(self, status, refeitos=()):
+        with self._lock:
+            for st in (*refeitos, status):
+                self.status[str(st)]       += 1
+                self.total_status[str(st)] += 1
+
+    def registrar_resposta(self, r, *args, **kwargs):
+        self.registrar_status(r.status_code, status_refeitos(r))
+
+    def registrar_escrita(self, enviadas, inseridas, descartadas=0):
+        """`descartadas`: barradas antes do banco pelo filtro de watermark."""
+        with self._lock:
+            self.enviadas    += enviadas
+            self.inseridas   += inseridas
+            self.descartadas += descartadas
+
+    def registrar_lag(self, lag: dict):
+        with self._lock:
+            self.lag.update(lag)
+
+    # --------------------------------------------------
+    # FECHAMENTO
+    # --------------------------------------------------
+
+    def finalizar(self, cur=None, erro=None) -> dict:
+        """Fecha o run, acumula os totais e, com `cur`, grava em ingest_runs (sem commit)."""
+        with self._lock:
+            espera = self._espera_acumulada() - self._espera_base
+            run = {
+                "script":               self.script,
+                "iniciado_em":          self.iniciado_em,
+                "duracao_s":            time.monotonic() - self._t0,
+                "sucesso":              erro is None,
+                "erro":                 None if erro is None else str(erro)[:1000],
+                "fases_s":              {k: round(v, 3) for k, v in self.fases.items()},
+                "requests_por_status":  dict(self.status),
+                "espera_rate_limit_s":  round(espera, 3),
+                "leituras_enviadas":    self.enviadas,
+                "leituras_inseridas":   self.inseridas,
+                "leituras_conflitadas": self.enviadas - self.inseridas,
+                "leituras_descartadas": self.descartadas,
+                "lag_max_s":            max(self.lag.values()) if self.lag else None,
+                "lag_por_sensor_s":     {str(k): round(v, 1) for k, v in self.lag.items()},
+            }
+
+            self.total_runs["ok" if erro is None else "erro"] += 1
+            self.total_inseridas += self.inseridas
+            self.total_conflitos += self.enviadas - self.inseridas
+            self.total_descartes += self.descartadas
+            self.total_espera    += espera
+            self._espera_base     = self._espera_acumulada()
+            self.ultimo = run
+
+        if cur is not None:
+            cur.execute("""
+                INSERT INTO ingest_runs (
+                    script, iniciado_em, duracao_s, sucesso, erro, fases_s,
+                    requests_por_status, espera_rate_limit_s, leituras_enviadas,
+                    leituras_inseridas, leituras_conflitadas, leituras_descartadas,
+                    lag_max_s, lag_por_sensor_s
+                )
+                VALUES (%s, to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                run["script"], run["iniciado_em"], run["duracao_s"], run["sucesso"],
+                run["erro"], json.dumps(run["fases_s"]), json.dumps(run["requests_por_status"]),
+                run["espera_rate_limit_s"], run["leituras_enviadas"], run["leituras_inseridas"],
+                run["leituras_conflitadas"], run["leituras_descartadas"],
+                run["lag_max_s"], json.dumps(run["lag_por_sensor_s"]),
+            ))
+
+        fases = " | ".join(f"{k} {v:.1f}s" for k, v in run["fases_s"].items())
+        print(
+            f"📏 Run em {run['duracao_s']:.1f}s ({fases}) | rate limit {espera:.1f}s | "
+            f"requests {run['requests_por_status']} | "
+            f"{run['leituras_inseridas']} inseridas / {run['leituras_conflitadas']} conflitadas / "
+            f"{run['leituras_descartadas']} descartadas antes do banco"
+        )
+        return run
+
+    # --------------------------------------------------
+    # PROMETHEUS
+    # --------------------------------------------------
+
+    def prometheus(self) -> str:
+        """Contadores cumulativos e o último run no formato texto do Prometheus."""
+        s = f'script="{self.script}"'
+        linhas = []
+
+        def metrica(nome, tipo, ajuda, amostras):
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for rotulos, valor in amostras:
+                rot = ",".join(filter(None, (s, rotulos)))
+                linhas.append(f"{nome}{{{rot}}} {valor}")
+
+        with self._lock:
+            espera_atual = self._espera_acumulada() - self._espera_base
+            metrica("orion_ingest_runs_total", "counter", "Runs finalizados por resultado.",
+                    [(f'resultado="{k}"', v) for k, v in sorted(self.total_runs.items())])
+            metrica("orion_ingest_requests_total", "counter", "Respostas da API por status (0 = sem resposta).",
+                    [(f'status="{k}"', v) for k, v in sorted(self.total_status.items())])
+            metrica("orion_ingest_rate_limit_espera_segundos_total", "counter",
+                    "Tempo dormido no token bucket.",
+                    [("", round(self.total_espera + espera_atual, 3))])
+            metrica("orion_ingest_leituras_inseridas_total", "counter", "Leituras novas gravadas.",
+                    [("", self.total_inseridas)])
+            metrica("orion_ingest_leituras_conflitadas_total", "counter",
+                    "Leituras recebidas que já existiam (ON CONFLICT).",
+                    [("", self.total_conflitos)])
+            metrica("orion_ingest_leituras_descartadas_total", "counter",
+                    "Leituras barradas pelo filtro de watermark antes do banco.",
+                    [("", self.total_descartes)])
+
+            if self.ultimo:
+                u = self.ultimo
+                metrica("orion_ingest_ultimo_run_timestamp_segundos", "gauge", "Início do último run (epoch).",
+                        [("", round(u["iniciado_em"], 3))])
+                metrica("orion_ingest_ultimo_run_duracao_segundos", "gauge", "Duração do último run.",
+                        [("", round(u["duracao_s"], 3))])
+                metrica("orion_ingest_ultimo_run_sucesso", "gauge", "1 se o último run terminou sem erro.",
+                        [("", int(u["sucesso"]))])
+                metrica("orion_ingest_fase_segundos", "gauge", "Duração de cada fase no último run.",
+                        [(f'fase="{k}"', v) for k, v in sorted(u["fases_s"].items())])
+                if u["lag_max_s"] is not None:
+                    metrica("orion_ingest_lag_max_segundos", "gauge",
+                            "Maior atraso entre agora e o watermark de um sensor.",
+                            [("", round(u["lag_max_s"], 1))])
+                    metrica("orion_ingest_sensor_lag_segundos", "gauge",
+                            "Atraso entre agora e o watermark de cada sensor.",
+                            [(f'sensor_id="{k}"', v) for k, v in sorted(u["lag_por_sensor_s"].items())])
+
+        return "\n".join(linhas) + "\n"
+
+# ======================================================
+# EXPORTADOR HTTP (/metrics)
+# ======================================================
+
+def servir_prometheus(metricas: MetricasRun, porta: int = PORTA_PROMETHEUS, host: str = "0.0.0.0"):
+    """Sobe GET /metrics numa thread daemon e devolve o servidor."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = metricas.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+    srv = ThreadingHTTPServer((host, porta), Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="prometheus", daemon=True).start()
+    print(f"📈 Métricas Prometheus em http://{host}:{porta}/metrics")
+    return srv
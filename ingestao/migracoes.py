@@ -0,0 +1,216 @@
+"""
+Migrações versionadas do schema: arquivos `sql/NNN_nome.sql`, aplicados
+em ordem, cada um na sua transação junto com o registro em
+`schema_migrations`. Um arquivo aplicado não é reexecutado — mudança
+nova é sempre um arquivo novo.
+
+Arquivo que começa com `-- migracoes: sem-transacao` (CREATE INDEX
+CONCURRENTLY) roda depois das demais, em autocommit, comando a comando,
+e só é registrado no fim. Roda FORA do advisory lock das migrações: o
+CIC espera todo snapshot mais antigo, e um processo parado em
+pg_advisory_lock tem um — com o lock preso durante o build, os dois se
+esperariam até o detector de deadlock abortar o índice. No lugar dele,
+um segundo lock só dos índices, pego com try: quem não consegue segue
+sem eles. Interrompido, o build deixa o índice inválido, que a próxima
+aplicação descarta e refaz. Esses arquivos só podem criar índices:
+nenhuma outra migração pode depender deles.
+
+    python migracoes.py            # aplica as pendentes
+    python migracoes.py --status   # lista aplicadas e pendentes
+"""
+import argparse
+import os
+import re
+
+from common import get_db_conn
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+DIR_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql")
+
+_ARQUIVO = re.compile(r"^(\d{3})_(\w+)\.sql$")
+
+# Chave do advisory lock: dois processos subindo juntos não aplicam a mesma migração
+_LOCK = 0x6f72696f6e   # "orion"
+# Só dos arquivos sem-transacao, nunca esperado (pg_try_advisory_lock)
+_LOCK_INDICES = _LOCK + 1
+
+_SEM_TRANSACAO = "-- migracoes: sem-transacao"
+_INDICE_CONCORRENTE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+# ======================================================
+# MIGRAÇÕES
+# ======================================================
+
+def listar_migracoes(diretorio: str = DIR_SQL) -> list:
+    """[(versao, nome, caminho), ...] em ordem de versão."""
+    migracoes = []
+    for arquivo in os.listdir(diretorio):
+        m = _ARQUIVO.match(arquivo)
+        if m:
+            migracoes.append((int(m.group(1)), m.group(2), os.path.join(diretorio, arquivo)))
+    migracoes.sort()
+
+    versoes = [v for v, _, _ in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise RuntimeError(f"versões repetidas em {diretorio}")
+    return migracoes
+
+def garantir_tabela_versao(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versao      INTEGER PRIMARY KEY,
+            nome        TEXT        NOT NULL,
+            aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+def versoes_aplicadas(cur) -> set:
+    cur.execute("SELECT versao FROM schema_migrations")
+    return {r[0] for r in cur.fetchall()}
+
+def _comandos(corpo: str) -> list:
+    """Comandos de um arquivo sem-transacao (sem comentários; um por `;`)."""
+    linhas = [l for l in corpo.splitlines() if not l.lstrip().startswith("--")]
+    return [c.strip() for c in "\n".join(linhas).split(";") if c.strip()]
+
+def _aplicar_sem_transacao(conn, cur, corpo: str):
+    conn.autocommit = True
+    try:
+        for comando in _comandos(corpo):
+            m = _INDICE_CONCORRENTE.match(comando)
+            if m:
+                # Build CONCURRENTLY interrompido deixa o índice inválido, e o
+                # IF NOT EXISTS o pularia para sempre
+                cur.execute("""
+                    SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)
+                """, (m.group(1),))
+                invalido = cur.fetchone()
+                if invalido and invalido[0]:
+                    print(f"🧹 Índice {m.group(1)} inválido (build interrompido): refazendo")
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {m.group(1)}")
+            cur.execute(comando)
+    finally:
+        conn.autocommit = False
+
+def _aplicar_adiada(conn, cur, versao: int, nome: str, corpo: str) -> bool:
+    """Aplica um arquivo sem-transacao se ninguém mais o estiver aplicando."""
+    cur.execute("SELECT pg_try_advisory_lock(%s)", (_LOCK_INDICES,))
+    if not cur.fetchone()[0]:
+        conn.commit()
+        print(f"⏭️  Migração {versao:03d}_{nome} (sem-transacao) em andamento em outro processo")
+        return False
+    try:
+        # Outro processo pode tê-la terminado depois da nossa leitura
+        ja_aplicada = versao in versoes_aplicadas(cur)
+        conn.commit()
+        if ja_aplicada:
+            return False
+        try:
+            _aplicar_sem_transacao(conn, cur, corpo)
+            cur.execute(
+                "INSERT INTO schema_migrations (versao, nome) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                (versao, nome),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"💥 Migração {versao:03d}_{nome} falhou")
+            raise
+        print(f"🗃️  Migração {versao:03d}_{nome} aplicada")
+        return True
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_INDICES,))
+        conn.commit()
+
+def aplicar_migracoes(conn, diretorio: str = DIR_SQL, sem_transacao: bool = True) -> list:
+    """
+    Aplica as migrações pendentes, uma transação cada. Devolve as versões
+    aplicadas. Com `sem_transacao=False`, as migrações sem-transacao
+    (índices CONCURRENTLY, que podem demorar) ficam para outro processo,
+    e se outro processo estiver aplicando migrações nenhuma é aplicada
+    (sem esperar o lock).
+    """
+    cur = conn.cursor()
+    if sem_transacao:
+        cur.execute("SELECT pg_advisory_lock(%s)", (_LOCK,))
+    else:
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (_LOCK,))
+        if not cur.fetchone()[0]:
+            conn.commit()
+            cur.close()
+            print("⏭️  Migrações em andamento em outro processo; seguindo sem aplicá-las")
+            return []
+
+    novas   = []
+    adiadas = []
+    try:
+        garantir_tabela_versao(cur)
+        conn.commit()
+
+        aplicadas = versoes_aplicadas(cur)
+        conn.commit()
+        for versao, nome, caminho in listar_migracoes(diretorio):
+            if versao in aplicadas:
+                continue
+            with open(caminho, encoding="utf-8") as f:
+                corpo = f.read()
+            if corpo.startswith(_SEM_TRANSACAO):
+                if sem_transacao:
+                    adiadas.append((versao, nome, corpo))
+                else:
+                    print(f"⏭️  Migração {versao:03d}_{nome} (sem-transacao) adiada")
+                continue
+            try:
+                cur.execute(corpo)
+                cur.execute(
+                    "INSERT INTO schema_migrations (versao, nome) VALUES (%s, %s)",
+                    (versao, nome),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"💥 Migração {versao:03d}_{nome} falhou")
+                raise
+            print(f"🗃️  Migração {versao:03d}_{nome} aplicada")
+            novas.append(versao)
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK,))
+        conn.commit()
+
+    try:
+        for versao, nome, corpo in adiadas:
+            if _aplicar_adiada(conn, cur, versao, nome, corpo):
+                novas.append(versao)
+    finally:
+        cur.close()
+    return sorted(novas)
+
+# ======================================================
+# MAIN
+# ======================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrações versionadas do schema (sql/NNN_*.sql)")
+    parser.add_argument("--status", action="store_true", help="Lista aplicadas e pendentes e sai.")
+    args = parser.parse_args()
+
+    conn = get_db_conn()
+
+    if args.status:
+        cur = conn.cursor()
+        garantir_tabela_versao(cur)
+        aplicadas = versoes_aplicadas(cur)
+        conn.commit()
+        cur.close()
+        for versao, nome, _ in listar_migracoes():
+            marca = "✅" if versao in aplicadas else "⏳"
+            print(f"  {marca} {versao:03d}_{nome}")
+    else:
+        novas = aplicar_migracoes(conn)
+        print(f"✅ Schema em dia ({len(novas)} migrações aplicadas agora)")
+
+    conn.close()
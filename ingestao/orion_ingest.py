@@ -2,11 +2,15 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 import os
+from datetime import date, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 
+# Mesmos limites de resolução do app (ingestao/app/resolucao.py)
+from app.resolucao import escolher_resolucao
+
 # ===============================
 # AUTENTICAÇÃO
 # ===============================
@@ -49,6 +53,9 @@ if not MAPBOX_TOKEN:
 
 ARQUIVO_CACHE = "cache_orion_dev.csv"
 
+# Período padrão ao abrir o painel (dias até hoje)
+DIAS_PADRAO = 30
+
 st.set_page_config(
     page_title="Gestão Geotécnica Orion",
     layout="wide",
@@ -75,15 +82,27 @@ if st.sidebar.button("🔄 Atualizar dados"):
     st.cache_data.clear()
     st.rerun()
 
+# ===============================
+# PERÍODO
+# ===============================
+# Escolhido antes da carga: o banco só lê as partições do período
+st.sidebar.subheader("📅 Período de Análise")
+
+c1, c2 = st.sidebar.columns(2)
+data_ini = c1.date_input("Data inicial", date.today() - timedelta(days=DIAS_PADRAO))
+data_fim = c2.date_input("Data final", date.today())
+st.sidebar.caption(f"Resolução: {escolher_resolucao(data_ini, data_fim)[3]}")
+
 # ===============================
 # CARGA DO BANCO (CORRIGIDA)
 # ===============================
 @st.cache_data(ttl=300)
-def carregar_dados_db():
-    query = """
+def carregar_dados_db(desde, ate):
+    tabela, col_tempo, col_valor, _ = escolher_resolucao(desde, ate)
+    query = text(f"""
     SELECT 
-        l.data_leitura,
-        l.valor_sensor,
+        l.{col_tempo} AS data_leitura,
+        l.{col_valor} AS valor_sensor,
         s.sensor_id,
         s.tipo_sensor,
         d.device_name,
@@ -92,14 +111,40 @@ def carregar_dados_db():
         d.status,
         d.battery_percentage,
         d.last_upload
-    FROM leituras l
+    FROM {tabela} l
     INNER JOIN sensores s ON l.sensor_id = s.sensor_id
     INNER JOIN devices d ON s.device_id = d.device_id
     WHERE s.tipo_sensor IN (
         'A-Axis Delta Angle',
         'B-Axis Delta Angle'
     )
-    ORDER BY l.data_leitura
+      AND l.{col_tempo} >= :desde
+      AND l.{col_tempo} <  :ate
+    ORDER BY l.{col_tempo}
+    """)
+    return pd.read_sql(query, engine, params={"desde": desde, "ate": ate + timedelta(days=1)})
+
+@st.cache_data(ttl=300)
+def carregar_ultimas_db():
+    # Uma linha por device a partir de leituras_ultimas (mantida pela
+    # ingestão): cabeçalho e mapa sem depender do período carregado
+    query = """
+    SELECT 
+        d.device_name,
+        d.latitude,
+        d.longitude,
+        d.status,
+        d.battery_percentage,
+        d.last_upload,
+        MAX(u.data_leitura) AS data_leitura
+    FROM devices d
+    INNER JOIN sensores s ON s.device_id = d.device_id
+    INNER JOIN leituras_ultimas u ON u.sensor_id = s.sensor_id
+    WHERE s.tipo_sensor IN (
+        'A-Axis Delta Angle',
+        'B-Axis Delta Angle'
+    )
+    GROUP BY d.device_id
     """
     return pd.read_sql(query, engine)
 
@@ -108,9 +153,11 @@ def carregar_dados_db():
 # ===============================
 if modo_dev and os.path.exists(ARQUIVO_CACHE):
     df = pd.read_csv(ARQUIVO_CACHE)
+    df_ultimas = None
 else:
-    df = carregar_dados_db()
+    df = carregar_dados_db(data_ini, data_fim)
     df.to_csv(ARQUIVO_CACHE, index=False)
+    df_ultimas = carregar_ultimas_db()
 
 if df.empty:
     st.warning("Nenhum dado encontrado")
@@ -123,6 +170,13 @@ df["data_leitura"] = pd.to_datetime(df["data_leitura"], errors="coerce").dt.tz_l
 df["last_upload"] = pd.to_datetime(df["last_upload"], errors="coerce")
 df["battery_percentage"] = pd.to_numeric(df["battery_percentage"], errors="coerce")
 
+if df_ultimas is None:
+    # Modo desenvolvimento: sem banco, a última linha de cada device no CSV
+    df_ultimas = df.sort_values("data_leitura").groupby("device_name").last().reset_index()
+df_ultimas["data_leitura"] = pd.to_datetime(df_ultimas["data_leitura"], errors="coerce").dt.tz_localize(None)
+df_ultimas["last_upload"] = pd.to_datetime(df_ultimas["last_upload"], errors="coerce")
+df_ultimas["battery_percentage"] = pd.to_numeric(df_ultimas["battery_percentage"], errors="coerce")
+
 # ===============================
 # FILTROS
 # ===============================
@@ -180,18 +234,8 @@ devices_selecionados = list(
     dict.fromkeys([device_principal] + [device_label_map[l] for l in outros_labels])
 )
 
-# ===============================
-# PERÍODO
-# ===============================
-st.sidebar.subheader("📅 Período de Análise")
-
-data_min = df_tipo["data_leitura"].min().date()
-data_max = df_tipo["data_leitura"].max().date()
-
-c1, c2 = st.sidebar.columns(2)
-data_ini = c1.date_input("Data inicial", data_min)
-data_fim = c2.date_input("Data final", data_max)
-
+# Filtro de período repetido aqui para o CSV do modo desenvolvimento,
+# que pode ter sido gravado com outro período
 df_final = df_tipo[
     (df_tipo["device_name"].isin(devices_selecionados)) &
     (df_tipo["data_leitura"] >= pd.to_datetime(data_ini)) &
@@ -226,7 +270,11 @@ else:
 # ===============================
 # HEADER
 # ===============================
-info = df_final.sort_values("data_leitura").iloc[-1]
+df_ultimas_sel = df_ultimas[df_ultimas["device_name"].isin(devices_selecionados)]
+if df_ultimas_sel.empty:
+    df_ultimas_sel = df_final
+
+info = df_ultimas_sel.sort_values("data_leitura").iloc[-1]
 
 status = str(info["status"]).lower()
 bateria = int(info["battery_percentage"]) if pd.notna(info["battery_percentage"]) else 0
@@ -257,7 +305,7 @@ st.plotly_chart(fig, use_container_width=True)
 # ===============================
 st.subheader("🛰️ Localização dos Dispositivos")
 
-df_mapa = df_final[
+df_mapa = df_ultimas_sel[
     ["device_name", "latitude", "longitude", "status"]
 ].drop_duplicates().dropna(subset=["latitude", "longitude"])
 
@@ -0,0 +1,334 @@
+"""
+Particionamento mensal de `leituras` por data_leitura (RANGE).
+
+    python particionamento.py --status
+    python particionamento.py --migrar                # tabela comum → particionada
+    python particionamento.py --criar-futuras         # o garantir_schema já faz
+    python particionamento.py --desanexar-ate 2026-01 [--arquivar /caminho]
+
+A migração copia mês a mês para `leituras_part` e confere a contagem de
+cada mês fora de qualquer lock (commit por mês; meses conferidos ficam em
+`leituras_migracao` e uma nova execução os pula). Só no fim, sob lock,
+recopia e reconfere os últimos DELTA_MESES meses e troca os nomes. A
+tabela antiga fica como `leituras_antiga` para conferência. Pause o
+backfill durante a migração: meses mais antigos que o delta não são
+recopiados.
+"""
+import argparse
+import gzip
+import os
+from datetime import date, datetime, timezone
+
+from psycopg2 import sql
+
+from common import get_db_conn
+from migracoes import aplicar_migracoes
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+TABELA       = "leituras"
+MESES_FUTUROS = 3   # partições criadas à frente do mês corrente
+DELTA_MESES  = 2    # meses recopiados sob lock na troca de nomes
+
+# ======================================================
+# MESES / NOMES
+# ======================================================
+
+def _mes(d) -> date:
+    return date(d.year, d.month, 1)
+
+def _somar_meses(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def nome_particao(mes: date, tabela: str = TABELA) -> str:
+    return f"{tabela}_y{mes.year}m{mes.month:02d}"
+
+def _parse_mes(texto: str) -> date:
+    return datetime.strptime(texto, "%Y-%m").date()
+
+# ======================================================
+# ESTADO
+# ======================================================
+
+def particionada(cur, tabela: str = TABELA) -> bool:
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.oid = to_regclass(%s)
+        )
+    """, (tabela,))
+    return cur.fetchone()[0]
+
+def listar_particoes(cur, tabela: str = TABELA) -> list:
+    """[(nome, limites), ...] das partições anexadas, em ordem de nome."""
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname
+    """, (tabela,))
+    return cur.fetchall()
+
+# ======================================================
+# CRIAÇÃO DE PARTIÇÕES
+# ======================================================
+
+def criar_particao(cur, mes: date, tabela: str = TABELA):
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {} PARTITION OF {}
+        FOR VALUES FROM (%s) TO (%s)
+    """).format(sql.Identifier(nome_particao(mes, tabela)), sql.Identifier(tabela)),
+        (mes, _somar_meses(mes, 1)))
+
+def criar_default(cur, tabela: str = TABELA):
+    """Rede de segurança para datas fora das partições mensais."""
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT").format(
+        sql.Identifier(f"{tabela}_default"), sql.Identifier(tabela)))
+
+def _criar_particao_da_default(cur, mes: date, tabela: str = TABELA) -> int:
+    """
+    Cria a partição de `mes` levando para ela as linhas do intervalo que
+    já caíram na DEFAULT (logger com relógio adiantado, por exemplo):
+    com elas lá, CREATE TABLE ... PARTITION OF falharia. Devolve quantas
+    linhas moveu.
+    """
+    nome    = nome_particao(mes, tabela)
+    default = f"{tabela}_default"
+    ate     = _somar_meses(mes, 1)
+
+    cur.execute("SELECT to_regclass(%s) IS NULL, to_regclass(%s) IS NOT NULL", (nome, default))
+    falta, tem_default = cur.fetchone()
+    if not falta:
+        return 0
+    com_linhas = False
+    if tem_default:
+        cur.execute(sql.SQL("""
+            SELECT EXISTS (SELECT 1 FROM {} WHERE data_leitura >= %s AND data_leitura < %s)
+        """).format(sql.Identifier(default)), (mes, ate))
+        com_linhas = cur.fetchone()[0]
+    if not com_linhas:
+        criar_particao(cur, mes, tabela)
+        return 0
+
+    cur.execute(sql.SQL("""
+        CREATE TABLE {nome} (LIKE {tabela} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    """).format(nome=sql.Identifier(nome), tabela=sql.Identifier(tabela)))
+    cur.execute(sql.SQL("""
+        WITH movidas AS (
+            DELETE FROM {default}
+            WHERE data_leitura >= %s AND data_leitura < %s
+            RETURNING *
+        )
+        INSERT INTO {nome} SELECT * FROM movidas
+    """).format(default=sql.Identifier(default), nome=sql.Identifier(nome)), (mes, ate))
+    movidas = cur.rowcount
+    cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)").format(
+        sql.Identifier(tabela), sql.Identifier(nome)), (mes, ate))
+    print(f"🧱 {nome}: {movidas} linhas movidas da {default}")
+    return movidas
+
+def garantir_particoes(cur, meses_futuros: int = MESES_FUTUROS, tabela: str = TABELA) -> bool:
+    """
+    Cria as partições do mês corrente até `meses_futuros` à frente. Não
+    faz nada (e devolve False) se `leituras` ainda não foi migrada.
+    Não faz commit.
+
+    Linhas do intervalo que já estejam na DEFAULT são movidas para a
+    partição nova. Se ainda assim um mês falhar, o erro é logado e os
+    demais seguem: a ingestão não pode parar por causa de partição futura.
+    """
+    if not particionada(cur, tabela):
+        return False
+
+    atual = _mes(datetime.now(timezone.utc))
+    for i in range(meses_futuros + 1):
+        mes = _somar_meses(atual, i)
+        cur.execute("SAVEPOINT garantir_particao")
+        try:
+            _criar_particao_da_default(cur, mes, tabela)
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT garantir_particao")
+            print(f"⚠️  Partição {nome_particao(mes, tabela)} não criada: {e}")
+        cur.execute("RELEASE SAVEPOINT garantir_particao")
+    return True
+
+# ======================================================
+# MIGRAÇÃO
+# ======================================================
+
+def _contar(cur, tabela: str, desde: date, ate: date = None) -> int:
+    consulta = sql.SQL("SELECT COUNT(*) FROM {} WHERE data_leitura >= %s").format(sql.Identifier(tabela))
+    params   = [desde]
+    if ate is not None:
+        consulta += sql.SQL(" AND data_leitura < %s")
+        params.append(ate)
+    cur.execute(consulta, params)
+    return cur.fetchone()[0]
+
+def _meses_conferidos(cur) -> set:
+    cur.execute("SELECT mes FROM leituras_migracao")
+    return {r[0] for r in cur.fetchall()}
+
+def migrar(conn, tabela: str = TABELA):
+    aplicar_migracoes(conn)
+    cur  = conn.cursor()
+    nova = f"{tabela}_part"
+
+    if particionada(cur, tabela):
+        print(f"✅ {tabela} já é particionada")
+        return
+
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {nova} (
+            LIKE {tabela} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES
+        ) PARTITION BY RANGE (data_leitura)
+    """).format(nova=sql.Identifier(nova), tabela=sql.Identifier(tabela)))
+
+    cur.execute(sql.SQL("SELECT MIN(data_leitura) FROM {}").format(sql.Identifier(tabela)))
+    minimo = cur.fetchone()[0] or datetime.now(timezone.utc)
+
+    atual  = _mes(datetime.now(timezone.utc))
+    inicio = _mes(minimo)
+    meses  = []
+    mes    = inicio
+    while mes <= _somar_meses(atual, MESES_FUTUROS):
+        criar_particao(cur, mes, nova)
+        meses.append(mes)
+        mes = _somar_meses(mes, 1)
+    criar_default(cur, nova)
+    conn.commit()
+    print(f"🧱 {nova}: {len(meses)} partições mensais desde {inicio:%Y-%m}")
+
+    # Cópia mês a mês, um commit por mês, cada um conferido sem lock e
+    # registrado em leituras_migracao: interrompida, é só rodar de novo
+    conferidos = _meses_conferidos(cur)
+    for mes in meses:
+        if mes > atual:
+            break
+        if mes in conferidos:
+            print(f"  ⏭️  {mes:%Y-%m}: já copiado e conferido")
+            continue
+        ate = _somar_meses(mes, 1)
+        cur.execute(sql.SQL("""
+            INSERT INTO {nova} SELECT * FROM {tabela}
+            WHERE data_leitura >= %s AND data_leitura < %s
+            ON CONFLICT DO NOTHING
+        """).format(nova=sql.Identifier(nova), tabela=sql.Identifier(tabela)), (mes, ate))
+        copiadas = cur.rowcount
+
+        n_antiga = _contar(cur, tabela, mes, ate)
+        n_nova   = _contar(cur, nova, mes, ate)
+        if n_nova < n_antiga:
+            conn.rollback()
+            raise RuntimeError(f"{mes:%Y-%m}: contagem divergente ({n_nova} < {n_antiga}); nada foi trocado")
+        cur.execute(
+            "INSERT INTO leituras_migracao (mes, linhas) VALUES (%s, %s) ON CONFLICT (mes) DO NOTHING",
+            (mes, n_nova),
+        )
+        conn.commit()
+        print(f"  📦 {mes:%Y-%m}: {copiadas} linhas copiadas, {n_nova} conferidas")
+
+    # Troca: bloqueia escrita, recopia e reconfere só o delta recente e renomeia
+    delta = _somar_meses(atual, -DELTA_MESES)
+    cur.execute(sql.SQL("LOCK TABLE {} IN EXCLUSIVE MODE").format(sql.Identifier(tabela)))
+    cur.execute(sql.SQL("""
+        INSERT INTO {nova} SELECT * FROM {tabela}
+        WHERE data_leitura >= %s
+        ON CONFLICT DO NOTHING
+    """).format(nova=sql.Identifier(nova), tabela=sql.Identifier(tabela)), (delta,))
+    print(f"  🔁 delta desde {delta:%Y-%m}: {cur.rowcount} linhas")
+
+    n_antiga = _contar(cur, tabela, delta)
+    n_nova   = _contar(cur, nova, delta)
+    if n_nova < n_antiga:
+        conn.rollback()
+        raise RuntimeError(f"delta: contagem divergente ({n_nova} < {n_antiga}); nada foi trocado")
+
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+        sql.Identifier(tabela), sql.Identifier(f"{tabela}_antiga")))
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+        sql.Identifier(nova), sql.Identifier(tabela)))
+    conn.commit()
+    cur.close()
+    print(f"✅ {tabela} particionada. A original ficou em {tabela}_antiga.")
+
+# ======================================================
+# DESANEXAR / ARQUIVAR
+# ======================================================
+
+def desanexar_ate(conn, ate: date, destino: str = None, tabela: str = TABELA):
+    """
+    Desanexa as partições mensais anteriores a `ate` (só metadados, sem
+    reescrever dados). Com `destino`, exporta cada uma para CSV gzip e a
+    remove; sem, ela segue consultável como tabela avulsa.
+    """
+    cur = conn.cursor()
+    for nome, _ in listar_particoes(cur, tabela):
+        prefixo = f"{tabela}_y"
+        if not nome.startswith(prefixo):
+            continue   # DEFAULT
+        mes = date(int(nome[len(prefixo):len(prefixo) + 4]), int(nome[-2:]), 1)
+        if mes >= ate:
+            continue
+
+        cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+            sql.Identifier(tabela), sql.Identifier(nome)))
+        conn.commit()
+        print(f"✂️  {nome} desanexada")
+
+        if destino:
+            caminho = os.path.join(destino, f"{nome}.csv.gz")
+            with gzip.open(caminho, "wb") as f:
+                cur.copy_expert(
+                    sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(
+                        sql.Identifier(nome)).as_string(conn),
+                    f,
+                )
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(nome)))
+            conn.commit()
+            print(f"  🗄️  arquivada em {caminho} e removida")
+    cur.close()
+
+# ======================================================
+# MAIN
+# ======================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Particionamento mensal de leituras")
+    acao = parser.add_mutually_exclusive_group(required=True)
+    acao.add_argument("--status", action="store_true", help="Lista as partições e sai.")
+    acao.add_argument("--migrar", action="store_true", help="Converte leituras em tabela particionada.")
+    acao.add_argument("--criar-futuras", action="store_true",
+                      help=f"Cria as partições até {MESES_FUTUROS} meses à frente.")
+    acao.add_argument("--desanexar-ate", metavar="AAAA-MM",
+                      help="Desanexa as partições anteriores a este mês.")
+    parser.add_argument("--arquivar", metavar="DIR",
+                        help="Com --desanexar-ate: exporta cada partição para DIR (CSV gzip) e a remove.")
+    args = parser.parse_args()
+
+    conn = get_db_conn()
+    cur  = conn.cursor()
+
+    if args.status:
+        if not particionada(cur):
+            print(f"ℹ️  {TABELA} não é particionada (rode --migrar)")
+        for nome, limites in listar_particoes(cur):
+            print(f"  {nome:<24} {limites}")
+    elif args.migrar:
+        migrar(conn)
+    elif args.criar_futuras:
+        if garantir_particoes(cur):
+            conn.commit()
+            print("✅ Partições futuras garantidas")
+        else:
+            print(f"ℹ️  {TABELA} não é particionada (rode --migrar)")
+    else:
+        desanexar_ate(conn, _parse_mes(args.desanexar_ate), args.arquivar)
+
+    cur.close()
+    conn.close()
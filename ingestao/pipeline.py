@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+
+from psycopg2 import errors
+
+from bulk_loader import LeiturasLoader
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+N_WRITERS      = 1        # threads gravando no banco (1 conexão cada)
+TAMANHO_FILA   = 64       # páginas em espera por writer antes do backpressure
+FLUSH_LINHAS   = 20_000   # flush por volume...
+FLUSH_SEGUNDOS = 5.0      # ...ou por tempo desde o último commit
+
+# Conflitos transitórios com outro writer: o lote é refeito uma vez
+ERROS_TRANSITORIOS = (errors.DeadlockDetected, errors.SerializationFailure)
+
+_FIM = object()
+
+# ======================================================
+# PIPELINE FETCH → ESCRITA
+# ======================================================
+
+class PipelineEscrita:
+    """
+    Desacopla o download (produtores) da gravação (writers).
+
+    Os fetchers chamam `enviar()` com as leituras de uma página e/ou
+    funções `apos_gravar(cur)` (ex.: avançar cursores). Cada writer tem
+    a sua fila limitada e a sua conexão, junta páginas de vários lotes e
+    grava tudo numa transação só — COPY + merge, depois os `apos_gravar`,
+    depois commit — quando passa de FLUSH_LINHAS ou de FLUSH_SEGUNDOS.
+
+    Garantias:
+    - Fila cheia bloqueia o produtor: se o banco atrasar, o download espera
+    - Itens com a mesma `chave` vão sempre para o mesmo writer, em ordem,
+      então um `apos_gravar` nunca é commitado antes das páginas que o
+      precederam na mesma chave
+    - Deadlock ou falha de serialização num flush: o lote é refeito uma
+      vez (COPY, merge e `apos_gravar` são idempotentes)
+    - Se um flush falhar de vez, ou o writer não conseguir conexão, ele
+      descarta o resto (sem commitar mais nada) e `falhou` fica True; a
+      próxima execução repete as janelas
+    """
+
+    def __init__(self, get_conn, release_conn, n_writers: int = N_WRITERS,
+                 tamanho_fila: int = TAMANHO_FILA, flush_linhas: int = FLUSH_LINHAS,
+                 flush_segundos: float = FLUSH_SEGUNDOS):
+        self._get_conn       = get_conn
+        self._release_conn   = release_conn
+        self._flush_linhas   = flush_linhas
+        self._flush_segundos = flush_segundos
+        self._filas          = [queue.Queue(maxsize=tamanho_fila) for _ in range(n_writers)]
+        self._lock           = threading.Lock()
+
+        self.enviadas  = 0
+        self.inseridas = 0
+        self.commits   = 0
+        self.segundos  = 0.0   # soma do tempo gasto em flush pelos writers
+        self.erros     = []
+
+        self._threads = [
+            threading.Thread(target=self._writer, args=(fila,), name=f"writer-{i}", daemon=True)
+            for i, fila in enumerate(self._filas)
+        ]
+        for t in self._threads:
+            t.start()
+
+    @property
+    def falhou(self) -> bool:
+        return bool(self.erros)
+
+    def enviar(self, chave, registros=(), apos_gravar=()):
+        """Enfileira uma página e/ou ações pós-gravação. Bloqueia se a fila estiver cheia."""
+        fila = self._filas[hash(chave) % len(self._filas)]
+        fila.put((list(registros), list(apos_gravar)))
+
+    def fechar(self):
+        """Sinaliza fim, espera os writers gravarem o que resta e devolve o total inserido."""
+        for fila in self._filas:
+            fila.put(_FIM)
+        for t in self._threads:
+            t.join()
+        return self.inseridas
+
+    # --------------------------------------------------
+    # WRITER
+    # --------------------------------------------------
+
+    def _registrar_erro(self, e, contexto: str):
+        with self._lock:
+            self.erros.append(e)
+        print(f"  💥 Writer {threading.current_thread().name}: {contexto} ({e}); descartando o restante")
+
+    def _writer(self, fila):
+        conn = cur = loader = None
+        acoes  = []
+        inicio = time.monotonic()
+
+        # Sem conexão o writer segue só drenando a fila: produtores
+        # bloqueados em enviar() e o fechar() não podem ficar presos
+        try:
+            conn   = self._get_conn()
+            cur    = conn.cursor()
+            loader = LeiturasLoader(cur, flush_linhas=self._flush_linhas)
+        except Exception as e:
+            self._registrar_erro(e, "sem conexão com o banco")
+
+        try:
+            while True:
+                try:
+                    item = fila.get(timeout=self._flush_segundos)
+                except queue.Empty:
+                    item = None
+
+                if item is _FIM:
+                    break
+
+                if self.falhou:
+                    continue   # só drena a fila para não travar os produtores
+
+                if item is not None:
+                    registros, apos_gravar = item
+                    loader.adicionar(registros)
+                    acoes.extend(apos_gravar)
+
+                vencido = time.monotonic() - inicio >= self._flush_segundos
+                if loader.cheio or ((loader.pendentes or acoes) and vencido):
+                    self._flush(conn, cur, loader, acoes)
+                    acoes  = []
+                    inicio = time.monotonic()
+
+            if not self.falhou and (loader.pendentes or acoes):
+                self._flush(conn, cur, loader, acoes)
+        finally:
+            if cur is not None:
+                cur.close()
+            if conn is not None:
+                self._release_conn(conn)
+
+    def _flush(self, conn, cur, loader, acoes):
+        inicio   = time.monotonic()
+        enviadas = loader.pendentes
+        marca    = loader.marcar()
+        for tentativa in (1, 2):
+            try:
+                inseridas = loader.flush()
+                for acao in acoes:
+                    acao(cur)
+                conn.commit()
+                break
+            except ERROS_TRANSITORIOS as e:
+                conn.rollback()
+                if tentativa == 2:
+                    self._registrar_erro(e, "falha no flush")
+                    return
+                # O rollback desfaz stage, merge e ações; o buffer volta ao loader
+                loader.restaurar(marca)
+                print(f"  🔁 Writer {threading.current_thread().name}: {type(e).__name__}, refazendo o lote")
+            except Exception as e:
+                conn.rollback()
+                self._registrar_erro(e, "falha no flush")
+                return
+
+        with self._lock:
+            self.enviadas  += enviadas
+            self.inseridas += inseridas
+            self.commits   += 1
+            self.segundos  += time.monotonic() - inicio
@@ -0,0 +1,164 @@
+"""
+Agregados por sensor em `leituras_hora` e `leituras_dia` (n, mínimo,
+máximo, média, primeiro e último valor do intervalo).
+
+A ingestão os mantém: o flush do LeiturasLoader anota as horas que
+receberam leituras novas e `atualizar_rollups` recalcula só essas horas
+(a partir de `leituras`) e os dias que as contêm (a partir das horas),
+na mesma transação.
+
+Para o histórico gravado antes dos rollups existirem:
+
+    python rollups.py --reconstruir [--desde 2026-01-01]
+"""
+import argparse
+from datetime import date, datetime, timedelta
+
+from common import get_db_conn
+from migracoes import aplicar_migracoes
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+# Tabela temporária (por conexão) com as horas tocadas desde o último recálculo
+HORAS_STAGE = "rollup_horas_stage"
+
+# ======================================================
+# STAGE
+# ======================================================
+# leituras_hora e leituras_dia vêm de sql/007_tabelas_ingestao.sql
+
+def garantir_stage(cur):
+    # Recriada sob demanda, como a stage do LeiturasLoader
+    cur.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {HORAS_STAGE} (
+            sensor_id BIGINT    NOT NULL,
+            bucket    TIMESTAMP NOT NULL,
+            PRIMARY KEY (sensor_id, bucket)
+        )
+    """)
+
+# ======================================================
+# RECÁLCULO
+# ======================================================
+
+def atualizar_rollups(cur) -> int:
+    """
+    Recalcula as horas anotadas em HORAS_STAGE e os dias que as contêm,
+    e esvazia a stage. Não faz commit. Devolve quantas horas recalculou.
+
+    Um lock de transação por sensor serializa writers (threads ou
+    processos) que gravem o mesmo sensor: o recálculo de um só começa
+    depois do commit do outro, então nenhum sobrescreve o agregado do
+    outro com uma visão sem as suas linhas.
+    """
+    cur.execute(f"""
+        SELECT pg_advisory_xact_lock(hashtextextended('leituras_rollup:' || sensor_id, 0))
+        FROM (SELECT DISTINCT sensor_id FROM {HORAS_STAGE} ORDER BY sensor_id) s
+    """)
+
+    cur.execute(f"""
+        INSERT INTO leituras_hora (sensor_id, bucket, n, minimo, maximo, media, primeiro, ultimo)
+        SELECT h.sensor_id, h.bucket,
+               COUNT(l.valor_sensor), MIN(l.valor_sensor), MAX(l.valor_sensor), AVG(l.valor_sensor),
+               (ARRAY_AGG(l.valor_sensor ORDER BY l.data_leitura))[1],
+               (ARRAY_AGG(l.valor_sensor ORDER BY l.data_leitura DESC))[1]
+        FROM {HORAS_STAGE} h
+        JOIN leituras l
+          ON l.sensor_id     = h.sensor_id
+         AND l.data_leitura >= h.bucket
+         AND l.data_leitura <  h.bucket + INTERVAL '1 hour'
+        GROUP BY h.sensor_id, h.bucket
+        ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+            n        = EXCLUDED.n,
+            minimo   = EXCLUDED.minimo,
+            maximo   = EXCLUDED.maximo,
+            media    = EXCLUDED.media,
+            primeiro = EXCLUDED.primeiro,
+            ultimo   = EXCLUDED.ultimo
+    """)
+    horas = cur.rowcount
+
+    # Dia a partir das horas: no máximo 24 linhas por sensor/dia
+    cur.execute(f"""
+        INSERT INTO leituras_dia (sensor_id, bucket, n, minimo, maximo, media, primeiro, ultimo)
+        SELECT d.sensor_id, d.bucket,
+               SUM(h.n), MIN(h.minimo), MAX(h.maximo),
+               SUM(h.media * h.n) / NULLIF(SUM(h.n), 0),
+               (ARRAY_AGG(h.primeiro ORDER BY h.bucket))[1],
+               (ARRAY_AGG(h.ultimo   ORDER BY h.bucket DESC))[1]
+        FROM (
+            SELECT DISTINCT sensor_id, date_trunc('day', bucket) AS bucket
+            FROM {HORAS_STAGE}
+        ) d
+        JOIN leituras_hora h
+          ON h.sensor_id = d.sensor_id
+         AND h.bucket   >= d.bucket
+         AND h.bucket   <  d.bucket + INTERVAL '1 day'
+        GROUP BY d.sensor_id, d.bucket
+        ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+            n        = EXCLUDED.n,
+            minimo   = EXCLUDED.minimo,
+            maximo   = EXCLUDED.maximo,
+            media    = EXCLUDED.media,
+            primeiro = EXCLUDED.primeiro,
+            ultimo   = EXCLUDED.ultimo
+    """)
+
+    cur.execute(f"TRUNCATE {HORAS_STAGE}")
+    return horas
+
+# ======================================================
+# RECONSTRUÇÃO DO HISTÓRICO
+# ======================================================
+
+def reconstruir(conn, desde: date = None, passo: timedelta = timedelta(days=7)):
+    """Recalcula os rollups de `desde` (ou da primeira leitura) até hoje, um commit por passo."""
+    aplicar_migracoes(conn)
+    cur = conn.cursor()
+    garantir_stage(cur)
+    conn.commit()
+
+    if desde is None:
+        cur.execute("SELECT MIN(data_leitura)::date FROM leituras")
+        desde = cur.fetchone()[0]
+        if desde is None:
+            print("ℹ️  leituras vazia, nada a reconstruir")
+            return
+
+    fim    = date.today() + timedelta(days=1)
+    inicio = desde
+    while inicio < fim:
+        ate = min(inicio + passo, fim)
+        cur.execute(f"""
+            INSERT INTO {HORAS_STAGE} (sensor_id, bucket)
+            SELECT DISTINCT sensor_id, date_trunc('hour', data_leitura)
+            FROM leituras
+            WHERE data_leitura >= %s AND data_leitura < %s
+            ON CONFLICT DO NOTHING
+        """, (inicio, ate))
+        horas = atualizar_rollups(cur)
+        conn.commit()
+        print(f"  📊 {inicio} → {ate}: {horas} horas recalculadas")
+        inicio = ate
+    cur.close()
+
+# ======================================================
+# MAIN
+# ======================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollups horário/diário de leituras")
+    parser.add_argument("--reconstruir", action="store_true",
+                        help="Recalcula os rollups a partir de leituras.")
+    parser.add_argument("--desde", type=lambda s: datetime.strptime(s, "%Y-%m-%d").date(),
+                        help="Primeiro dia a recalcular (padrão: primeira leitura).")
+    args = parser.parse_args()
+    if not args.reconstruir:
+        parser.error("nada a fazer (use --reconstruir)")
+
+    conn = get_db_conn()
+    reconstruir(conn, args.desde)
+    conn.close()
+    print("✅ Rollups reconstruídos")
@@ -0,0 +1,136 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+# Igual ao recuo de carregar_cursores: leituras dentro dessa janela abaixo
+# do watermark são conferidas uma a uma (podem ser chegadas atrasadas).
+JANELA_SOBREPOSICAO = timedelta(hours=1)
+
+def _do_banco(ts) -> datetime:
+    """data_leitura do banco → datetime ingênuo em UTC."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def _da_api(texto):
+    """
+    readingDate → datetime ingênuo, como o Postgres o grava numa coluna
+    TIMESTAMP (fuso explícito é ignorado). None se não for ISO 8601.
+    """
+    try:
+        return datetime.fromisoformat(texto).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+# ======================================================
+# FILTRO
+# ======================================================
+
+class FiltroWatermark:
+    """
+    Descarta, antes do COPY, leituras que já estão no banco.
+
+    Por sensor guarda um `corte` (leituras abaixo dele são descartadas)
+    e o conjunto dos timestamps já gravados a partir do corte. Uma
+    leitura no corte ou acima só é descartada se estiver nesse conjunto,
+    então chegadas atrasadas dentro da janela de sobreposição passam.
+    Repetições dentro do mesmo bloco também são removidas.
+
+    Sensor sem estado não é filtrado (o ON CONFLICT continua valendo).
+    O readingDate é comparado como datetime, não como texto; um valor
+    que não seja ISO 8601 passa sem filtro.
+    """
+
+    def __init__(self, cortes: dict, gravados: dict):
+        self._cortes   = cortes
+        self._gravados = gravados
+        self._lock     = threading.Lock()
+
+        self.recebidas   = 0
+        self.descartadas = 0
+
+    def filtrar(self, registros: list) -> list:
+        cortes   = self._cortes
+        gravados = self._gravados
+        vistos   = set()
+        novos    = []
+
+        for reg in registros:
+            sid = reg[0]
+            ts  = _da_api(reg[1])
+            chave = (sid, reg[1] if ts is None else ts)
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+
+            if ts is None:
+                novos.append(reg)
+                continue
+            corte = cortes.get(sid)
+            if corte is not None and ts < corte:
+                continue
+            ja = gravados.get(sid)
+            if ja and ts in ja:
+                continue
+            novos.append(reg)
+
+        with self._lock:
+            self.recebidas   += len(registros)
+            self.descartadas += len(registros) - len(novos)
+        return novos
+
+# ======================================================
+# CARGA DO ESTADO
+# ======================================================
+
+def carregar_por_sync_state(cur, sensor_ids, janela: timedelta = JANELA_SOBREPOSICAO) -> FiltroWatermark:
+    """
+    Corte = watermark do sync_state − `janela`; conjunto = leituras gravadas
+    a partir do corte (inclui as que outro script gravou além do watermark).
+    Uma query, pelo índice (sensor_id, data_leitura).
+
+    O limite escalar (menor corte do lote) vira initplan: com `leituras`
+    particionada, só as partições recentes entram no plano.
+    """
+    ids = list(sensor_ids)
+    cur.execute("""
+        SELECT s.sensor_id, s.last_timestamp - %s, l.data_leitura
+        FROM sync_state s
+        LEFT JOIN leituras l
+               ON l.sensor_id = s.sensor_id
+              AND l.data_leitura >= s.last_timestamp - %s
+              AND l.data_leitura >= (
+                      SELECT MIN(last_timestamp) FROM sync_state WHERE sensor_id = ANY(%s)
+                  ) - %s
+        WHERE s.sensor_id = ANY(%s)
+          AND s.last_timestamp IS NOT NULL
+    """, (janela, janela, ids, janela, ids))
+
+    cortes   = {}
+    gravados = {}
+    for sid, corte, ts in cur.fetchall():
+        cortes[sid] = _do_banco(corte)
+        conjunto = gravados.setdefault(sid, set())
+        if ts is not None:
+            conjunto.add(_do_banco(ts))
+    return FiltroWatermark(cortes, gravados)
+
+def carregar_por_janela(cur, sensor_ids, desde) -> FiltroWatermark:
+    """
+    Sem corte: o conjunto são as leituras gravadas a partir de `desde`
+    (início da janela pedida à API), então só o que já existe é descartado.
+    """
+    cur.execute("""
+        SELECT sensor_id, data_leitura
+        FROM leituras
+        WHERE sensor_id = ANY(%s)
+          AND data_leitura >= %s
+    """, (list(sensor_ids), desde))
+
+    gravados = {}
+    for sid, ts in cur.fetchall():
+        gravados.setdefault(sid, set()).add(_do_banco(ts))
+    return FiltroWatermark({}, gravados)
@@ -0,0 +1,34 @@
+-- Tabelas base da ingestão e colunas que antes eram criadas sob demanda
+-- (app.py a cada cache miss, garantir_schema a cada run).
+
+CREATE TABLE IF NOT EXISTS devices (
+    device_id          BIGINT PRIMARY KEY,
+    device_name        TEXT,
+    serial_number      TEXT,
+    status             TEXT,
+    latitude           DOUBLE PRECISION,
+    longitude          DOUBLE PRECISION,
+    last_upload        TIMESTAMP,
+    battery_percentage DOUBLE PRECISION,
+    last_status        TEXT,
+    reference          TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sensores (
+    sensor_id        BIGINT PRIMARY KEY,
+    device_id        BIGINT REFERENCES devices (device_id),
+    nome_customizado TEXT,
+    tipo_sensor      TEXT,
+    unidade_medida   TEXT
+);
+
+CREATE TABLE IF NOT EXISTS leituras (
+    sensor_id    BIGINT    NOT NULL,
+    data_leitura TIMESTAMP NOT NULL,
+    valor_sensor DOUBLE PRECISION,
+    PRIMARY KEY (sensor_id, data_leitura)
+);
+
+ALTER TABLE devices ADD COLUMN IF NOT EXISTS reference          TEXT;
+ALTER TABLE devices ADD COLUMN IF NOT EXISTS battery_percentage DOUBLE PRECISION;
+ALTER TABLE devices ADD COLUMN IF NOT EXISTS last_status        TEXT;
@@ -0,0 +1,17 @@
+-- migracoes: sem-transacao
+-- Índices de leituras para as consultas por sensor e por período.
+-- CONCURRENTLY não bloqueia as escritas da ingestão, mas não roda em
+-- transação: migracoes.py aplica este arquivo comando a comando e, se um
+-- build anterior foi interrompido (índice inválido), descarta e refaz.
+-- leituras ainda não é particionada quando este arquivo roda; a migração
+-- de particionamento copia os índices (LIKE ... INCLUDING INDEXES).
+
+-- Série de um sensor num intervalo sem visitar o heap (index-only scan):
+-- dashboards, watermark, rollups
+CREATE INDEX CONCURRENTLY IF NOT EXISTS leituras_sensor_data_cobertura
+    ON leituras (sensor_id, data_leitura) INCLUDE (valor_sensor);
+
+-- Filtros só por período (alert engine, rollups --reconstruir). BRIN é
+-- minúsculo e serve bem porque leituras chega quase em ordem de tempo.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS leituras_data_brin
+    ON leituras USING brin (data_leitura);
@@ -0,0 +1,11 @@
+-- Índices dos joins e filtros de metadados usados pelos dashboards e
+-- pelo alert engine.
+
+-- WHERE tipo_sensor IN ('A-Axis Delta Angle', 'B-Axis Delta Angle')
+CREATE INDEX IF NOT EXISTS sensores_tipo_sensor ON sensores (tipo_sensor);
+
+-- devices → sensores (LEFT JOIN por device em ingest_incremental_ultimos_dados)
+CREATE INDEX IF NOT EXISTS sensores_device_id ON sensores (device_id);
+
+-- Filtro por ramal no dashboard
+CREATE INDEX IF NOT EXISTS devices_reference ON devices (reference);
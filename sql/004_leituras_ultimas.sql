@@ -0,0 +1,22 @@
+-- Última leitura de cada sensor, mantida pelo flush do LeiturasLoader na
+-- mesma transação que grava em leituras. Alert engine e dashboards leem
+-- daqui em vez de varrer o histórico.
+
+CREATE TABLE IF NOT EXISTS leituras_ultimas (
+    sensor_id    BIGINT PRIMARY KEY,
+    data_leitura TIMESTAMP NOT NULL,
+    valor_sensor DOUBLE PRECISION
+);
+
+-- Carga inicial: uma descida de índice por sensor
+INSERT INTO leituras_ultimas (sensor_id, data_leitura, valor_sensor)
+SELECT s.sensor_id, l.data_leitura, l.valor_sensor
+FROM sensores s
+CROSS JOIN LATERAL (
+    SELECT data_leitura, valor_sensor
+    FROM leituras
+    WHERE sensor_id = s.sensor_id
+    ORDER BY data_leitura DESC
+    LIMIT 1
+) l
+ON CONFLICT (sensor_id) DO NOTHING;
@@ -0,0 +1,13 @@
+-- Avaliação incremental do alert engine: quando cada linha de
+-- leituras_ultimas mudou, e até onde o engine já avaliou.
+
+ALTER TABLE leituras_ultimas
+    ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS leituras_ultimas_atualizado_em
+    ON leituras_ultimas (atualizado_em);
+
+CREATE TABLE IF NOT EXISTS alert_engine_estado (
+    chave TEXT PRIMARY KEY,
+    valor TIMESTAMPTZ NOT NULL
+);
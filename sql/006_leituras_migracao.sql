@@ -0,0 +1,8 @@
+-- Meses já copiados e conferidos por `particionamento.py --migrar`: uma
+-- migração interrompida recomeça do primeiro mês que falta.
+
+CREATE TABLE IF NOT EXISTS leituras_migracao (
+    mes          DATE PRIMARY KEY,
+    linhas       BIGINT      NOT NULL,
+    conferido_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
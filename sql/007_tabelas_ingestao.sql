@@ -0,0 +1,82 @@
+-- Tabelas e colunas que os scripts criavam sob demanda a cada run
+-- (garantir_schema, metadados, metricas, rollups, backfill, cache do
+-- token). Todas com IF NOT EXISTS: bancos que já as têm não mudam.
+
+-- Watermark por sensor e último lastUpload processado por device
+-- (ingest_incremental)
+CREATE TABLE IF NOT EXISTS sync_state (
+    sensor_id      BIGINT PRIMARY KEY,
+    last_timestamp TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS device_sync_state (
+    device_id          BIGINT PRIMARY KEY,
+    last_upload        TEXT,
+    runs_sem_varredura INTEGER NOT NULL DEFAULT 0
+);
+
+-- Hash do payload de /UserDevices gravado (metadados.py)
+ALTER TABLE devices  ADD COLUMN IF NOT EXISTS payload_hash TEXT;
+ALTER TABLE sensores ADD COLUMN IF NOT EXISTS payload_hash TEXT;
+
+-- Um registro por execução de ingestão (metricas.py)
+CREATE TABLE IF NOT EXISTS ingest_runs (
+    id                   BIGSERIAL PRIMARY KEY,
+    script               TEXT        NOT NULL,
+    iniciado_em          TIMESTAMPTZ NOT NULL,
+    duracao_s            DOUBLE PRECISION NOT NULL,
+    sucesso              BOOLEAN     NOT NULL,
+    erro                 TEXT,
+    fases_s              JSONB       NOT NULL DEFAULT '{}',
+    requests_por_status  JSONB       NOT NULL DEFAULT '{}',
+    espera_rate_limit_s  DOUBLE PRECISION NOT NULL DEFAULT 0,
+    leituras_enviadas    BIGINT      NOT NULL DEFAULT 0,
+    leituras_inseridas   BIGINT      NOT NULL DEFAULT 0,
+    leituras_conflitadas BIGINT      NOT NULL DEFAULT 0,
+    lag_max_s            DOUBLE PRECISION,
+    lag_por_sensor_s     JSONB       NOT NULL DEFAULT '{}'
+);
+
+ALTER TABLE ingest_runs ADD COLUMN IF NOT EXISTS leituras_descartadas BIGINT NOT NULL DEFAULT 0;
+
+-- Agregados por sensor e hora / dia (rollups.py)
+CREATE TABLE IF NOT EXISTS leituras_hora (
+    sensor_id BIGINT    NOT NULL,
+    bucket    TIMESTAMP NOT NULL,
+    n         INTEGER   NOT NULL,
+    minimo    DOUBLE PRECISION,
+    maximo    DOUBLE PRECISION,
+    media     DOUBLE PRECISION,
+    primeiro  DOUBLE PRECISION,
+    ultimo    DOUBLE PRECISION,
+    PRIMARY KEY (sensor_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS leituras_dia (
+    sensor_id BIGINT    NOT NULL,
+    bucket    TIMESTAMP NOT NULL,
+    n         INTEGER   NOT NULL,
+    minimo    DOUBLE PRECISION,
+    maximo    DOUBLE PRECISION,
+    media     DOUBLE PRECISION,
+    primeiro  DOUBLE PRECISION,
+    ultimo    DOUBLE PRECISION,
+    PRIMARY KEY (sensor_id, bucket)
+);
+
+-- Checkpoints do backfill por (bloco, lote de sensores)
+CREATE TABLE IF NOT EXISTS backfill_progresso (
+    bloco_inicio   TIMESTAMPTZ NOT NULL,
+    lote_chave     TEXT        NOT NULL,
+    proximo_offset INTEGER     NOT NULL DEFAULT 0,
+    concluido      BOOLEAN     NOT NULL DEFAULT FALSE,
+    atualizado_em  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (bloco_inicio, lote_chave)
+);
+
+-- Token da API compartilhado entre scripts (common.ProvedorToken)
+CREATE TABLE IF NOT EXISTS api_token_cache (
+    chave     TEXT PRIMARY KEY,
+    token     TEXT NOT NULL,
+    expira_em TIMESTAMPTZ NOT NULL
+);
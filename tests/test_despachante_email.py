@@ -0,0 +1,91 @@
+"""
+DespachanteEmail contra o servidor de tools/smtp_local.py: digest por
+contato, retry de falha temporária e reconexão.
+
+    python -m pytest tests/        # ou: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, "tools")]
+
+import smtp_local
+from despachante_email import DespachanteEmail
+
+def montar(itens):
+    return f"{len(itens)} alertas", "\n".join(itens)
+
+class TestDespachanteEmail(unittest.TestCase):
+
+    def setUp(self):
+        self.srv = smtp_local.iniciar_em_thread(falhar=2)
+        self.addCleanup(self.srv.server_close)
+        self.addCleanup(self.srv.shutdown)
+
+    def despachante(self, **kwargs):
+        return DespachanteEmail(
+            "127.0.0.1", self.srv.porta, usuario="orion", senha="x",
+            remetente="alertas@orion.local", starttls=False,
+            backoff_inicial=0.01, **kwargs
+        )
+
+    def test_um_digest_por_contato_com_retry(self):
+        por_contato = {
+            "a@orion.local": ["D1 Vermelho", "D2 offline"],
+            "b@orion.local": ["D1 Vermelho"],
+            "c@orion.local": ["D3 offline"],
+            "d@orion.local": [],   # sem alertas: nenhuma mensagem
+        }
+        concluidos = []
+        despachante = self.despachante()
+        despachante.enviar_digests(por_contato, montar, ao_concluir=concluidos.append)
+        despachante.fechar(timeout=10)
+
+        # Um retorno só, depois da última mensagem, sem falhas
+        self.assertEqual(concluidos, [set()])
+
+        caixa = self.srv.caixa
+        destinos = sorted(msg["To"] for _, _, msg in caixa.mensagens)
+        self.assertEqual(destinos, ["a@orion.local", "b@orion.local", "c@orion.local"])
+
+        assuntos = {msg["To"]: msg["Subject"] for _, _, msg in caixa.mensagens}
+        self.assertEqual(assuntos["a@orion.local"], "2 alertas")
+
+        # As 2 falhas (451) são da primeira mensagem: cada uma derruba a
+        # sessão e a tentativa seguinte reconecta; as demais reaproveitam
+        self.assertEqual(caixa.contadores["falhas"], 2)
+        self.assertEqual(caixa.contadores["mensagens"], 3)
+        self.assertEqual(caixa.contadores["conexoes"], 3)
+        self.assertEqual(caixa.contadores["logins"], 3)
+        self.assertEqual(despachante.conexoes, 3)
+        self.assertEqual(despachante.enviadas, 3)
+        self.assertEqual(despachante.descartadas, 0)
+
+    def test_desiste_apos_tentativas(self):
+        concluidos = []
+        despachante = self.despachante(tentativas=2)
+        despachante.enviar_digests(
+            {"a@orion.local": ["D1 Vermelho"], "b@orion.local": ["D1 Vermelho"]},
+            montar, ao_concluir=concluidos.append,
+        )
+        despachante.fechar(timeout=10)
+
+        # a@ esgota as 2 tentativas (451, 451) e volta como falha; b@ é entregue
+        self.assertEqual(concluidos, [{"a@orion.local"}])
+        self.assertEqual(self.srv.caixa.contadores["mensagens"], 1)
+        self.assertEqual(despachante.descartadas, 1)
+        self.assertEqual(despachante.conexoes, 3)
+
+    def test_retorno_imediato_sem_mensagens(self):
+        concluidos = []
+        despachante = self.despachante()
+        despachante.enviar_digests({"a@orion.local": []}, montar, ao_concluir=concluidos.append)
+        despachante.fechar(timeout=10)
+
+        self.assertEqual(concluidos, [set()])
+        self.assertEqual(self.srv.caixa.contadores["conexoes"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,269 @@
+"""
+Benchmark da ingestão contra o simulador local (tools/simulador_api.py)
+e um Postgres local.
+
+Roda os scripts de ingestao/ como subprocessos, apontados para o
+simulador via ORION_BASE_URL, e mede por cenário:
+- leituras novas em `leituras` e leituras/s
+- requests por endpoint (e 429s) vistas pelo simulador
+- tempo de banco (soma de pg_stat_statements, se a extensão existir)
+- pico de RSS do processo (wait4)
+
+    DATABASE_URL=postgresql://localhost/orion_bench \\
+        python tools/benchmark_ingestao.py --cenarios incremental backfill --json atual.json
+    python tools/benchmark_ingestao.py --comparar atual.json --tolerancia 0.10
+
+ATENÇÃO: sem --acumular, as tabelas de leituras e de estado são
+truncadas antes de cada cenário. Nunca aponte para o banco de produção.
+"""
+import argparse
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulador_api
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+RAIZ         = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_INGESTAO = os.path.join(RAIZ, "ingestao")
+
+CENARIOS = {
+    "incremental":   "ingest_incremental.py",
+    "backfill":      "backfill.py",
+    "ultimos_dados": "ingest_incremental_ultimos_dados.py",
+}
+
+# Tabelas zeradas entre cenários (as que existirem)
+TABELAS_ESTADO = (
+    "leituras", "leituras_hora", "leituras_dia", "leituras_ultimas",
+    "sync_state", "device_sync_state",
+    "backfill_progresso", "api_token_cache",
+)
+
+# ======================================================
+# BANCO
+# ======================================================
+
+def limpar_estado(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass(t) IS NOT NULL FROM unnest(%s::text[]) AS t", (list(TABELAS_ESTADO),))
+    existentes = [t for t, ok in zip(TABELAS_ESTADO, (r[0] for r in cur.fetchall())) if ok]
+    if existentes:
+        cur.execute(f"TRUNCATE {', '.join(existentes)}")
+    conn.commit()
+    cur.close()
+
+def contar_leituras(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM leituras")
+    n = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return n
+
+def tempo_banco_ms(conn):
+    """Soma do tempo de execução em pg_stat_statements para este banco, ou None."""
+    cur = conn.cursor()
+    for coluna in ("total_exec_time", "total_time"):   # PG13+ / PG ≤ 12
+        try:
+            cur.execute(f"""
+                SELECT COALESCE(SUM({coluna}), 0) FROM pg_stat_statements
+                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+            """)
+            valor = float(cur.fetchone()[0])
+            conn.commit()
+            cur.close()
+            return valor
+        except psycopg2.Error:
+            conn.rollback()
+    cur.close()
+    return None
+
+# ======================================================
+# CENÁRIO
+# ======================================================
+
+def rodar_cenario(nome, comando, env, conn, sim, log_path) -> dict:
+    linhas_antes = contar_leituras(conn)
+    db_antes     = tempo_banco_ms(conn)
+    sim.stats.zerar()
+
+    inicio = time.monotonic()
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(comando, cwd=DIR_INGESTAO, env=env, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 devolve o rusage só deste filho (pico de RSS em KiB no Linux)
+        _, status, uso = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    duracao = time.monotonic() - inicio
+
+    db_depois = tempo_banco_ms(conn)
+    novas     = contar_leituras(conn) - linhas_antes
+    api       = sim.stats.como_dict()
+
+    return {
+        "cenario":      nome,
+        "codigo_saida": proc.returncode,
+        "segundos":     round(duracao, 3),
+        "leituras":     novas,
+        "leituras_s":   round(novas / duracao, 1) if duracao else 0.0,
+        "requests":     sum(api["requests"].values()),
+        "por_endpoint": api["requests"],
+        "status":       api["status"],
+        "servidas":     api["linhas"],
+        "db_ms":        round(db_depois - db_antes, 1) if db_antes is not None and db_depois is not None else None,
+        "rss_mb":       round(uso.ru_maxrss / 1024, 1),
+        "log":          log_path,
+    }
+
+def imprimir_resultado(r):
+    db = f"{r['db_ms'] / 1000:.2f}s" if r["db_ms"] is not None else "n/d"
+    n429 = r["status"].get("429", 0)
+    marca = "✅" if r["codigo_saida"] == 0 else f"💥 (saída {r['codigo_saida']}, ver {r['log']})"
+    print(
+        f"{marca} {r['cenario']:<14} {r['segundos']:>8.1f}s | {r['leituras']:>9} novas | "
+        f"{r['leituras_s']:>9.1f} leit/s | {r['requests']:>5} req ({n429} × 429) | "
+        f"banco {db} | RSS {r['rss_mb']:.0f} MB"
+    )
+
+# ======================================================
+# COMPARAÇÃO
+# ======================================================
+
+def resumir(resultados: list) -> dict:
+    """{cenário: mediana de leituras/s, requests e RSS entre as repetições ok}."""
+    por_cenario = {}
+    for r in resultados:
+        if r["codigo_saida"] == 0:
+            por_cenario.setdefault(r["cenario"], []).append(r)
+    return {
+        nome: {
+            "leituras_s": statistics.median(r["leituras_s"] for r in rs),
+            "requests":   statistics.median(r["requests"] for r in rs),
+            "rss_mb":     statistics.median(r["rss_mb"] for r in rs),
+        }
+        for nome, rs in por_cenario.items()
+    }
+
+def comparar(atual: dict, base: dict, tolerancia: float) -> bool:
+    """Imprime as variações e devolve False se alguma piorar além da tolerância."""
+    ok = True
+    print(f"\n📈 Comparação com a base (tolerância {tolerancia:.0%}):")
+    for nome, a in atual.items():
+        b = base.get(nome)
+        if not b:
+            print(f"  {nome:<14} sem base")
+            continue
+        delta_taxa = a["leituras_s"] / b["leituras_s"] - 1 if b["leituras_s"] else 0.0
+        delta_req  = a["requests"] / b["requests"] - 1 if b["requests"] else 0.0
+        delta_rss  = a["rss_mb"] / b["rss_mb"] - 1 if b["rss_mb"] else 0.0
+        regressao  = delta_taxa < -tolerancia or delta_req > tolerancia or delta_rss > tolerancia
+        ok = ok and not regressao
+        print(
+            f"  {'🔻' if regressao else '  '} {nome:<14} leit/s {delta_taxa:+.1%} | "
+            f"requests {delta_req:+.1%} | RSS {delta_rss:+.1%}"
+        )
+    return ok
+
+# ======================================================
+# MAIN
+# ======================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da ingestão contra o simulador da API")
+    parser.add_argument(
+        "--cenarios",
+        nargs="+",
+        choices=sorted(CENARIOS),
+        default=["incremental", "backfill", "ultimos_dados"],
+    )
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument(
+        "--acumular",
+        action="store_true",
+        help="Não trunca leituras/estado entre cenários (mede runs 'quentes').",
+    )
+    parser.add_argument(
+        "--args",
+        action="append",
+        default=[],
+        metavar="CENARIO=ARGS",
+        help='Argumentos extras de um script, ex.: --args "incremental=--engine async".',
+    )
+    parser.add_argument("--json", help="Grava os resultados (e o resumo) neste arquivo.")
+    parser.add_argument("--comparar", metavar="BASE_JSON", help="Compara o resumo com um --json anterior.")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    simulador_api._argumentos(parser)
+    args = parser.parse_args()
+
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        raise SystemExit("Defina DATABASE_URL com um Postgres local de benchmark")
+
+    extras = {}
+    for item in args.args:
+        nome, _, resto = item.partition("=")
+        extras[nome] = shlex.split(resto)
+
+    sim = simulador_api.iniciar_em_thread(**simulador_api.configuracao(args))
+
+    env = dict(
+        os.environ,
+        ORION_BASE_URL=sim.base_url,
+        DATABASE_URL=dsn,
+        API_KEY="benchmark",
+        PYTHONUNBUFFERED="1",
+    )
+
+    # Mesmo schema e índices da produção (sql/NNN_*.sql)
+    subprocess.run([sys.executable, "migracoes.py"], cwd=DIR_INGESTAO, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+
+    conn = psycopg2.connect(dsn)
+    limpar_estado(conn)
+
+    # ultimos_dados lê devices/sensores do banco: garante o cadastro antes
+    subprocess.run([sys.executable, "sync_metadata.py"], cwd=DIR_INGESTAO, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+
+    dir_logs = tempfile.mkdtemp(prefix="orion_bench_")
+    print(f"🛰️  Simulador em {sim.base_url} | logs em {dir_logs}\n")
+
+    resultados = []
+    for rep in range(args.repeticoes):
+        for nome in args.cenarios:
+            if not args.acumular:
+                limpar_estado(conn)
+            comando = [sys.executable, CENARIOS[nome], *extras.get(nome, [])]
+            log_path = os.path.join(dir_logs, f"{nome}_{rep}.log")
+            r = rodar_cenario(nome, comando, env, conn, sim, log_path)
+            imprimir_resultado(r)
+            resultados.append(r)
+
+    conn.close()
+    sim.shutdown()
+
+    resumo = resumir(resultados)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": simulador_api.configuracao(args), "resultados": resultados, "resumo": resumo}, f, indent=2)
+        print(f"\n💾 Resultados em {args.json}")
+
+    falhou = any(r["codigo_saida"] != 0 for r in resultados)
+    if args.comparar:
+        with open(args.comparar) as f:
+            base = json.load(f)["resumo"]
+        if not comparar(resumo, base, args.tolerancia):
+            falhou = True
+
+    raise SystemExit(1 if falhou else 0)
@@ -0,0 +1,344 @@
+"""
+Simulador local da API Orion (/token, /UserDevices, /SensorData).
+
+Gera dados determinísticos — a mesma leitura sai igual em qualquer run —
+para medir a ingestão sem tocar em api.oriondata.io:
+
+    python tools/simulador_api.py --devices 50 --sensores 8 --latencia 0.05
+    ORION_BASE_URL=http://127.0.0.1:8765/api python ingestao/ingest_incremental.py
+
+Também serve GET /stats (contadores; `?reset=1` zera) para o benchmark.
+"""
+import argparse
+import base64
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+PORTA            = 8765
+DEVICES          = 20
+SENSORES         = 6          # canais por device (o último é "Unallocated")
+INTERVALO_MIN    = 10         # minutos entre leituras de um sensor
+UPLOAD_MIN       = 60         # minutos entre uploads de um device
+HISTORICO_DIAS   = 14         # leituras existem só a partir de agora - N dias
+PAGE_SIZE_PADRAO = 1000       # página quando a request não manda `limit`
+LIMIT_MAXIMO     = 5000
+TOKEN_TTL        = 3600
+
+TIPOS_SENSOR = ("Temperature", "Humidity", "Voltage", "Tilt X", "Tilt Y", "Piezometer")
+FORMATO_DATA = "%Y-%m-%dT%H:%M:%S"
+
+# ======================================================
+# DADOS SINTÉTICOS
+# ======================================================
+
+class Frota:
+    """
+    Devices e sensores sintéticos.
+
+    Cada device "sobe" dados a cada `upload_min` (fase diferente por
+    device); as leituras de um sensor existem a cada `intervalo_min`,
+    de `agora - historico_dias` até o último upload do device.
+    """
+
+    def __init__(self, devices, sensores, intervalo_min, upload_min, historico_dias):
+        self.intervalo = intervalo_min * 60
+        self.upload    = upload_min * 60
+        self.origem    = time.time() - historico_dias * 86400
+        self.devices   = {}
+        self.sensores  = {}   # sensor_id → device_id
+
+        for d in range(devices):
+            did = 1000 + d
+            canais = []
+            for k in range(sensores):
+                sid  = did * 100 + k
+                tipo = "Unallocated" if k == sensores - 1 else TIPOS_SENSOR[k % len(TIPOS_SENSOR)]
+                canais.append({
+                    "sensorId":   sid,
+                    "customName": f"{tipo} {did}-{k}" if tipo != "Unallocated" else None,
+                    "sensorType": tipo,
+                    "uom":        "un",
+                })
+                self.sensores[sid] = did
+            self.devices[did] = canais
+
+    def ultimo_upload(self, did) -> float:
+        fase  = (did * 7919) % self.upload
+        agora = time.time()
+        return math.floor((agora - fase) / self.upload) * self.upload + fase
+
+    def user_devices(self) -> list:
+        lista = []
+        for did, canais in self.devices.items():
+            lista.append({
+                "deviceId":          did,
+                "deviceName":        f"Device {did}",
+                "serialNumber":      f"SN{did:06d}",
+                "status":            "Active",
+                "latitude":          -20.0 + (did % 100) / 100,
+                "longitude":         -44.0 - (did % 100) / 100,
+                "lastUpload":        _iso(self.ultimo_upload(did)),
+                "batteryPercentage": 50 + did % 50,
+                "lastStatus":        "OK",
+                "reference":         f"REF-{did}",
+                "sensors":           canais,
+            })
+        return lista
+
+    def _ticks(self, sid, inicio, fim):
+        """Primeiro tick e quantidade de leituras de `sid` em [inicio, fim)."""
+        fim = min(fim, self.ultimo_upload(self.sensores[sid]) + 1)
+        ini = max(inicio, self.origem)
+        primeiro = math.ceil(ini / self.intervalo)
+        ultimo   = math.ceil(fim / self.intervalo)
+        return primeiro, max(0, ultimo - primeiro)
+
+    def leituras(self, sensor_ids, inicio, fim, offset, limite):
+        """Fatia [offset, offset+limite) das leituras, ordenadas por sensor e data."""
+        pagina = []
+        pular  = offset
+        for sid in sensor_ids:
+            if sid not in self.sensores:
+                continue
+            primeiro, n = self._ticks(sid, inicio, fim)
+            if pular >= n:
+                pular -= n
+                continue
+            for i in range(primeiro + pular, primeiro + n):
+                ts = i * self.intervalo
+                pagina.append({
+                    "sensorId":    sid,
+                    "readingDate": _iso(ts),
+                    "sensorValue": round(20 + 5 * math.sin(ts / 3600 + sid), 3),
+                })
+                if len(pagina) >= limite:
+                    return pagina
+            pular = 0
+        return pagina
+
+def _iso(epoch) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(FORMATO_DATA)
+
+def _epoch(texto) -> float:
+    dt = datetime.fromisoformat(texto)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+# ======================================================
+# SERVIDOR
+# ======================================================
+
+class Estatisticas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        with self._lock:
+            self.requests = Counter()   # endpoint → n
+            self.status   = Counter()   # código HTTP → n
+            self.linhas   = 0
+            self.bytes    = 0
+
+    def registrar(self, endpoint, status, linhas=0, nbytes=0):
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.status[str(status)] += 1
+            self.linhas += linhas
+            self.bytes  += nbytes
+
+    def como_dict(self) -> dict:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "status":   dict(self.status),
+                "linhas":   self.linhas,
+                "bytes":    self.bytes,
+            }
+
+class SimuladorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, como a API real
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _responder(self, status, corpo, endpoint, linhas=0, headers=None):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(dados)
+        self.server.stats.registrar(endpoint, status, linhas, len(dados))
+
+    def _autorizado(self) -> bool:
+        auth = self.headers.get("Authorization", "")
+        exp  = self.server.tokens.get(auth.removeprefix("Bearer "))
+        return exp is not None and exp > time.time()
+
+    def do_GET(self):
+        url      = urlparse(self.path)
+        params   = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.removeprefix("/api").strip("/")
+        srv      = self.server
+
+        if endpoint == "stats":
+            corpo = srv.stats.como_dict()
+            if params.get("reset"):
+                srv.stats.zerar()
+            dados = json.dumps(corpo).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+            return
+
+        if srv.latencia:
+            time.sleep(srv.latencia + random.uniform(0, srv.jitter))
+
+        if endpoint != "token" and srv.taxa_429 and random.random() < srv.taxa_429:
+            return self._responder(429, {"error": "Too Many Requests"}, endpoint,
+                                   headers={"Retry-After": str(srv.retry_after)})
+
+        if endpoint == "token":
+            return self._responder(200, {"token": srv.emitir_token(params.get("apiKey"))}, endpoint)
+
+        if endpoint not in ("UserDevices", "SensorData"):
+            return self._responder(404, {"error": "not found"}, endpoint)
+
+        if not self._autorizado():
+            return self._responder(401, {"error": "Unauthorized"}, endpoint)
+
+        if endpoint == "UserDevices":
+            return self._responder(200, srv.frota.user_devices(), endpoint)
+
+        try:
+            sensor_ids = [int(s) for s in params.get("sensorIds", "").split(",") if s]
+            inicio     = _epoch(params["startDate"])
+            fim        = _epoch(params["endDate"])
+            offset     = int(params.get("offset", 0))
+        except (KeyError, ValueError) as e:
+            return self._responder(400, {"error": f"parâmetro inválido: {e}"}, endpoint)
+
+        # Com `limit`, offset conta registros; sem `limit`, conta páginas
+        # de PAGE_SIZE_PADRAO (os dois usos existem nos scripts).
+        if "limit" in params:
+            limite = min(int(params["limit"]), srv.limit_maximo)
+        else:
+            limite = srv.page_size_padrao
+            offset = offset * limite
+
+        pagina = srv.frota.leituras(sensor_ids, inicio, fim, offset, limite)
+        return self._responder(200, pagina, endpoint, linhas=len(pagina))
+
+class SimuladorAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, frota, latencia=0.0, jitter=0.0, taxa_429=0.0,
+                 retry_after=0, page_size_padrao=PAGE_SIZE_PADRAO,
+                 limit_maximo=LIMIT_MAXIMO, token_ttl=TOKEN_TTL):
+        super().__init__(endereco, SimuladorHandler)
+        self.frota            = frota
+        self.latencia         = latencia
+        self.jitter           = jitter
+        self.taxa_429         = taxa_429
+        self.retry_after      = retry_after
+        self.page_size_padrao = page_size_padrao
+        self.limit_maximo     = limit_maximo
+        self.token_ttl        = token_ttl
+        self.tokens           = {}
+        self.stats            = Estatisticas()
+
+    def emitir_token(self, api_key) -> str:
+        """JWT de mentira, mas com `exp` — o ProvedorToken lê a validade dele."""
+        exp = int(time.time() + self.token_ttl)
+        b64 = lambda d: base64.urlsafe_b64encode(json.dumps(d).encode()).decode().rstrip("=")
+        token = f"{b64({'alg': 'none'})}.{b64({'sub': api_key, 'exp': exp, 'n': random.random()})}.sim"
+        self.tokens[token] = exp
+        return token
+
+    @property
+    def base_url(self) -> str:
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}/api"
+
+def iniciar_em_thread(**kwargs) -> SimuladorAPI:
+    """Sobe o simulador numa thread daemon e devolve o servidor (ver `base_url`)."""
+    frota = Frota(
+        kwargs.pop("devices", DEVICES),
+        kwargs.pop("sensores", SENSORES),
+        kwargs.pop("intervalo_min", INTERVALO_MIN),
+        kwargs.pop("upload_min", UPLOAD_MIN),
+        kwargs.pop("historico_dias", HISTORICO_DIAS),
+    )
+    host  = kwargs.pop("host", "127.0.0.1")
+    porta = kwargs.pop("porta", 0)
+    srv   = SimuladorAPI((host, porta), frota, **kwargs)
+    threading.Thread(target=srv.serve_forever, name="simulador-api", daemon=True).start()
+    return srv
+
+# ======================================================
+# MAIN
+# ======================================================
+
+def _argumentos(parser):
+    parser.add_argument("--devices", type=int, default=DEVICES)
+    parser.add_argument("--sensores", type=int, default=SENSORES, help="Canais por device (o último é Unallocated).")
+    parser.add_argument("--intervalo-min", type=int, default=INTERVALO_MIN, help="Minutos entre leituras de um sensor.")
+    parser.add_argument("--upload-min", type=int, default=UPLOAD_MIN, help="Minutos entre uploads de um device.")
+    parser.add_argument("--historico-dias", type=float, default=HISTORICO_DIAS)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência fixa (s) por request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latência extra aleatória (s), 0..jitter.")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="Fração das requests respondidas com 429.")
+    parser.add_argument("--retry-after", type=int, default=0, help="Valor do header Retry-After nos 429.")
+    parser.add_argument("--page-size-padrao", type=int, default=PAGE_SIZE_PADRAO)
+    parser.add_argument("--limit-maximo", type=int, default=LIMIT_MAXIMO)
+    parser.add_argument("--token-ttl", type=int, default=TOKEN_TTL)
+
+def configuracao(args) -> dict:
+    return {
+        "devices":          args.devices,
+        "sensores":         args.sensores,
+        "intervalo_min":    args.intervalo_min,
+        "upload_min":       args.upload_min,
+        "historico_dias":   args.historico_dias,
+        "latencia":         args.latencia,
+        "jitter":           args.jitter,
+        "taxa_429":         args.taxa_429,
+        "retry_after":      args.retry_after,
+        "page_size_padrao": args.page_size_padrao,
+        "limit_maximo":     args.limit_maximo,
+        "token_ttl":        args.token_ttl,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador local da API Orion")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    _argumentos(parser)
+    args = parser.parse_args()
+
+    srv = iniciar_em_thread(host=args.host, porta=args.porta, **configuracao(args))
+    n_sensores = args.devices * args.sensores
+    print(f"🛰️  Simulador em {srv.base_url} | {args.devices} devices | {n_sensores} sensores")
+    print(f"   export ORION_BASE_URL={srv.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
+        print("👋 Simulador encerrado")
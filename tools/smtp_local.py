@@ -0,0 +1,175 @@
+"""
+Servidor SMTP local para testar o envio de alertas sem um servidor real.
+
+Aceita qualquer remetente, destinatário e login (AUTH PLAIN/LOGIN), não
+oferece STARTTLS e guarda as mensagens em memória:
+
+    python tools/smtp_local.py --porta 2525 --falhar 2 --atraso 0.5
+    EMAIL_HOST=127.0.0.1 EMAIL_PORT=2525 EMAIL_STARTTLS=0 python alert_engine.py
+
+`--falhar N` responde 451 (falha temporária) às N primeiras mensagens e
+`--atraso` segura cada DATA, para exercitar retry e a fila assíncrona.
+"""
+import argparse
+import socketserver
+import threading
+import time
+from collections import Counter
+from email import message_from_bytes
+
+# ======================================================
+# CONFIG
+# ======================================================
+
+PORTA = 2525
+
+# ======================================================
+# ESTADO COMPARTILHADO
+# ======================================================
+
+class Caixa:
+    """Mensagens recebidas e contadores, seguro entre threads."""
+
+    def __init__(self, falhar: int = 0, atraso: float = 0.0):
+        self.falhar     = falhar
+        self.atraso     = atraso
+        self.mensagens  = []      # [(remetente, [destinatários], email.message.Message)]
+        self.contadores = Counter()
+        self._lock      = threading.Lock()
+
+    def registrar(self, chave):
+        with self._lock:
+            self.contadores[chave] += 1
+
+    def receber(self, remetente, destinatarios, dados: bytes) -> bool:
+        """Guarda a mensagem; False se esta deve falhar (--falhar)."""
+        if self.atraso:
+            time.sleep(self.atraso)
+        with self._lock:
+            if self.falhar > 0:
+                self.falhar -= 1
+                self.contadores["falhas"] += 1
+                return False
+            self.mensagens.append((remetente, list(destinatarios), message_from_bytes(dados)))
+            self.contadores["mensagens"] += 1
+            return True
+
+# ======================================================
+# SESSÃO SMTP
+# ======================================================
+
+class SessaoSMTP(socketserver.StreamRequestHandler):
+
+    def responder(self, linha: str):
+        self.wfile.write(f"{linha}\r\n".encode())
+        self.wfile.flush()
+
+    def ler_linha(self) -> str:
+        return self.rfile.readline().decode("utf-8", "replace").rstrip("\r\n")
+
+    def handle(self):
+        caixa = self.server.caixa
+        caixa.registrar("conexoes")
+        self.responder("220 smtp_local pronto")
+
+        remetente, destinatarios = None, []
+        while True:
+            linha = self.ler_linha()
+            if not linha and self.rfile.closed:
+                return
+            comando, _, arg = linha.partition(" ")
+            comando = comando.upper()
+
+            if comando == "EHLO":
+                self.responder("250-smtp_local")
+                self.responder("250 AUTH PLAIN LOGIN")
+            elif comando == "HELO":
+                self.responder("250 smtp_local")
+            elif comando == "AUTH":
+                caixa.registrar("logins")
+                mecanismo, _, inicial = arg.partition(" ")
+                if mecanismo.upper() == "LOGIN":
+                    self.responder("334 VXNlcm5hbWU6")   # "Username:"
+                    self.ler_linha()
+                    self.responder("334 UGFzc3dvcmQ6")   # "Password:"
+                    self.ler_linha()
+                elif not inicial:
+                    self.responder("334 ")
+                    self.ler_linha()
+                self.responder("235 autenticado")
+            elif comando == "MAIL":
+                remetente, destinatarios = arg.partition(":")[2].strip(), []
+                self.responder("250 ok")
+            elif comando == "RCPT":
+                destinatarios.append(arg.partition(":")[2].strip())
+                self.responder("250 ok")
+            elif comando == "DATA":
+                self.responder("354 termine com <CRLF>.<CRLF>")
+                partes = []
+                while True:
+                    bruta = self.rfile.readline()
+                    if not bruta or bruta in (b".\r\n", b".\n"):
+                        break
+                    partes.append(bruta[1:] if bruta.startswith(b"..") else bruta)
+                if caixa.receber(remetente, destinatarios, b"".join(partes)):
+                    self.responder("250 entregue")
+                else:
+                    self.responder("451 falha temporaria simulada")
+                remetente, destinatarios = None, []
+            elif comando == "RSET":
+                remetente, destinatarios = None, []
+                self.responder("250 ok")
+            elif comando == "NOOP":
+                self.responder("250 ok")
+            elif comando == "QUIT":
+                self.responder("221 tchau")
+                return
+            elif not linha:
+                return
+            else:
+                self.responder("502 comando nao suportado")
+
+class SMTPLocal(socketserver.ThreadingTCPServer):
+    daemon_threads      = True
+    allow_reuse_address = True
+
+    def __init__(self, endereco, caixa: Caixa):
+        super().__init__(endereco, SessaoSMTP)
+        self.caixa = caixa
+
+    @property
+    def porta(self) -> int:
+        return self.server_address[1]
+
+def iniciar_em_thread(host: str = "127.0.0.1", porta: int = 0, **kwargs) -> SMTPLocal:
+    """Sobe o servidor numa thread daemon e devolve-o (mensagens em `srv.caixa`)."""
+    srv = SMTPLocal((host, porta), Caixa(**kwargs))
+    threading.Thread(target=srv.serve_forever, name="smtp-local", daemon=True).start()
+    return srv
+
+# ======================================================
+# MAIN
+# ======================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor SMTP local (stand-in para testes)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--falhar", type=int, default=0, help="Responde 451 às N primeiras mensagens.")
+    parser.add_argument("--atraso", type=float, default=0.0, help="Segundos de espera em cada DATA.")
+    args = parser.parse_args()
+
+    srv = iniciar_em_thread(args.host, args.porta, falhar=args.falhar, atraso=args.atraso)
+    print(f"📮 SMTP local em {args.host}:{srv.porta} (sem TLS)")
+    print(f"   export EMAIL_HOST={args.host} EMAIL_PORT={srv.porta} EMAIL_STARTTLS=0")
+
+    vistas = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for remetente, destinatarios, msg in srv.caixa.mensagens[vistas:]:
+                print(f"✉️  {remetente} → {', '.join(destinatarios)} | {msg['Subject']}")
+                vistas += 1
+    except KeyboardInterrupt:
+        srv.shutdown()
+        print(f"👋 SMTP local encerrado ({dict(srv.caixa.contadores)})")